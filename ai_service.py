@@ -4,16 +4,109 @@ Module quản lý các API calls tới Gemini AI
 """
 
 import google.generativeai as genai
+import hashlib
 import streamlit as st
+import threading
 import time
+from collections import deque
 from typing import Dict, Any, Optional, Tuple
 from config import (
     GEMINI_MODEL_NAME,
+    GEMINI_API_TIMEOUT,
+    GEMINI_HEDGE_ENABLED,
+    GEMINI_REQUESTS_PER_MINUTE,
     EXTRACTION_PROMPT_TEMPLATE,
     ANALYSIS_PROMPT_TEMPLATE,
+    DEPRECIATION_METHOD_LABELS,
+    LOAN_METHOD_LABELS,
+    PERIOD_LABELS,
+    WACC_BASIS_LABELS,
     ERROR_MESSAGES
 )
 from validators import DataValidator
+from sensitivity import LIFESPAN_FIELD, SENSITIVITY_FIELDS
+from similarity import get_document_index
+from resilience import (
+    Deadline,
+    DeadlineExceeded,
+    RequestCancelled,
+    call_with_deadline,
+    get_single_flight
+)
+
+
+RATE_LIMIT_MESSAGE = "⚠️ Đã vượt quá giới hạn API của Google Gemini. Vui lòng:\n1. Đợi vài phút rồi thử lại\n2. Kiểm tra quota tại: https://aistudio.google.com/app/apikey\n3. Nâng cấp gói API nếu cần thiết"
+
+
+class RateLimitDeferred(RequestCancelled):
+    """Lời gọi suy đoán bị bỏ qua vì không còn lượt request dư (không chờ lấy lượt)"""
+
+
+class RateLimiter:
+    """Giới hạn số request gửi tới API trong một cửa sổ thời gian trượt"""
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        """
+        Args:
+            max_calls: Số request tối đa trong một cửa sổ
+            period: Độ dài cửa sổ (giây)
+        """
+        self.max_calls = max_calls
+        self.period = period
+        self._timestamps = deque()
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        """Loại bỏ các request đã ra khỏi cửa sổ"""
+        while self._timestamps and now - self._timestamps[0] >= self.period:
+            self._timestamps.popleft()
+
+    def available(self) -> int:
+        """Số request còn có thể gửi ngay trong cửa sổ hiện tại"""
+        with self._lock:
+            self._purge(time.monotonic())
+            return self.max_calls - len(self._timestamps)
+
+    def try_acquire(self, reserve: int = 0) -> bool:
+        """
+        Lấy một lượt request nếu còn dư ít nhất `reserve` lượt sau khi lấy
+
+        Returns:
+            True nếu lấy được lượt, False nếu không (không chờ)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            if self.max_calls - len(self._timestamps) <= reserve:
+                return False
+            self._timestamps.append(now)
+            return True
+
+    def acquire(self, deadline: Optional[Deadline] = None):
+        """
+        Lấy một lượt request, chờ nếu đã hết lượt trong cửa sổ
+
+        Args:
+            deadline: Nếu có, raise DeadlineExceeded khi không kịp lấy lượt trước thời hạn
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._purge(now)
+                if len(self._timestamps) < self.max_calls:
+                    self._timestamps.append(now)
+                    return
+                wait = self.period - (now - self._timestamps[0])
+            if deadline is not None:
+                deadline.sleep(max(wait, 0.05))
+            else:
+                time.sleep(max(wait, 0.05))
+
+
+@st.cache_resource
+def get_rate_limiter() -> RateLimiter:
+    """Rate limiter dùng chung cho mọi session trong tiến trình"""
+    return RateLimiter(GEMINI_REQUESTS_PER_MINUTE)
 
 
 class GeminiAIService:
@@ -39,14 +132,96 @@ class GeminiAIService:
             st.error(f"Lỗi cấu hình API: {e}")
             raise
 
+    def _generate_content(self, prompt: str, call_type: str, deadline: Deadline,
+                          rate_limit_reserve: Optional[int] = None):
+        """
+        Gửi prompt tới model trong thời hạn cho phép, tuân thủ rate limiter dùng chung
+        Request giống hệt đang chạy ở session khác được gộp thành một lời gọi
+
+        Args:
+            prompt: Nội dung prompt
+            call_type: Loại lời gọi để theo dõi độ trễ
+            deadline: Thời hạn và cờ hủy của lời gọi
+            rate_limit_reserve: None thì chờ lấy lượt; nếu có, chỉ lấy lượt (không chờ) khi còn dư ít nhất
+                chừng ấy lượt, không thì raise RateLimitDeferred (dùng cho prefetch)
+        """
+        rate_limiter = get_rate_limiter()
+
+        def try_acquire() -> bool:
+            return rate_limiter.try_acquire(reserve=rate_limit_reserve or 0)
+
+        def attempt():
+            # Truyền thời hạn còn lại xuống tầng transport để request bị treo tự kết thúc
+            return self.model.generate_content(
+                prompt,
+                request_options={"timeout": max(deadline.remaining(), 1.0)}
+            )
+
+        def execute():
+            # Chỉ lấy lượt khi thực sự gửi request: kết quả cache hoặc chờ chung không tốn lượt
+            if rate_limit_reserve is None:
+                rate_limiter.acquire(deadline)
+            elif not try_acquire():
+                raise RateLimitDeferred()
+            return call_with_deadline(
+                attempt,
+                call_type,
+                deadline,
+                hedge=GEMINI_HEDGE_ENABLED,
+                try_acquire_hedge=try_acquire
+            )
+
+        # Các session gửi cùng prompt trong lúc request đang chạy sẽ chờ chung kết quả
+        key = hashlib.sha256(f"{GEMINI_MODEL_NAME}|{call_type}|{prompt}".encode("utf-8")).hexdigest()
+        return get_single_flight().do(key, execute, deadline)
+
+    @staticmethod
+    def _is_rate_limit_error(error_str: str) -> bool:
+        return "429" in error_str or "quota" in error_str.lower() or "rate limit" in error_str.lower()
+
+    def extract_project_data(self, text: str, deadline: Optional[Deadline] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Trích xuất dữ liệu dự án từ văn bản sử dụng AI trong thời hạn GEMINI_API_TIMEOUT
+        Bản nháp gần giống văn bản đã trích xuất được tái sử dụng nếu số liệu không đổi
+
+        Args:
+            text: Văn bản cần phân tích
+            deadline: Thời hạn và cờ hủy (mặc định tạo mới theo cấu hình)
+
+        Returns:
+            Tuple[bool, Optional[Dict], str]: (success, data, error_message)
+        """
+        if not text or not text.strip():
+            return False, None, "Văn bản trống"
+
+        # Bản nháp gần giống đã trích xuất và phần thay đổi không chạm tới số liệu
+        document_index = get_document_index()
+        reused_data = document_index.find_reusable(text)
+        if reused_data is not None:
+            return True, reused_data, ""
+
+        deadline = deadline or Deadline(GEMINI_API_TIMEOUT)
+        try:
+            success, data, error_msg = self._extract_project_data_cached(text, _deadline=deadline)
+        except DeadlineExceeded:
+            return False, None, ERROR_MESSAGES["api_timeout"].format(deadline.timeout)
+        except RequestCancelled:
+            return False, None, ERROR_MESSAGES["api_cancelled"]
+
+        if success and data:
+            document_index.add(text, data)
+        return success, data, error_msg
+
     @st.cache_data(show_spinner=False, ttl=3600)
-    def extract_project_data(_self, text: str) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+    def _extract_project_data_cached(_self, text: str, _deadline: Deadline) -> Tuple[bool, Optional[Dict[str, Any]], str]:
         """
         Trích xuất dữ liệu dự án từ văn bản sử dụng AI
         Sử dụng cache để tránh gọi API lặp lại với cùng văn bản
+        Hết hạn/hủy được raise ra ngoài để không bị lưu vào cache
 
         Args:
             text: Văn bản cần phân tích
+            _deadline: Thời hạn và cờ hủy (không tham gia vào cache key)
 
         Returns:
             Tuple[bool, Optional[Dict], str]: (success, data, error_message)
@@ -60,7 +235,7 @@ class GeminiAIService:
         for attempt in range(max_retries):
             try:
                 prompt = EXTRACTION_PROMPT_TEMPLATE.format(text=text)
-                response = _self.model.generate_content(prompt)
+                response = _self._generate_content(prompt, "extract", _deadline)
 
                 if not response or not response.text:
                     return False, None, "AI không trả về phản hồi"
@@ -76,16 +251,19 @@ class GeminiAIService:
 
                 return True, sanitized_data, ""
 
+            except (DeadlineExceeded, RequestCancelled):
+                raise
+
             except Exception as e:
                 error_str = str(e)
 
                 # Check if it's a rate limit error (429)
-                if "429" in error_str or "quota" in error_str.lower() or "rate limit" in error_str.lower():
+                if _self._is_rate_limit_error(error_str):
                     if attempt < max_retries - 1:
-                        time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+                        _deadline.sleep(retry_delay * (attempt + 1))  # Exponential backoff
                         continue
                     else:
-                        return False, None, "⚠️ Đã vượt quá giới hạn API của Google Gemini. Vui lòng:\n1. Đợi vài phút rồi thử lại\n2. Kiểm tra quota tại: https://aistudio.google.com/app/apikey\n3. Nâng cấp gói API nếu cần thiết"
+                        return False, None, RATE_LIMIT_MESSAGE
 
                 # Other errors
                 error_msg = ERROR_MESSAGES["api_error"].format(error_str)
@@ -93,8 +271,40 @@ class GeminiAIService:
 
         return False, None, "Không thể kết nối đến API sau nhiều lần thử"
 
+    def analyze_metrics(self, metrics: Dict[str, Any], project_data: Dict[str, Any],
+                        rate_limit_reserve: Optional[int] = None,
+                        deadline: Optional[Deadline] = None) -> Tuple[bool, str, str]:
+        """
+        Phân tích các chỉ số tài chính sử dụng AI trong thời hạn GEMINI_API_TIMEOUT
+
+        Args:
+            metrics: Dictionary chứa các chỉ số tài chính
+            project_data: Dictionary chứa thông tin dự án
+            rate_limit_reserve: Số lượt request phải để dành; nếu có, bỏ qua (raise RateLimitDeferred)
+                thay vì chờ khi không còn dư lượt
+            deadline: Thời hạn và cờ hủy (mặc định tạo mới theo cấu hình)
+
+        Returns:
+            Tuple[bool, str, str]: (success, analysis_text, error_message)
+        """
+        deadline = deadline or Deadline(GEMINI_API_TIMEOUT)
+        try:
+            return self._analyze_metrics_cached(
+                metrics,
+                project_data,
+                _deadline=deadline,
+                _rate_limit_reserve=rate_limit_reserve
+            )
+        except RateLimitDeferred:
+            raise
+        except DeadlineExceeded:
+            return False, "", ERROR_MESSAGES["api_timeout"].format(deadline.timeout)
+        except RequestCancelled:
+            return False, "", ERROR_MESSAGES["api_cancelled"]
+
     @st.cache_data(show_spinner=False, ttl=3600)
-    def analyze_metrics(_self, metrics: Dict[str, Any], project_data: Dict[str, Any]) -> Tuple[bool, str, str]:
+    def _analyze_metrics_cached(_self, metrics: Dict[str, Any], project_data: Dict[str, Any],
+                                _deadline: Deadline, _rate_limit_reserve: Optional[int] = None) -> Tuple[bool, str, str]:
         """
         Phân tích các chỉ số tài chính sử dụng AI
         Sử dụng cache để tránh gọi API lặp lại
@@ -102,6 +312,8 @@ class GeminiAIService:
         Args:
             metrics: Dictionary chứa các chỉ số tài chính
             project_data: Dictionary chứa thông tin dự án
+            _deadline: Thời hạn và cờ hủy (không tham gia vào cache key)
+            _rate_limit_reserve: Số lượt request phải để dành (không tham gia vào cache key)
 
         Returns:
             Tuple[bool, str, str]: (success, analysis_text, error_message)
@@ -116,6 +328,41 @@ class GeminiAIService:
                 irr = f"{metrics['IRR']:.2f}%" if isinstance(metrics['IRR'], float) else metrics['IRR']
                 pp = f"{metrics['PP']:.2f} năm" if isinstance(metrics['PP'], float) else metrics['PP']
                 dpp = f"{metrics['DPP']:.2f} năm" if isinstance(metrics['DPP'], float) else metrics['DPP']
+                irr_note = ""
+                if metrics.get('IRR_AMBIGUOUS'):
+                    roots = ", ".join(f"{r:.2f}%" for r in metrics['IRR_ROOTS'])
+                    irr_note = (
+                        f"\n- Lưu ý: dòng tiền đổi dấu nhiều lần nên có nhiều IRR ({roots}); "
+                        "IRR không xác định duy nhất, cần dựa vào NPV và MIRR"
+                    )
+                mirr = metrics.get('MIRR', "Không thể tính")
+                mirr = f"{mirr:.2f}%" if isinstance(mirr, float) else mirr
+                pi = metrics.get('PI', "Không thể tính")
+                pi = f"{pi:.2f} lần" if isinstance(pi, float) else pi
+                eaa = metrics.get('EAA', "Không thể tính")
+                eaa = f"{eaa:,.0f} VNĐ" if isinstance(eaa, float) else eaa
+                financing = metrics.get('FINANCING')
+                tai_tro = ""
+                if financing:
+                    irr_equity = financing['IRR_VCSH']
+                    irr_equity = f"{irr_equity:.2f}%" if isinstance(irr_equity, float) else irr_equity
+                    tai_tro = (
+                        f"\n- APV (NPV không vay + PV tấm chắn thuế lãi vay {financing['PV_TAX_SHIELD']:,.0f} VNĐ): "
+                        f"{financing['APV']:,.0f} VNĐ"
+                        f"\n- NPV vốn chủ sở hữu (FCFE): {financing['NPV_VCSH']:,.0f} VNĐ, IRR vốn chủ sở hữu: {irr_equity}"
+                    )
+
+                inflation = metrics.get('INFLATION')
+                gia_thuc = ""
+                if inflation:
+                    real = {
+                        key: f"{value:.2f}%" if isinstance(value, float) else value
+                        for key, value in inflation.items()
+                    }
+                    gia_thuc = (
+                        f"\n- Theo giá thực (lạm phát bình quân {real['LAM_PHAT_BINH_QUAN']}/năm): "
+                        f"IRR thực {real['IRR_THUC']}, WACC thực {real['WACC_THUC']}"
+                    )
 
                 # Format các giá trị cho prompt - Project Data
                 von_dau_tu = f"{project_data.get('von_dau_tu', 0):,.0f}"
@@ -132,29 +379,45 @@ class GeminiAIService:
                     chi_phi=chi_phi,
                     wacc=wacc,
                     thue_suat=thue_suat,
+                    gia_dinh_theo_nam=describe_project_assumptions(project_data),
+                    do_nhay=describe_sensitivities(metrics, project_data),
                     npv=npv,
                     irr=irr,
+                    irr_note=irr_note,
+                    mirr=mirr,
+                    pi=pi,
+                    eaa=eaa,
+                    tai_tro=tai_tro,
+                    gia_thuc=gia_thuc,
                     pp=pp,
                     dpp=dpp
                 )
 
-                response = _self.model.generate_content(prompt)
+                response = _self._generate_content(
+                    prompt,
+                    "analyze",
+                    _deadline,
+                    rate_limit_reserve=_rate_limit_reserve
+                )
 
                 if not response or not response.text:
                     return False, "", "AI không trả về phản hồi"
 
                 return True, response.text, ""
 
+            except (DeadlineExceeded, RequestCancelled):
+                raise
+
             except Exception as e:
                 error_str = str(e)
 
                 # Check if it's a rate limit error (429)
-                if "429" in error_str or "quota" in error_str.lower() or "rate limit" in error_str.lower():
+                if _self._is_rate_limit_error(error_str):
                     if attempt < max_retries - 1:
-                        time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+                        _deadline.sleep(retry_delay * (attempt + 1))  # Exponential backoff
                         continue
                     else:
-                        return False, "", "⚠️ Đã vượt quá giới hạn API của Google Gemini. Vui lòng:\n1. Đợi vài phút rồi thử lại\n2. Kiểm tra quota tại: https://aistudio.google.com/app/apikey\n3. Nâng cấp gói API nếu cần thiết"
+                        return False, "", RATE_LIMIT_MESSAGE
 
                 # Other errors
                 error_msg = ERROR_MESSAGES["api_error"].format(error_str)
@@ -163,6 +426,108 @@ class GeminiAIService:
         return False, "", "Không thể kết nối đến API sau nhiều lần thử"
 
 
+def describe_project_assumptions(project_data: Dict[str, Any]) -> str:
+    """
+    Mô tả các giả định tùy chọn (theo năm, khấu hao, vốn lưu động, chuyển lỗ, đường cong chiết khấu) để đưa vào prompt phân tích
+
+    Returns:
+        Các dòng gạch đầu dòng hoặc chuỗi rỗng nếu dự án chỉ có các trường cơ bản
+    """
+    lines = []
+    if project_data.get('tang_truong_doanh_thu'):
+        lines.append(f"- Tăng trưởng doanh thu: {float(project_data['tang_truong_doanh_thu']):.2f}%/năm")
+    if project_data.get('tang_truong_chi_phi'):
+        lines.append(f"- Tăng trưởng chi phí: {float(project_data['tang_truong_chi_phi']):.2f}%/năm")
+    if project_data.get('nam_dat_cong_suat'):
+        lines.append(f"- Số năm đạt công suất tối đa: {int(project_data['nam_dat_cong_suat'])}")
+    for key, label in (('doanh_thu_theo_nam', "Doanh thu theo năm"), ('chi_phi_theo_nam', "Chi phí theo năm")):
+        if project_data.get(key):
+            values = ", ".join("-" if v is None else f"{float(v):,.0f}" for v in project_data[key])
+            lines.append(f"- {label} (VNĐ): {values}")
+    for item in project_data.get('dau_tu_bo_sung') or []:
+        lines.append(f"- Đầu tư bổ sung năm {int(item['nam'])}: {float(item['so_tien']):,.0f} VNĐ")
+    if project_data.get('gia_tri_thanh_ly'):
+        lines.append(f"- Giá trị thanh lý cuối dự án: {float(project_data['gia_tri_thanh_ly']):,.0f} VNĐ")
+    method = project_data.get('phuong_phap_khau_hao')
+    if method:
+        life = project_data.get('thoi_gian_khau_hao') or project_data.get('dong_doi_du_an')
+        lines.append(f"- Khấu hao: {DEPRECIATION_METHOD_LABELS.get(method, method)}, {int(life)} năm")
+    if project_data.get('ty_le_von_luu_dong'):
+        lines.append(f"- Vốn lưu động: {float(project_data['ty_le_von_luu_dong']):.2f}% doanh thu")
+    if project_data.get('so_nam_chuyen_lo'):
+        lines.append(f"- Được chuyển lỗ tối đa {int(project_data['so_nam_chuyen_lo'])} năm")
+    if project_data.get('duong_cong_lai_suat'):
+        rates = ", ".join(f"{float(r):.2f}%" for r in project_data['duong_cong_lai_suat'])
+        premium = float(project_data.get('phan_bu_rui_ro') or 0)
+        lines.append(f"- Chiết khấu theo đường cong lãi suất ({rates}) + phần bù rủi ro {premium:.2f}%")
+    elif project_data.get('wacc_theo_giai_doan'):
+        steps = ", ".join(
+            f"từ năm {int(s['tu_nam'])}: {float(s['wacc']):.2f}%"
+            for s in sorted(project_data['wacc_theo_giai_doan'], key=lambda s: int(s['tu_nam']))
+        )
+        lines.append(f"- WACC theo giai đoạn: {steps}")
+    if project_data.get('khoan_vay'):
+        method = project_data.get('phuong_thuc_tra_no') or "nien_kim"
+        lines.append(
+            f"- Vay {float(project_data['khoan_vay']):,.0f} VNĐ, lãi suất {float(project_data.get('lai_suat_vay') or 0):.2f}%/năm, "
+            f"thời hạn {int(project_data.get('thoi_han_vay') or project_data['dong_doi_du_an'])} năm "
+            f"(ân hạn {int(project_data.get('an_han_vay') or 0)} năm), trả nợ {LOAN_METHOD_LABELS.get(method, method).lower()}"
+        )
+    escalation = False
+    for key, label in (('lam_phat', "Lạm phát"), ('truot_gia_doanh_thu', "Trượt giá bán"),
+                       ('truot_gia_chi_phi', "Trượt giá chi phí")):
+        value = project_data.get(key)
+        if value is not None and value != []:
+            rates = value if isinstance(value, list) else [value]
+            lines.append(f"- {label}: " + ", ".join(f"{float(r):.2f}%" for r in rates) + "/năm")
+            escalation = True
+    if escalation:
+        basis = project_data.get('loai_wacc') or "danh_nghia"
+        lines.append(
+            "- Doanh thu, chi phí, đầu tư bổ sung và thanh lý nhập theo giá năm 0; "
+            f"WACC nhập vào là WACC {WACC_BASIS_LABELS.get(basis, basis).lower()}"
+        )
+    period = project_data.get('ky_tinh') or "nam"
+    if period != "nam":
+        lines.append(f"- Dòng tiền được chia theo {PERIOD_LABELS.get(period, period).lower()} để tính thêm chỉ số theo kỳ")
+    if project_data.get('he_so_mua_vu'):
+        weights = ", ".join(f"{float(w):g}" for w in project_data['he_so_mua_vu'])
+        lines.append(f"- Doanh thu theo mùa vụ, hệ số tháng 1-12: {weights}")
+    return "\n".join(lines)
+
+
+def describe_sensitivities(metrics: Dict[str, Any], project_data: Dict[str, Any]) -> str:
+    """
+    Mô tả độ nhạy NPV/IRR và duration để đưa vào prompt phân tích
+
+    Returns:
+        Các dòng gạch đầu dòng hoặc "- Không có dữ liệu" nếu metrics chưa có độ nhạy
+    """
+    sensitivity = metrics.get('SENSITIVITY')
+    if not sensitivity:
+        return "- Không có dữ liệu"
+
+    lines = []
+    for field, label in SENSITIVITY_FIELDS.items():
+        d_npv = sensitivity['NPV'].get(field)
+        if d_npv is None:
+            continue
+        step = float(project_data.get(field, 0)) / 100.0
+        line = f"- {label}: NPV thay đổi {d_npv * step:+,.0f} VNĐ"
+        d_irr = sensitivity['IRR'].get(field)
+        if d_irr is not None and field != 'wacc':
+            line += f", IRR thay đổi {d_irr * step:+.2f} điểm %"
+        lines.append(line)
+    if sensitivity['NPV'].get(LIFESPAN_FIELD) is not None:
+        lines.append(f"- Kéo dài dự án thêm 1 năm: NPV thay đổi khoảng {sensitivity['NPV'][LIFESPAN_FIELD]:+,.0f} VNĐ")
+    if sensitivity.get('DURATION') is not None:
+        lines.append(
+            f"- Duration dòng tiền: {sensitivity['DURATION']:.2f} năm (Macaulay), "
+            f"{sensitivity['MODIFIED_DURATION']:.2f} (điều chỉnh), convexity {sensitivity['CONVEXITY']:.2f}"
+        )
+    return "\n".join(lines)
+
+
 def get_ai_service(api_key: str) -> Optional[GeminiAIService]:
     """
     Factory function để tạo AI service với validation
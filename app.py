@@ -4,18 +4,65 @@ Tên ứng dụng: Trình Phân Tích Phương Án Kinh Doanh
 Version: 2.0 - Modern UI with Sidebar
 """
 
+import hashlib
+import time
+import pandas as pd
 import streamlit as st
-from config import APP_TITLE, APP_ICON, UI_TEXTS
+from config import (
+    APP_TITLE,
+    APP_ICON,
+    UI_TEXTS,
+    ERROR_MESSAGES,
+    AI_PREFETCH_ENABLED,
+    JOB_POLL_INTERVAL,
+    OPTIONAL_PROJECT_FIELDS,
+    DEPRECIATION_METHOD_LABELS,
+    LOAN_METHOD_LABELS,
+    WACC_BASIS_LABELS,
+    PERIOD_LABELS,
+    SOBOL_DEFAULT_SAMPLES,
+    SOBOL_DEFAULT_SPREAD,
+    SOBOL_MAX_SAMPLES,
+    REAL_OPTION_RISK_FREE_RATE,
+    REAL_OPTION_VOLATILITY,
+    HORIZON_MAX_EXTRA_YEARS,
+    HORIZON_MAX_YEARS,
+    STOCHASTIC_CORRELATION,
+    STOCHASTIC_DEFAULT_PATHS,
+    STOCHASTIC_JUMP_INTENSITY,
+    STOCHASTIC_JUMP_MEAN,
+    STOCHASTIC_JUMP_STD,
+    STOCHASTIC_MAX_PATHS,
+    STOCHASTIC_REVERSION,
+    STOCHASTIC_VOLATILITY,
+)
 from utils import (
     DocumentReader,
     SessionStateManager,
     DataFormatter,
+    RerunTimer,
     get_api_key_from_secrets_or_input
 )
 from ai_service import get_ai_service
-from financial_calculator import calculate_project_financials
+from background import AnalysisPrefetcher, Job, SessionJobs, make_inputs_key
+from resilience import get_latency_tracker, get_single_flight
+from financial_calculator import calculate_period_table, calculate_project_financials
+from validators import DataValidator
 from visualizations import ProjectVisualizer
+from report import PdfRenderer, ReportGenerator, safe_filename
+from comparison import ComparisonManager, RANKING_CRITERIA
+from portfolio import PortfolioOptimizer, to_portfolio_dataframe
+from goal_seek import GoalSeeker, GOAL_SEEK_FIELDS, GOAL_SEEK_METRICS
+from sensitivity import LIFESPAN_FIELD, SENSITIVITY_FIELDS
+from global_sensitivity import GlobalSensitivityAnalyzer, SOBOL_METRICS, to_sobol_dataframe
+from real_options import RealOptionValuator, REAL_OPTION_TYPES
+from horizon import HorizonAnalyzer
+from periods import PERIODS_PER_YEAR, aggregate_to_years
+from stochastic import STOCHASTIC_PROCESSES, StochasticSimulator, summarize, to_distribution_dataframe
+
 
+# Thời điểm bắt đầu lần chạy toàn trang (đo wall time mỗi rerun)
+_script_start = time.perf_counter()
 
 # === CẤU HÌNH TRANG ===
 st.set_page_config(
@@ -135,6 +182,35 @@ st.markdown("""
 # === KHỞI TẠO SESSION STATE ===
 SessionStateManager.initialize_session_state()
 
+# === TÁC VỤ NỀN ===
+EXTRACT_JOB = "extract"
+
+
+def run_extraction_job(job: Job, ai_service, file_bytes: bytes):
+    """Đọc file Word và gọi AI trích xuất dữ liệu trên luồng nền"""
+    job.update(0.1, "Đang đọc file Word...")
+    try:
+        document_text = DocumentReader.extract_text_from_bytes(file_bytes)
+    except Exception as e:
+        return False, None, ERROR_MESSAGES["file_read_error"].format(str(e))
+    if not document_text:
+        return False, None, "Không thể đọc file"
+
+    job.update(0.3, "AI đang đọc và phân tích file...")
+    return ai_service.extract_project_data(document_text, deadline=job.deadline)
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_job(kind: str):
+    """Hiển thị tiến độ tác vụ nền; chạy lại toàn trang khi tác vụ kết thúc"""
+    job = SessionJobs.get(kind)
+    if job is None:
+        return
+    if job.active:
+        st.progress(job.progress, text=job.message or "Đang chờ xử lý...")
+    else:
+        st.rerun(scope="app")
+
 # === SIDEBAR CONFIGURATION ===
 with st.sidebar:
     st.markdown('<p class="sidebar-header">⚙️ Configuration</p>', unsafe_allow_html=True)
@@ -143,6 +219,13 @@ with st.sidebar:
     st.markdown("**🔑 API Key**")
     api_key = get_api_key_from_secrets_or_input()
 
+    prefetch_enabled = st.toggle(
+        "⚡ Chuẩn bị trước phân tích AI",
+        value=AI_PREFETCH_ENABLED,
+        key="ai_prefetch_enabled",
+        help="Tự động gửi yêu cầu phân tích AI ở chế độ nền ngay khi có chỉ số tài chính"
+    )
+
     st.markdown("---")
 
     # Choose Example Section
@@ -162,6 +245,12 @@ with st.sidebar:
         key="example_selector"
     )
 
+    comparison_mode = st.toggle(
+        "🆚 Chế độ so sánh",
+        key="comparison_mode",
+        help="So sánh nhiều phương án (ví dụ mẫu hoặc dự án đã trích xuất) trên cùng biểu đồ"
+    )
+
     st.markdown("---")
 
     # File Upload Section
@@ -197,6 +286,29 @@ with st.sidebar:
     st.caption("Powered by Gemini AI")
     st.caption("© 2024 Business Analyzer")
 
+    latency_stats = get_latency_tracker().snapshot()
+    coalescing_stats = get_single_flight().stats
+    if latency_stats or coalescing_stats["coalesced"]:
+        with st.expander("📈 Thống kê AI"):
+            for call_type, stats in latency_stats.items():
+                if stats["p95"] is None:
+                    continue
+                st.caption(
+                    f"**{call_type}**: p50 {stats['p50']:.1f}s · p95 {stats['p95']:.1f}s · "
+                    f"p99 {stats['p99']:.1f}s · {stats['requests']} request, "
+                    f"{stats['hedges']} hedge, {stats['timeouts']} timeout"
+                )
+            st.caption(
+                f"**Gộp request**: {coalescing_stats['calls']} lời gọi thực, "
+                f"tiết kiệm {coalescing_stats['coalesced']} lời gọi"
+            )
+
+    rerun_timings = RerunTimer.summary()
+    if rerun_timings:
+        with st.expander("⏱️ Thời gian chạy lại"):
+            for scope, (last_ms, median_ms, count) in rerun_timings.items():
+                st.caption(f"**{scope}**: gần nhất {last_ms:.0f} ms · trung vị {median_ms:.0f} ms ({count} lần)")
+
 # === MAIN CONTENT ===
 
 # Header
@@ -285,6 +397,162 @@ def load_example_data(example_name):
     }
     return examples.get(example_name)
 
+# === CHẾ ĐỘ SO SÁNH ===
+
+@st.fragment
+def render_comparison_view():
+    """So sánh nhiều phương án: thêm/bớt dự án, biểu đồ chồng và bảng xếp hạng"""
+    with RerunTimer.measure("comparison"):
+        st.markdown('<p class="section-header">🆚 So sánh phương án</p>', unsafe_allow_html=True)
+
+        example_names = analysis_options[1:]
+        col1, col2 = st.columns([6, 4])
+        with col1:
+            chosen = st.multiselect("Thêm ví dụ mẫu", example_names, key="comparison_examples")
+            if st.button("➕ Thêm ví dụ đã chọn"):
+                for name in chosen:
+                    ComparisonManager.add(name, load_example_data(name))
+        with col2:
+            if st.session_state.project_data:
+                current_name = st.text_input(
+                    "Tên dự án hiện tại",
+                    value=(st.session_state.uploaded_file_name or "Dự án hiện tại").rsplit(".", 1)[0]
+                )
+                if st.button("➕ Thêm dự án hiện tại"):
+                    ComparisonManager.add(current_name, st.session_state.project_data)
+            else:
+                st.caption("💡 Trích xuất hoặc chọn một dự án ở chế độ thường để thêm vào so sánh.")
+
+        names = ComparisonManager.names()
+        if not names:
+            st.info("📋 Chưa có dự án nào để so sánh.")
+            return
+
+        col1, col2, col3 = st.columns([4, 2, 2])
+        with col1:
+            to_remove = st.selectbox("Dự án", names, label_visibility="collapsed")
+        with col2:
+            if st.button("🗑️ Bỏ dự án"):
+                ComparisonManager.remove(to_remove)
+                st.rerun(scope="fragment")
+        with col3:
+            if st.button("🧹 Xóa tất cả"):
+                ComparisonManager.clear()
+                st.rerun(scope="fragment")
+
+        # Chỉ các dự án mới thêm (hoặc đã sửa) được tính lại
+        results = ComparisonManager.compute()
+
+        discounted = st.toggle("Dùng dòng tiền chiết khấu", value=False, key="comparison_discounted")
+        st.plotly_chart(
+            ProjectVisualizer.create_comparison_chart(results, discounted=discounted),
+            use_container_width=True
+        )
+
+        sort_by = st.radio("Xếp hạng theo", list(RANKING_CRITERIA), horizontal=True, key="comparison_sort")
+        ranking = ComparisonManager.ranking_table(results, sort_by)
+        st.dataframe(
+            ranking.style.format({
+                'NPV': '{:,.0f}',
+                'IRR (%)': '{:.2f}',
+                'PI': '{:.2f}',
+                'EAA': '{:,.0f}',
+                'PP (năm)': '{:.2f}',
+                'DPP (năm)': '{:.2f}'
+            }, na_rep="—"),
+            use_container_width=True,
+            hide_index=True
+        )
+
+        render_portfolio_section(results)
+
+        report_key = make_inputs_key([(r["name"], r["project_data"]) for r in results])
+        if st.button("📑 Tạo báo cáo tất cả (zip)"):
+            with st.spinner("Đang tạo báo cáo..."):
+                archive, failures = ReportGenerator.generate_batch(
+                    [{"name": r["name"], "project_data": r["project_data"]} for r in results]
+                )
+            st.session_state.comparison_report = {"key": report_key, "zip": archive}
+            for name, error in failures.items():
+                st.warning(f"⚠️ {name}: {error}")
+
+        report = st.session_state.get("comparison_report")
+        if report is not None and report["key"] == report_key:
+            st.download_button(
+                "⬇️ Tải báo cáo (zip)",
+                data=report["zip"],
+                file_name="bao_cao_so_sanh.zip",
+                mime="application/zip"
+            )
+
+
+def parse_budgets(text: str) -> list:
+    """Đọc danh sách ngân sách các năm sau, cách nhau bởi dấu phẩy hoặc chấm phẩy (bỏ qua ô trống)"""
+    return [float(part.replace(" ", "")) for part in text.replace(";", ",").split(",") if part.strip()]
+
+
+def render_portfolio_section(results: list):
+    """Chọn danh mục tối đa tổng NPV trong giới hạn ngân sách từ các dự án đang so sánh"""
+    with st.expander("💼 Chọn danh mục theo ngân sách", expanded=False):
+        total_investment = sum(float(r["project_data"]["von_dau_tu"]) for r in results)
+        col1, col2 = st.columns(2)
+        with col1:
+            budget = st.number_input("Ngân sách năm 0 (VNĐ)", 1.0, value=max(total_investment / 2, 1.0),
+                                     step=1e8, format="%.0f")
+        with col2:
+            later_text = st.text_input("Ngân sách đầu tư bổ sung năm 1, 2, ... (VNĐ, tùy chọn)",
+                                       placeholder="500000000, 300000000",
+                                       help="Bỏ trống thì đầu tư bổ sung các năm sau không bị giới hạn")
+        try:
+            budgets = [budget, *parse_budgets(later_text)]
+        except ValueError:
+            st.warning("⚠️ Ngân sách các năm sau phải là số, cách nhau bởi dấu phẩy")
+            return
+
+        groups_df = st.data_editor(
+            pd.DataFrame({"Dự án": [r["name"] for r in results], "Nhóm loại trừ": [""] * len(results)}),
+            disabled=["Dự án"],
+            hide_index=True,
+            use_container_width=True,
+            key="portfolio_groups"
+        )
+        st.caption("Các dự án cùng nhóm loại trừ lẫn nhau: chọn tối đa một dự án mỗi nhóm.")
+        success, result, error_msg = PortfolioOptimizer.select(
+            results, budgets, groups_df["Nhóm loại trừ"].fillna("").tolist()
+        )
+        if not success:
+            st.warning(f"⚠️ {error_msg}")
+            return
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Tổng NPV danh mục", DataFormatter.format_currency(result["value"]))
+        with col2:
+            st.metric("Vốn năm 0 sử dụng", DataFormatter.format_currency(result["spent"][0]),
+                      delta=f"còn {DataFormatter.format_currency(budget - result['spent'][0])}", delta_color="off")
+        with col3:
+            st.metric("Giá bóng ngân sách năm 0", f"{result['shadow_prices'][0]:.4f}",
+                      help="NPV tăng thêm trên mỗi 1 VNĐ ngân sách năm 0 (bài toán nới lỏng)")
+        if len(budgets) > 1:
+            st.caption("Giá bóng các năm sau: " + ", ".join(
+                f"năm {year}: {price:.4f}" for year, price in enumerate(result["shadow_prices"][1:], start=1)))
+        if not result["optimal"]:
+            st.caption(f"⚠️ Đã dừng ở giới hạn số nút; cận trên của tổng NPV: "
+                       f"{DataFormatter.format_currency(result['bound'])}")
+
+        portfolio_df = to_portfolio_dataframe(result)
+        st.dataframe(
+            portfolio_df.style.format({column: '{:,.0f}' for column in portfolio_df.columns
+                                       if column == "NPV" or column.startswith("Vốn năm")}, na_rep="—"),
+            use_container_width=True,
+            hide_index=True
+        )
+
+
+if comparison_mode:
+    render_comparison_view()
+    st.stop()
+
 # === XỬ LÝ DỮ LIỆU ===
 
 # Check if using example data
@@ -336,21 +604,760 @@ if selected_example == "📄 Upload File Word mới" and uploaded_file is not No
     col1, col2, col3 = st.columns([2, 2, 6])
     with col1:
         if st.button("🤖 Trích xuất dữ liệu", type="primary", use_container_width=True):
-            with st.spinner("AI đang đọc và phân tích file..."):
-                document_text = DocumentReader.extract_text_from_docx(uploaded_file)
+            ai_service = get_ai_service(api_key)
+            if ai_service:
+                file_bytes = uploaded_file.getvalue()
+                # Cùng nội dung file đang được xử lý thì không gửi lại tác vụ
+                SessionJobs.submit(
+                    EXTRACT_JOB,
+                    hashlib.sha256(file_bytes).hexdigest(),
+                    lambda job: run_extraction_job(job, ai_service, file_bytes)
+                )
+
+    extract_job = SessionJobs.get(EXTRACT_JOB)
+    if extract_job is not None:
+        if extract_job.active:
+            poll_job(EXTRACT_JOB)
+        else:
+            if extract_job.status == Job.DONE:
+                success, data, error_msg = extract_job.result
+                if success and data:
+                    st.session_state.project_data = data
+                    SessionStateManager.reset_calculation_state()
+                    st.success("✅ Trích xuất thành công!")
+                else:
+                    st.error(f"❌ {error_msg}")
+            elif extract_job.status == Job.FAILED:
+                st.error(f"❌ {extract_job.error}")
+            SessionJobs.clear(EXTRACT_JOB)
+
+# === CÁC PHẦN KẾT QUẢ (FRAGMENT) ===
+# Mỗi phần được chạy lại độc lập khi người dùng tương tác bên trong nó,
+# không thực thi lại CSS, form nhập liệu và các biểu đồ của phần khác
+
+@st.fragment
+def render_metrics_section():
+    """Hiển thị các chỉ số đánh giá NPV, IRR, PP, DPP, MIRR, PI, EAA"""
+    with RerunTimer.measure("metrics"):
+        st.markdown('<p class="section-header">📊 Các chỉ số đánh giá</p>', unsafe_allow_html=True)
+
+        m = st.session_state.metrics
+
+        col1, col2, col3, col4 = st.columns(4)
+
+        with col1:
+            st.metric(
+                label="💎 NPV",
+                value=DataFormatter.format_currency(m['NPV']),
+                delta="Khả thi" if m['NPV'] > 0 else "Không khả thi",
+                delta_color="normal" if m['NPV'] > 0 else "inverse"
+            )
+
+        with col2:
+            irr_value = DataFormatter.format_percentage(m['IRR']) if isinstance(m['IRR'], float) else m['IRR']
+            st.metric(
+                label="📈 IRR" + (" ⚠️" if m.get('IRR_AMBIGUOUS') else ""),
+                value=irr_value,
+                help="Tỷ suất hoàn vốn nội bộ"
+            )
+
+        with col3:
+            pp_value = DataFormatter.format_year(m['PP']) if isinstance(m['PP'], float) else m['PP']
+            st.metric(
+                label="⏱️ PP",
+                value=pp_value,
+                help="Thời gian hoàn vốn"
+            )
+
+        with col4:
+            dpp_value = DataFormatter.format_year(m['DPP']) if isinstance(m['DPP'], float) else m['DPP']
+            st.metric(
+                label="⌛ DPP",
+                value=dpp_value,
+                help="Thời gian hoàn vốn có chiết khấu"
+            )
+
+        if m.get('IRR_AMBIGUOUS'):
+            roots = ", ".join(DataFormatter.format_percentage(r) for r in m['IRR_ROOTS'])
+            st.warning(
+                f"⚠️ Dòng tiền đổi dấu nhiều lần nên có {len(m['IRR_ROOTS'])} giá trị IRR ({roots}). "
+                "IRR hiển thị là nghiệm mà NPV giảm qua 0, nhưng IRR không xác định duy nhất - nên đánh giá theo NPV hoặc MIRR."
+            )
+
+        col1, col2, col3 = st.columns(3)
+        extra_metrics = [
+            (col1, "MIRR", "🔁 MIRR", "IRR điều chỉnh: dòng tiền dương tái đầu tư theo chi phí vốn"),
+            (col2, "PI", "📐 PI", "Chỉ số sinh lời: giá trị hiện tại dòng tiền / giá trị hiện tại vốn đầu tư"),
+            (col3, "EAA", "📅 EAA", "Giá trị đều hàng năm tương đương, dùng so sánh dự án khác dòng đời"),
+        ]
+        for col, key, label, help_text in extra_metrics:
+            with col:
+                st.metric(
+                    label=label,
+                    value=DataFormatter.format_metric_value(m.get(key, "-"), key),
+                    help=help_text
+                )
+
+        financing = m.get('FINANCING')
+        if financing:
+            col1, col2, col3, col4 = st.columns(4)
+            financing_metrics = [
+                (col1, "APV", "🏦 APV",
+                 "NPV khi không vay + giá trị hiện tại tấm chắn thuế lãi vay (chiết khấu theo lãi suất vay)"),
+                (col2, "PV_TAX_SHIELD", "🛡️ PV tấm chắn thuế", "Giá trị hiện tại của phần thuế tiết kiệm nhờ lãi vay được trừ"),
+                (col3, "NPV_VCSH", "👤 NPV vốn chủ sở hữu", "Dòng tiền chủ sở hữu (FCFE) chiết khấu theo chi phí vốn chủ sở hữu"),
+                (col4, "IRR_VCSH", "👤 IRR vốn chủ sở hữu", "IRR của dòng tiền chủ sở hữu sau trả nợ gốc và lãi"),
+            ]
+            for col, key, label, help_text in financing_metrics:
+                with col:
+                    st.metric(label=label, value=DataFormatter.format_metric_value(financing[key], key), help=help_text)
+
+        inflation = m.get('INFLATION')
+        if inflation:
+            col1, col2, col3 = st.columns(3)
+            inflation_metrics = [
+                (col1, "IRR_THUC", "🏷️ IRR thực", "IRR của dòng tiền quy về giá năm 0 (đã loại trừ lạm phát)"),
+                (col2, "WACC_THUC", "🏷️ WACC thực", "Lãi suất chiết khấu năm 1 sau khi loại trừ lạm phát (công thức Fisher)"),
+                (col3, "LAM_PHAT_BINH_QUAN", "📈 Lạm phát bình quân", "Lạm phát bình quân năm trong dòng đời dự án"),
+            ]
+            for col, key, label, help_text in inflation_metrics:
+                with col:
+                    st.metric(label=label, value=DataFormatter.format_metric_value(inflation[key], key), help=help_text)
+
+        periodic = m.get('PERIODIC')
+        if periodic:
+            period = PERIOD_LABELS[st.session_state.project_data['ky_tinh']].lower()
+            col1, col2, col3, col4 = st.columns(4)
+            periodic_metrics = [
+                (col1, "NPV", f"🗓️ NPV theo {period}", f"Dòng tiền chia theo {period}, chiết khấu theo lãi suất kỳ tương đương"),
+                (col2, "IRR", f"🗓️ IRR theo {period}", f"IRR của dòng tiền theo {period}, quy đổi ra %/năm"),
+                (col3, "PP", f"🗓️ PP theo {period}", "Thời gian hoàn vốn nội suy trong kỳ hoàn vốn"),
+                (col4, "DPP", f"🗓️ DPP theo {period}", "Thời gian hoàn vốn có chiết khấu nội suy trong kỳ hoàn vốn"),
+            ]
+            for col, key, label, help_text in periodic_metrics:
+                with col:
+                    st.metric(label=label, value=DataFormatter.format_metric_value(periodic[key], key), help=help_text)
+
+
+@st.fragment
+def render_sensitivity_section():
+    """Độ nhạy giải tích của NPV/IRR theo từng đầu vào, duration và convexity"""
+    with RerunTimer.measure("sensitivity"):
+        sensitivity = st.session_state.metrics.get('SENSITIVITY')
+        if not sensitivity:
+            return
+
+        p_data = st.session_state.project_data
+        with st.expander("📐 Độ nhạy của NPV & IRR (giải tích)", expanded=False):
+            rows = []
+            for field, label in SENSITIVITY_FIELDS.items():
+                step = float(p_data.get(field, 0)) / 100.0
+                d_npv = sensitivity['NPV'][field]
+                d_irr = sensitivity['IRR'][field]
+                rows.append({
+                    "Chỉ tiêu": label,
+                    "dNPV / đơn vị": d_npv,
+                    "ΔNPV khi tăng 1%": d_npv * step if d_npv is not None else None,
+                    "ΔIRR (điểm %) khi tăng 1%": d_irr * step if d_irr is not None else None,
+                })
+            st.dataframe(
+                pd.DataFrame(rows).style.format(
+                    {"dNPV / đơn vị": "{:,.4f}", "ΔNPV khi tăng 1%": "{:+,.0f}", "ΔIRR (điểm %) khi tăng 1%": "{:+.4f}"},
+                    na_rep="-"
+                ),
+                hide_index=True,
+                use_container_width=True
+            )
+            st.caption("WACC và thuế suất tính theo mỗi điểm %; WACC được hiểu là dịch chuyển song song cả đường cong chiết khấu.")
+
+            col1, col2, col3, col4 = st.columns(4)
+            lifespan_value = sensitivity['NPV'].get(LIFESPAN_FIELD)
+            duration_items = [
+                (col1, "➕ Thêm 1 năm hoạt động",
+                 DataFormatter.format_currency(lifespan_value) if lifespan_value is not None else "-",
+                 "NPV tăng thêm (xấp xỉ) khi kéo dài dự án một năm"),
+                (col2, "⏳ Duration (Macaulay)",
+                 DataFormatter.format_year(sensitivity['DURATION']) if sensitivity['DURATION'] is not None else "-",
+                 "Thời điểm bình quân (theo giá trị hiện tại) của dòng tiền sau đầu tư ban đầu"),
+                (col3, "📉 Duration điều chỉnh",
+                 f"{sensitivity['MODIFIED_DURATION']:.2f}" if sensitivity['MODIFIED_DURATION'] is not None else "-",
+                 "% giảm giá trị hiện tại dòng tiền khi lãi suất chiết khấu tăng 1 điểm %"),
+                (col4, "〰️ Convexity",
+                 f"{sensitivity['CONVEXITY']:.2f}" if sensitivity['CONVEXITY'] is not None else "-",
+                 "Độ cong của giá trị hiện tại theo lãi suất chiết khấu"),
+            ]
+            for col, label, value, help_text in duration_items:
+                with col:
+                    st.metric(label=label, value=value, help=help_text)
+
+
+@st.fragment
+def render_global_sensitivity_section():
+    """Độ nhạy toàn cục (chỉ số Sobol) khi mọi đầu vào cùng thay đổi"""
+    with RerunTimer.measure("global_sensitivity"):
+        p_data = st.session_state.project_data
+        with st.expander("🌐 Độ nhạy toàn cục (chỉ số Sobol)", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                spread = st.slider("Biên độ thay đổi mỗi đầu vào (± %)", 5, 50, SOBOL_DEFAULT_SPREAD, step=5)
+            with col2:
+                sample_options = [2 ** k for k in range(10, SOBOL_MAX_SAMPLES.bit_length())]
+                n_samples = st.select_slider(
+                    "Số mẫu cơ sở N",
+                    options=sample_options,
+                    value=SOBOL_DEFAULT_SAMPLES,
+                    help="Tổng số lần tính = N x (số đầu vào + 2)"
+                )
+
+            run_key = make_inputs_key(p_data, spread, n_samples)
+            if st.button("🌐 Phân tích Sobol", key="sobol_run"):
+                with st.spinner("Đang tính chỉ số Sobol..."):
+                    success, result, error_msg = GlobalSensitivityAnalyzer.analyze_project(
+                        p_data, spread=spread, n_samples=n_samples, seed=0
+                    )
+                if success:
+                    st.session_state.sobol_result = {"key": run_key, "result": result}
+                else:
+                    st.warning(f"⚠️ {error_msg}")
+
+            stored = st.session_state.get("sobol_result")
+            if stored is None or stored["key"] != run_key:
+                return
+
+            result = stored["result"]
+            st.caption(
+                f"{result['evaluations']:,} lần tính. S1: phần phương sai do riêng đầu vào; "
+                "ST: kể cả tương tác với các đầu vào khác (khoảng tin cậy bootstrap 95%)."
+            )
+            tabs = st.tabs(list(SOBOL_METRICS))
+            for tab, metric in zip(tabs, SOBOL_METRICS):
+                with tab:
+                    sobol_df = to_sobol_dataframe(result, metric)
+                    st.plotly_chart(ProjectVisualizer.create_sobol_chart(sobol_df, metric), use_container_width=True)
+                    st.dataframe(sobol_df.style.format(precision=4, na_rep="-"), hide_index=True, use_container_width=True)
+                    valid_share = result[metric]["valid_share"]
+                    if valid_share < 1:
+                        st.caption(f"Đã bỏ {(1 - valid_share) * 100:.1f}% mẫu không tính được {metric}.")
+
+
+@st.fragment
+def render_stochastic_section():
+    """Phân phối NPV, IRR, thời gian hoàn vốn khi doanh thu/chi phí từng năm biến động ngẫu nhiên"""
+    with RerunTimer.measure("stochastic"):
+        p_data = st.session_state.project_data
+        with st.expander("🎲 Mô phỏng doanh thu, chi phí ngẫu nhiên theo năm", expanded=False):
+            process_options = ["", *STOCHASTIC_PROCESSES]
+
+            def process_label(process: str) -> str:
+                return STOCHASTIC_PROCESSES.get(process, "Giữ theo dự kiến")
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                revenue_process = st.selectbox("Doanh thu", process_options, index=1, format_func=process_label)
+                revenue_volatility = st.number_input("Độ biến động doanh thu (%/năm)", 0.0, 200.0,
+                                                     STOCHASTIC_VOLATILITY, step=1.0)
+            with col2:
+                cost_process = st.selectbox("Chi phí", process_options, index=0, format_func=process_label)
+                cost_volatility = st.number_input("Độ biến động chi phí (%/năm)", 0.0, 200.0,
+                                                  STOCHASTIC_VOLATILITY, step=1.0)
+            with col3:
+                correlation = st.slider("Tương quan doanh thu - chi phí", -1.0, 1.0, STOCHASTIC_CORRELATION, step=0.1)
+                n_paths = st.select_slider(
+                    "Số đường mô phỏng",
+                    options=[1000, 2000, 5000, 10000, 20000, 50000, 100000, STOCHASTIC_MAX_PATHS],
+                    value=STOCHASTIC_DEFAULT_PATHS
+                )
+
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                reversion = st.number_input("Tốc độ hồi quy (1/năm)", 0.0, 10.0, STOCHASTIC_REVERSION, step=0.1,
+                                            help="Ornstein-Uhlenbeck: lớn thì độ lệch nhanh trở về kịch bản dự kiến")
+            with col2:
+                jump_intensity = st.number_input("Số cú sốc kỳ vọng/năm", 0.0, 5.0, STOCHASTIC_JUMP_INTENSITY, step=0.05)
+            with col3:
+                jump_mean = st.number_input("Mức thay đổi mỗi cú sốc (%)", -90.0, 200.0, STOCHASTIC_JUMP_MEAN, step=5.0)
+            with col4:
+                jump_std = st.number_input("Độ lệch chuẩn cú sốc (%)", 0.0, 100.0, STOCHASTIC_JUMP_STD, step=5.0)
+
+            shared = {"reversion": reversion, "jump_intensity": jump_intensity,
+                      "jump_mean": jump_mean, "jump_std": jump_std}
+            revenue = {"process": revenue_process, "volatility": revenue_volatility, **shared} if revenue_process else None
+            costs = {"process": cost_process, "volatility": cost_volatility, **shared} if cost_process else None
+
+            run_key = make_inputs_key(p_data, revenue, costs, correlation, n_paths)
+            if st.button("🎲 Chạy mô phỏng", key="stochastic_run"):
+                with st.spinner("Đang mô phỏng..."):
+                    success, result, error_msg = StochasticSimulator.simulate_project(
+                        p_data, revenue, costs, n_paths, correlation, seed=0
+                    )
+                if success:
+                    st.session_state.stochastic_result = {"key": run_key, "result": result}
+                else:
+                    st.warning(f"⚠️ {error_msg}")
+
+            stored = st.session_state.get("stochastic_result")
+            if stored is None or stored["key"] != run_key:
+                return
+
+            result = stored["result"]
+            summary = summarize(result)
+            metrics = st.session_state.metrics
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("NPV kỳ vọng", DataFormatter.format_currency(summary["npv_mean"]),
+                          help=f"Độ lệch chuẩn: {DataFormatter.format_currency(summary['npv_std'])}")
+            with col2:
+                st.metric("Xác suất NPV < 0", f"{summary['loss_probability'] * 100:.1f}%")
+            with col3:
+                st.metric("NPV phân vị 5%", DataFormatter.format_currency(summary["npv_p5"]),
+                          help=f"Trung bình 5% đường xấu nhất: {DataFormatter.format_currency(summary['npv_cvar5'])}")
+            with col4:
+                st.metric("Xác suất không hoàn vốn", f"{summary['no_payback_probability'] * 100:.1f}%")
+
+            distribution_df = to_distribution_dataframe(result)
+            st.dataframe(
+                distribution_df.style.format(
+                    {column: '{:.1%}' if column == "Tỷ lệ tính được" else '{:,.2f}'
+                     for column in distribution_df.columns if column != "Chỉ số"},
+                    na_rep="-"
+                ),
+                hide_index=True,
+                use_container_width=True
+            )
+
+            reference_irr = metrics.get('IRR')
+            tabs = st.tabs(["NPV", "IRR", "Doanh thu", "Dòng tiền lũy kế"])
+            with tabs[0]:
+                st.plotly_chart(ProjectVisualizer.create_distribution_chart(
+                    result["npv"], "Phân phối NPV", "NPV (VNĐ)", metrics.get('NPV')
+                ), use_container_width=True)
+            with tabs[1]:
+                st.plotly_chart(ProjectVisualizer.create_distribution_chart(
+                    result["irr"], "Phân phối IRR", "IRR (%)",
+                    reference_irr if isinstance(reference_irr, float) else None
+                ), use_container_width=True)
+            with tabs[2]:
+                st.plotly_chart(ProjectVisualizer.create_paths_chart(
+                    result["years"], result["revenue_paths"], "Doanh thu theo năm"
+                ), use_container_width=True)
+            with tabs[3]:
+                st.plotly_chart(ProjectVisualizer.create_paths_chart(
+                    result["years"], result["cumulative_paths"], "Dòng tiền thuần lũy kế"
+                ), use_container_width=True)
+            st.caption(f"{result['paths']:,} đường; biểu đồ theo năm dùng {len(result['revenue_paths']):,} đường đầu tiên.")
+
+
+@st.fragment
+def render_cash_flow_table_section():
+    """Hiển thị bảng dòng tiền chi tiết"""
+    with RerunTimer.measure("table"):
+        st.markdown('<p class="section-header">💰 Bảng dòng tiền</p>', unsafe_allow_html=True)
+
+        with st.expander("📋 Xem bảng dòng tiền chi tiết", expanded=False):
+            p_data = st.session_state.project_data
+            periods = list(PERIOD_LABELS)
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                period = st.selectbox("Kỳ", periods, index=periods.index(p_data.get('ky_tinh') or periods[0]),
+                                      format_func=PERIOD_LABELS.get)
+            with col2:
+                by_year = st.toggle("Gộp theo năm", value=False, disabled=period == periods[0],
+                                    help="Cộng các kỳ trong năm; cột lũy kế lấy giá trị cuối năm")
+
+            cash_flow_df = st.session_state.cash_flow_df
+            if period != periods[0]:
+                cash_flow_df, error_msg = calculate_period_table(p_data, PERIODS_PER_YEAR[period])
+                if cash_flow_df is None:
+                    st.warning(f"⚠️ {error_msg}")
+                    return
+                if by_year:
+                    cash_flow_df = aggregate_to_years(cash_flow_df)
+
+            st.dataframe(
+                cash_flow_df.style.format(
+                    {column: '{:,.0f}' for column in cash_flow_df.columns if column not in ('Năm', 'Kỳ')}
+                ),
+                use_container_width=True,
+                height=400
+            )
+
+
+@st.fragment
+def render_visualizations_section():
+    """Hiển thị các biểu đồ trực quan"""
+    with RerunTimer.measure("charts"):
+        st.markdown('<p class="section-header">📊 Phân tích trực quan</p>', unsafe_allow_html=True)
+
+        ProjectVisualizer.render_all_visualizations(
+            st.session_state.cash_flow_df,
+            st.session_state.metrics,
+            st.session_state.project_data
+        )
+
+
+@st.fragment
+def render_goal_seek_section():
+    """Điểm hòa vốn (NPV = 0) và tìm giá trị đầu vào để chỉ số đạt mục tiêu"""
+    with RerunTimer.measure("goal_seek"):
+        st.markdown('<p class="section-header">🎯 Điểm hòa vốn & Goal Seek</p>', unsafe_allow_html=True)
+
+        p_data = st.session_state.project_data
+        with st.expander("🎯 Tìm giá trị đầu vào để đạt mục tiêu", expanded=False):
+            # Chỉ tính lại khi dữ liệu dự án thay đổi (không chạy lại ở mỗi lần rerun)
+            run_key = make_inputs_key(p_data)
+            stored = st.session_state.get("breakeven_result")
+            if stored is None or stored["key"] != run_key:
+                stored = {"key": run_key, "result": GoalSeeker.breakeven_points(p_data)}
+                st.session_state.breakeven_result = stored
+            breakeven = stored["result"]
+            rows = []
+            for field, label in GOAL_SEEK_FIELDS.items():
+                current = float(p_data.get(field, 0))
+                value = breakeven[field]
+                rows.append({
+                    "Chỉ tiêu": label,
+                    "Hiện tại": current,
+                    "Hòa vốn (NPV = 0)": value,
+                    "Chênh lệch (%)": (value / current - 1) * 100 if value is not None and current else None,
+                })
+            st.markdown("**Giá trị hòa vốn của từng chỉ tiêu (các chỉ tiêu khác giữ nguyên)**")
+            st.dataframe(
+                pd.DataFrame(rows).style.format(
+                    {"Hiện tại": "{:,.2f}", "Hòa vốn (NPV = 0)": "{:,.2f}", "Chênh lệch (%)": "{:+.2f}"},
+                    na_rep="Không có"
+                ),
+                hide_index=True,
+                use_container_width=True
+            )
+
+            default_targets = {"NPV": 0.0, "IRR": 15.0, "PP": 5.0, "DPP": 5.0}
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                field = st.selectbox("Tìm giá trị của", list(GOAL_SEEK_FIELDS), format_func=GOAL_SEEK_FIELDS.get)
+            with col2:
+                metric = st.selectbox("Để chỉ số", list(GOAL_SEEK_METRICS), format_func=GOAL_SEEK_METRICS.get)
+            with col3:
+                target = st.number_input("Đạt giá trị", value=default_targets[metric], key=f"goal_seek_target_{metric}")
+
+            if st.button("🎯 Tìm", key="goal_seek_run"):
+                success, value, error_msg = GoalSeeker.solve_project(p_data, field, metric, target)
+                if success:
+                    current = float(p_data.get(field, 0))
+                    st.success(
+                        f"✅ {GOAL_SEEK_FIELDS[field]} = {value:,.2f} "
+                        f"(hiện tại {current:,.2f}) thì {metric} đạt {target:g}"
+                    )
+                else:
+                    st.warning(f"⚠️ {error_msg}")
+
+
+@st.fragment
+def render_real_options_section():
+    """Giá trị linh hoạt quản trị: quyền từ bỏ, mở rộng, trì hoãn trên cây nhị phân"""
+    with RerunTimer.measure("real_options"):
+        p_data = st.session_state.project_data
+        with st.expander("🧭 Quyền chọn thực (từ bỏ / mở rộng / trì hoãn)", expanded=False):
+            defaults = RealOptionValuator.default_parameters(p_data)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                volatility = st.number_input("Độ biến động giá trị dự án (%/năm)", 1.0, 200.0,
+                                             REAL_OPTION_VOLATILITY, step=5.0)
+                risk_free = st.number_input("Lãi suất phi rủi ro (%/năm)", 0.0, 30.0,
+                                            REAL_OPTION_RISK_FREE_RATE, step=0.5)
+            with col2:
+                abandon_value = st.number_input("Giá trị thu hồi khi từ bỏ (VNĐ)", 0.0,
+                                                value=defaults["abandon_value"], step=1e6, format="%.0f",
+                                                help="Giảm tuyến tính về giá trị thanh lý ở cuối dòng đời")
+                defer_years = st.number_input("Trì hoãn tối đa (năm)", 1, 10, int(defaults["defer_years"]))
+            with col3:
+                expand_ratio = st.number_input("Mở rộng thêm (%)", 0.0, 500.0, defaults["expand_ratio"], step=5.0)
+                expand_cost = st.number_input("Chi phí mở rộng (VNĐ)", 0.0, value=defaults["expand_cost"],
+                                              step=1e6, format="%.0f")
+
+            parameters = {
+                "abandon_value": abandon_value,
+                "expand_ratio": expand_ratio,
+                "expand_cost": expand_cost,
+                "defer_years": defer_years,
+            }
+            # Cùng một lượt tính cho mức độ biến động đã chọn và cả dải để vẽ biểu đồ
+            volatilities = sorted({volatility, *range(10, 85, 5)})
+            run_key = make_inputs_key(p_data, parameters, risk_free, volatilities)
+            stored = st.session_state.get("real_options_result")
+            if stored is None or stored["key"] != run_key:
+                stored = {"key": run_key, "result": RealOptionValuator.analyze_project(
+                    p_data, volatilities, parameters, risk_free
+                )}
+                st.session_state.real_options_result = stored
+            success, result, error_msg = stored["result"]
+            if not success:
+                st.warning(f"⚠️ {error_msg}")
+                return
+
+            chosen = volatilities.index(volatility)
+            columns = st.columns(len(REAL_OPTION_TYPES))
+            for col, (option, label) in zip(columns, REAL_OPTION_TYPES.items()):
+                with col:
+                    st.metric(
+                        label=f"NPV kèm quyền {label.lower()}",
+                        value=DataFormatter.format_currency(result[f"{option}_enpv"][chosen]),
+                        delta=f"+{DataFormatter.format_currency(result[f'{option}_value'][chosen])}",
+                        help="NPV mở rộng = NPV tĩnh + giá trị quyền chọn"
+                    )
+            st.caption(f"NPV tĩnh: {DataFormatter.format_currency(result['npv'])}")
+            st.plotly_chart(
+                ProjectVisualizer.create_real_options_chart(volatilities, result, REAL_OPTION_TYPES),
+                use_container_width=True
+            )
+
+
+@st.fragment
+def render_horizon_section():
+    """NPV theo năm dừng dự án và năm dừng tối ưu khi tính cả thanh lý, chi phí đóng cửa"""
+    with RerunTimer.measure("horizon"):
+        p_data = st.session_state.project_data
+        with st.expander("⏱️ Năm dừng dự án tối ưu", expanded=False):
+            planned = int(p_data['dong_doi_du_an'])
+            salvage = float(p_data.get('gia_tri_thanh_ly') or 0)
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                extra_years = st.number_input("Xét kéo dài thêm (năm)", 0,
+                                              max(0, min(HORIZON_MAX_EXTRA_YEARS, HORIZON_MAX_YEARS - planned)), 0,
+                                              help="Các năm kéo dài dùng doanh thu, chi phí theo tốc độ tăng trưởng")
+            with col2:
+                closure_cost = st.number_input("Chi phí đóng cửa (VNĐ)", 0.0, value=0.0, step=1e6, format="%.0f")
+            with col3:
+                salvage_start = st.number_input("Giá trị thanh lý nếu dừng ngay (VNĐ)", 0.0, value=salvage,
+                                                step=1e6, format="%.0f",
+                                                help="Giảm tuyến tính về giá trị thanh lý ở cuối dòng đời kế hoạch")
+
+            success, result, error_msg = HorizonAnalyzer.analyze_project(
+                p_data, planned + int(extra_years), closure_cost, salvage_start
+            )
+            if not success:
+                st.warning(f"⚠️ {error_msg}")
+                return
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Năm dừng tối ưu", f"Năm {result['optimal']}",
+                          delta=f"{result['optimal'] - planned:+d} năm so với kế hoạch", delta_color="off")
+            with col2:
+                st.metric("NPV tại năm dừng tối ưu", DataFormatter.format_currency(result['optimal_npv']),
+                          delta=f"+{DataFormatter.format_currency(result['optimal_npv'] - result['planned_npv'])}")
+            st.caption(f"NPV nếu hoạt động đúng {planned} năm: {DataFormatter.format_currency(result['planned_npv'])}")
+            st.plotly_chart(ProjectVisualizer.create_horizon_chart(result), use_container_width=True)
+
+
+@st.fragment
+def render_ai_section(api_key: str):
+    """Nút yêu cầu và kết quả phân tích AI"""
+    with RerunTimer.measure("ai"):
+        st.markdown('<p class="section-header">🤖 Phân tích từ AI</p>', unsafe_allow_html=True)
+
+        col1, col2, col3 = st.columns([2, 2, 6])
+        with col1:
+            if st.button("🧠 Nhận phân tích từ AI", type="primary", use_container_width=True):
+                st.session_state.analysis_requested = True
+                # Bấm lại sau khi lần trước thất bại thì gửi yêu cầu mới
+                previous_job = SessionJobs.get(AnalysisPrefetcher.JOB_KIND)
+                if previous_job is not None and not previous_job.active and (
+                        previous_job.status != Job.DONE or not previous_job.result[0]):
+                    SessionJobs.clear(AnalysisPrefetcher.JOB_KIND)
 
-                if document_text:
+        if st.session_state.analysis_requested:
+            if st.session_state.ai_analysis_result is None:
+                analysis_job = SessionJobs.get(AnalysisPrefetcher.JOB_KIND)
+                if analysis_job is None or analysis_job.status == Job.CANCELLED:
                     ai_service = get_ai_service(api_key)
                     if ai_service:
-                        success, data, error_msg = ai_service.extract_project_data(document_text)
-                        if success and data:
-                            st.session_state.project_data = data
-                            SessionStateManager.reset_calculation_state()
-                            st.success("✅ Trích xuất thành công!")
+                        analysis_job = AnalysisPrefetcher.request(
+                            ai_service,
+                            st.session_state.metrics,
+                            st.session_state.project_data
+                        )
+
+                if analysis_job is not None:
+                    if analysis_job.active:
+                        poll_job(AnalysisPrefetcher.JOB_KIND)
+                    elif analysis_job.status == Job.DONE:
+                        success, analysis_text, error_msg = analysis_job.result
+                        if success:
+                            st.session_state.ai_analysis_result = analysis_text
                         else:
                             st.error(f"❌ {error_msg}")
+                    elif analysis_job.status == Job.FAILED:
+                        st.error(f"❌ {analysis_job.error}")
+
+            if st.session_state.ai_analysis_result:
+                st.markdown("#### 📝 Nhận định từ chuyên gia AI")
+                st.info(st.session_state.ai_analysis_result)
+
+
+@st.fragment
+def render_report_section(project_name: str):
+    """Xuất báo cáo HTML/PDF của dự án hiện tại"""
+    with RerunTimer.measure("report"):
+        st.markdown('<p class="section-header">📑 Xuất báo cáo</p>', unsafe_allow_html=True)
+
+        # Báo cáo đã tạo chỉ còn dùng được nếu nhận định AI không đổi
+        report_files = st.session_state.report_files
+        if report_files is not None and report_files["analysis"] != st.session_state.ai_analysis_result:
+            report_files = st.session_state.report_files = None
+
+        col1, col2, col3 = st.columns([2, 2, 6])
+        with col1:
+            include_pdf = st.checkbox(
+                "Kèm PDF",
+                value=False,
+                disabled=not PdfRenderer.available(),
+                help="Cần Chromium/Chrome cài trên máy chủ" if not PdfRenderer.available() else None
+            )
+            if st.button("📑 Tạo báo cáo", use_container_width=True):
+                project = {
+                    "name": project_name,
+                    "project_data": st.session_state.project_data,
+                    "analysis": st.session_state.ai_analysis_result,
+                }
+                with st.spinner("Đang tạo báo cáo..."):
+                    success, html_text, error_msg = ReportGenerator.generate_html(project)
+                    pdf_bytes = None
+                    if success and include_pdf:
+                        pdf_ok, pdf_bytes, pdf_error = ReportGenerator.generate_pdf(project)
+                        if not pdf_ok:
+                            st.warning(f"⚠️ {pdf_error}")
+                if success:
+                    report_files = st.session_state.report_files = {
+                        "analysis": st.session_state.ai_analysis_result,
+                        "html": html_text.encode("utf-8"),
+                        "pdf": pdf_bytes,
+                    }
                 else:
-                    st.error("❌ Không thể đọc file")
+                    st.error(f"❌ {error_msg}")
+
+        if report_files is not None:
+            filename = safe_filename(project_name)
+            with col2:
+                st.download_button(
+                    "⬇️ Tải HTML",
+                    data=report_files["html"],
+                    file_name=f"{filename}.html",
+                    mime="text/html",
+                    use_container_width=True
+                )
+                if report_files["pdf"] is not None:
+                    st.download_button(
+                        "⬇️ Tải PDF",
+                        data=report_files["pdf"],
+                        file_name=f"{filename}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+            with col3:
+                if not st.session_state.ai_analysis_result:
+                    st.caption("💡 Báo cáo chưa có nhận định AI. Nhận phân tích AI rồi tạo lại để bổ sung.")
+
+
+def build_yearly_overrides_df(p_data) -> pd.DataFrame:
+    """Bảng số liệu theo năm để chỉnh sửa (ô trống = dùng giá trị mặc định)"""
+    lifespan = int(p_data.get('dong_doi_du_an', 0))
+
+    def padded(series):
+        series = list(series or [])[:lifespan]
+        return series + [None] * (lifespan - len(series))
+
+    capex = [None] * lifespan
+    for item in p_data.get('dau_tu_bo_sung') or []:
+        if 1 <= int(item['nam']) <= lifespan:
+            capex[int(item['nam']) - 1] = float(item['so_tien'])
+
+    return pd.DataFrame({
+        "Năm": list(range(1, lifespan + 1)),
+        "Doanh thu": pd.array(padded(p_data.get('doanh_thu_theo_nam')), dtype="Float64"),
+        "Chi phí": pd.array(padded(p_data.get('chi_phi_theo_nam')), dtype="Float64"),
+        "Đầu tư bổ sung": pd.array(capex, dtype="Float64"),
+    })
+
+
+def parse_yearly_overrides(yearly_df: pd.DataFrame, lifespan: int) -> dict:
+    """Chuyển bảng số liệu theo năm đã chỉnh sửa về các trường tùy chọn của project_data"""
+    yearly_df = yearly_df[yearly_df["Năm"] <= lifespan]
+    result = {}
+
+    for column, key in (("Doanh thu", 'doanh_thu_theo_nam'), ("Chi phí", 'chi_phi_theo_nam')):
+        values = [None if pd.isna(v) else float(v) for v in yearly_df[column]]
+        # Bỏ các năm trống ở cuối
+        while values and values[-1] is None:
+            values.pop()
+        if values:
+            result[key] = values
+
+    capex = [
+        {"nam": int(year), "so_tien": float(amount)}
+        for year, amount in zip(yearly_df["Năm"], yearly_df["Đầu tư bổ sung"])
+        if not pd.isna(amount) and amount > 0
+    ]
+    if capex:
+        result['dau_tu_bo_sung'] = capex
+    return result
+
+
+DISCOUNT_MODES = {
+    "flat": "WACC cố định",
+    "duong_cong_lai_suat": "Đường cong lãi suất + phần bù rủi ro",
+    "wacc_theo_giai_doan": "WACC theo giai đoạn",
+}
+
+
+def format_discount_inputs(p_data) -> tuple:
+    """Cách chiết khấu hiện tại và chuỗi nhập tương ứng (ví dụ "4.5, 5, 5.4" hoặc "1: 12, 4: 10")"""
+    if p_data.get('duong_cong_lai_suat'):
+        return "duong_cong_lai_suat", ", ".join(f"{float(r):g}" for r in p_data['duong_cong_lai_suat'])
+    if p_data.get('wacc_theo_giai_doan'):
+        steps = sorted(p_data['wacc_theo_giai_doan'], key=lambda s: int(s['tu_nam']))
+        return "wacc_theo_giai_doan", ", ".join(f"{int(s['tu_nam'])}: {float(s['wacc']):g}" for s in steps)
+    return "flat", ""
+
+
+def parse_discount_inputs(mode: str, text: str, premium: float) -> dict:
+    """
+    Chuyển chuỗi nhập đường cong chiết khấu về các trường tùy chọn của project_data
+
+    Raises:
+        ValueError: Nếu chuỗi nhập không đúng định dạng
+    """
+    items = [item.strip() for item in text.replace(";", ",").split(",") if item.strip()]
+    if mode == "flat" or not items:
+        return {}
+    if mode == "duong_cong_lai_suat":
+        return {'duong_cong_lai_suat': [float(item) for item in items], 'phan_bu_rui_ro': premium}
+
+    steps = []
+    for item in items:
+        year, rate = item.split(":")
+        steps.append({"tu_nam": int(year), "wacc": float(rate)})
+    return {'wacc_theo_giai_doan': steps}
+
+
+def format_rates(value) -> str:
+    """Tốc độ tăng giá (một số hoặc danh sách theo năm) thành chuỗi nhập, ví dụ "4" hoặc "3, 5, 6" """
+    if value is None:
+        return ""
+    return ", ".join(f"{float(r):g}" for r in (value if isinstance(value, list) else [value]))
+
+
+def parse_rates(text: str):
+    """
+    Đọc tốc độ tăng giá: bỏ trống -> None, một số -> số, nhiều số -> danh sách theo năm 1, 2, ...
+
+    Raises:
+        ValueError: Nếu chuỗi nhập không đúng định dạng
+    """
+    items = [float(item) for item in text.replace(";", ",").split(",") if item.strip()]
+    if not items:
+        return None
+    return items[0] if len(items) == 1 else items
+
 
 # === DISPLAY DATA IF AVAILABLE ===
 if st.session_state.project_data:
@@ -449,15 +1456,282 @@ if st.session_state.project_data:
                     step=0.1
                 )
 
+            st.markdown("**📅 Mô hình theo năm (tùy chọn)**")
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                tang_truong_dt = st.number_input(
+                    "Tăng trưởng doanh thu (%/năm)",
+                    value=float(p_data.get('tang_truong_doanh_thu') or 0),
+                    min_value=-99.0,
+                    step=0.5
+                )
+            with col2:
+                tang_truong_cp = st.number_input(
+                    "Tăng trưởng chi phí (%/năm)",
+                    value=float(p_data.get('tang_truong_chi_phi') or 0),
+                    min_value=-99.0,
+                    step=0.5
+                )
+            with col3:
+                nam_cong_suat = st.number_input(
+                    "Số năm đạt công suất",
+                    value=int(p_data.get('nam_dat_cong_suat') or 0),
+                    min_value=0,
+                    max_value=100,
+                    step=1,
+                    help="Doanh thu tăng tuyến tính tới mức tối đa trong số năm này (0 = đạt ngay năm 1)"
+                )
+            with col4:
+                thanh_ly = st.number_input(
+                    "Giá trị thanh lý (VNĐ)",
+                    value=float(p_data.get('gia_tri_thanh_ly') or 0),
+                    min_value=0.0,
+                    step=1000000.0
+                )
+
+            st.markdown("**🧾 Khấu hao, vốn lưu động & chuyển lỗ (tùy chọn)**")
+            col1, col2, col3, col4 = st.columns(4)
+            method_options = [None] + list(DEPRECIATION_METHOD_LABELS)
+            with col1:
+                phuong_phap_kh = st.selectbox(
+                    "Phương pháp khấu hao",
+                    method_options,
+                    index=method_options.index(p_data.get('phuong_phap_khau_hao') or None),
+                    format_func=lambda m: "Không khấu hao" if m is None else DEPRECIATION_METHOD_LABELS[m]
+                )
+            with col2:
+                thoi_gian_kh = st.number_input(
+                    "Thời gian khấu hao (năm)",
+                    value=int(p_data.get('thoi_gian_khau_hao') or 0),
+                    min_value=0,
+                    max_value=100,
+                    step=1,
+                    help="0 = bằng dòng đời dự án"
+                )
+            with col3:
+                ty_le_vld = st.number_input(
+                    "Vốn lưu động (% doanh thu)",
+                    value=float(p_data.get('ty_le_von_luu_dong') or 0),
+                    min_value=0.0,
+                    max_value=100.0,
+                    step=1.0
+                )
+            with col4:
+                chuyen_lo = st.number_input(
+                    "Số năm chuyển lỗ",
+                    value=int(p_data.get('so_nam_chuyen_lo') or 0),
+                    min_value=0,
+                    max_value=100,
+                    step=1,
+                    help="0 = không chuyển lỗ (năm lỗ không nộp thuế, không bù trừ năm sau)"
+                )
+
+            st.markdown("**🏦 Vốn vay (tùy chọn)**")
+            col1, col2, col3, col4, col5, col6 = st.columns(6)
+            loan_methods = list(LOAN_METHOD_LABELS)
+            with col1:
+                khoan_vay = st.number_input(
+                    "Khoản vay (VNĐ)",
+                    value=float(p_data.get('khoan_vay') or 0),
+                    min_value=0.0,
+                    step=1000000.0,
+                    help="Giải ngân ở năm 0; 0 = không vay"
+                )
+            with col2:
+                lai_suat_vay = st.number_input(
+                    "Lãi suất vay (%/năm)",
+                    value=float(p_data.get('lai_suat_vay') or 0),
+                    min_value=0.0,
+                    max_value=100.0,
+                    step=0.1
+                )
+            with col3:
+                thoi_han_vay = st.number_input(
+                    "Thời hạn vay (năm)",
+                    value=int(p_data.get('thoi_han_vay') or 0),
+                    min_value=0,
+                    max_value=100,
+                    step=1,
+                    help="0 = bằng dòng đời dự án; nợ còn lại khi dự án kết thúc được trả hết ở năm cuối"
+                )
+            with col4:
+                an_han_vay = st.number_input(
+                    "Ân hạn gốc (năm)",
+                    value=int(p_data.get('an_han_vay') or 0),
+                    min_value=0,
+                    max_value=100,
+                    step=1
+                )
+            with col5:
+                phuong_thuc_tra_no = st.selectbox(
+                    "Cách trả nợ",
+                    loan_methods,
+                    index=loan_methods.index(p_data.get('phuong_thuc_tra_no') or loan_methods[0]),
+                    format_func=LOAN_METHOD_LABELS.get
+                )
+            with col6:
+                chi_phi_vcsh = st.number_input(
+                    "Chi phí vốn CSH (%)",
+                    value=float(p_data.get('chi_phi_von_chu_so_huu') or 0),
+                    min_value=0.0,
+                    max_value=100.0,
+                    step=0.5,
+                    help="Dùng chiết khấu dòng tiền chủ sở hữu; 0 = dùng lãi suất chiết khấu của dự án"
+                )
+
+            st.markdown("**🏷️ Lạm phát (tùy chọn)**")
+            col1, col2, col3, col4 = st.columns(4)
+            wacc_bases = list(WACC_BASIS_LABELS)
+            with col1:
+                lam_phat_text = st.text_input(
+                    "Lạm phát (%/năm)",
+                    value=format_rates(p_data.get('lam_phat')),
+                    help="Một số hoặc theo năm 1, 2, 3..., ví dụ \"4\" hoặc \"3, 4.5, 5\". "
+                         "Khi có lạm phát, doanh thu, chi phí, đầu tư bổ sung và thanh lý được hiểu là theo giá năm 0"
+                )
+            with col2:
+                truot_gia_dt_text = st.text_input(
+                    "Trượt giá bán (%/năm)",
+                    value=format_rates(p_data.get('truot_gia_doanh_thu')),
+                    help="Bỏ trống = bằng lạm phát"
+                )
+            with col3:
+                truot_gia_cp_text = st.text_input(
+                    "Trượt giá chi phí (%/năm)",
+                    value=format_rates(p_data.get('truot_gia_chi_phi')),
+                    help="Bỏ trống = bằng lạm phát"
+                )
+            with col4:
+                loai_wacc = st.selectbox(
+                    "WACC nhập vào là",
+                    wacc_bases,
+                    index=wacc_bases.index(p_data.get('loai_wacc') or wacc_bases[0]),
+                    format_func=WACC_BASIS_LABELS.get,
+                    help="WACC thực được quy đổi sang danh nghĩa: (1 + WACC thực) x (1 + lạm phát) - 1"
+                )
+
+            st.markdown("**🗓️ Kỳ tính (tùy chọn)**")
+            col1, col2 = st.columns([1, 3])
+            periods = list(PERIOD_LABELS)
+            with col1:
+                ky_tinh = st.selectbox(
+                    "Kỳ tính chỉ số",
+                    periods,
+                    index=periods.index(p_data.get('ky_tinh') or periods[0]),
+                    format_func=PERIOD_LABELS.get,
+                    help="Số liệu vẫn nhập theo năm; tháng/quý chia dòng tiền năm cho các kỳ để tính thêm NPV, IRR, PP, DPP theo kỳ"
+                )
+            with col2:
+                mua_vu_text = st.text_input(
+                    "Hệ số mùa vụ doanh thu (tháng 1-12)",
+                    value=format_rates(p_data.get('he_so_mua_vu')),
+                    help="12 hệ số, 1 = tháng trung bình, ví dụ \"1.6, 1.3, 0.8, 0.8, 0.9, 0.9, 0.9, 0.9, 0.9, 1, 1, 1\". "
+                         "Bỏ trống = doanh thu đều các tháng"
+                )
+
+            st.markdown("**📉 Chiết khấu (tùy chọn)**")
+            current_mode, current_text = format_discount_inputs(p_data)
+            discount_modes = list(DISCOUNT_MODES)
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                discount_mode = st.selectbox(
+                    "Cách chiết khấu",
+                    discount_modes,
+                    index=discount_modes.index(current_mode),
+                    format_func=DISCOUNT_MODES.get
+                )
+            with col2:
+                discount_text = st.text_input(
+                    "Lãi suất theo năm / giai đoạn (%)",
+                    value=current_text,
+                    help="Đường cong: lãi suất spot kỳ hạn 1, 2, 3... năm, ví dụ \"4.5, 5, 5.4\". "
+                         "Theo giai đoạn: \"từ năm: WACC\", ví dụ \"1: 12, 4: 10\". "
+                         "Các năm sau điểm cuối dùng lãi suất cuối cùng."
+                )
+            with col3:
+                phan_bu = st.number_input(
+                    "Phần bù rủi ro (%)",
+                    value=float(p_data.get('phan_bu_rui_ro') or 0),
+                    step=0.5,
+                    help="Cộng thêm vào đường cong lãi suất"
+                )
+
+            st.caption("Để trống ô để dùng giá trị tính theo mức cơ sở và tốc độ tăng trưởng")
+            yearly_df = st.data_editor(
+                build_yearly_overrides_df(p_data),
+                hide_index=True,
+                use_container_width=True,
+                disabled=["Năm"]
+            )
+
             if st.form_submit_button("💾 Lưu thay đổi", type="primary", use_container_width=True):
-                st.session_state.project_data = {
+                new_data = {
+                    key: value for key, value in p_data.items()
+                    if key not in OPTIONAL_PROJECT_FIELDS
+                }
+                new_data.update({
                     'von_dau_tu': von_dau_tu,
                     'dong_doi_du_an': dong_doi,
                     'doanh_thu_nam': doanh_thu,
                     'chi_phi_nam': chi_phi,
                     'wacc': wacc,
                     'thue_suat': thue_suat
+                })
+                new_data.update(parse_yearly_overrides(yearly_df, int(dong_doi)))
+                optional = {
+                    'tang_truong_doanh_thu': tang_truong_dt,
+                    'tang_truong_chi_phi': tang_truong_cp,
+                    'nam_dat_cong_suat': min(int(nam_cong_suat), int(dong_doi)),
+                    'gia_tri_thanh_ly': thanh_ly,
+                    'phuong_phap_khau_hao': phuong_phap_kh,
+                    'he_so_khau_hao': p_data.get('he_so_khau_hao') if phuong_phap_kh == "so_du_giam_dan" else None,
+                    'thoi_gian_khau_hao': int(thoi_gian_kh),
+                    'ty_le_von_luu_dong': ty_le_vld,
+                    'so_nam_chuyen_lo': int(chuyen_lo),
                 }
+                if khoan_vay > 0:
+                    optional.update({
+                        'khoan_vay': khoan_vay,
+                        'lai_suat_vay': lai_suat_vay,
+                        'thoi_han_vay': int(thoi_han_vay),
+                        'an_han_vay': int(an_han_vay),
+                        'phuong_thuc_tra_no': phuong_thuc_tra_no,
+                        'chi_phi_von_chu_so_huu': chi_phi_vcsh,
+                    })
+                new_data.update({key: value for key, value in optional.items() if value})
+
+                try:
+                    inflation = {
+                        'lam_phat': parse_rates(lam_phat_text),
+                        'truot_gia_doanh_thu': parse_rates(truot_gia_dt_text),
+                        'truot_gia_chi_phi': parse_rates(truot_gia_cp_text),
+                    }
+                except ValueError:
+                    st.error("❌ Lạm phát và trượt giá phải là số, cách nhau bởi dấu phẩy")
+                    st.stop()
+                new_data.update({key: value for key, value in inflation.items() if value is not None})
+                if loai_wacc != wacc_bases[0]:
+                    new_data['loai_wacc'] = loai_wacc
+                if ky_tinh != periods[0]:
+                    new_data['ky_tinh'] = ky_tinh
+                try:
+                    he_so_mua_vu = parse_rates(mua_vu_text)
+                except ValueError:
+                    st.error("❌ Hệ số mùa vụ phải là số, cách nhau bởi dấu phẩy")
+                    st.stop()
+                if he_so_mua_vu is not None:
+                    new_data['he_so_mua_vu'] = he_so_mua_vu
+
+                try:
+                    new_data.update(parse_discount_inputs(discount_mode, discount_text, phan_bu))
+                    is_valid, error_msg = DataValidator.validate_project_data(new_data)
+                except ValueError:
+                    is_valid, error_msg = False, "Lãi suất chiết khấu không đúng định dạng"
+                if not is_valid:
+                    st.error(f"❌ {error_msg}")
+                    st.stop()
+
+                st.session_state.project_data = new_data
                 SessionStateManager.reset_calculation_state()
                 st.success("✅ Đã lưu thay đổi!")
                 st.rerun()
@@ -473,102 +1747,53 @@ if st.session_state.project_data:
             else:
                 st.error(f"❌ {error_msg}")
 
-    # === DISPLAY METRICS ===
-    if st.session_state.metrics is not None:
-        st.markdown('<p class="section-header">📊 Các chỉ số đánh giá</p>', unsafe_allow_html=True)
-
-        m = st.session_state.metrics
-
-        col1, col2, col3, col4 = st.columns(4)
-
-        with col1:
-            st.metric(
-                label="💎 NPV",
-                value=DataFormatter.format_currency(m['NPV']),
-                delta="Khả thi" if m['NPV'] > 0 else "Không khả thi",
-                delta_color="normal" if m['NPV'] > 0 else "inverse"
+    # === PREFETCH PHÂN TÍCH AI (OPT-IN) ===
+    if (prefetch_enabled
+            and st.session_state.metrics is not None
+            and st.session_state.ai_analysis_result is None):
+        ai_service = get_ai_service(api_key)
+        if ai_service:
+            AnalysisPrefetcher.prefetch(
+                ai_service,
+                st.session_state.metrics,
+                st.session_state.project_data
             )
 
-        with col2:
-            irr_value = DataFormatter.format_percentage(m['IRR']) if isinstance(m['IRR'], float) else m['IRR']
-            st.metric(
-                label="📈 IRR",
-                value=irr_value,
-                help="Tỷ suất hoàn vốn nội bộ"
-            )
-
-        with col3:
-            pp_value = DataFormatter.format_year(m['PP']) if isinstance(m['PP'], float) else m['PP']
-            st.metric(
-                label="⏱️ PP",
-                value=pp_value,
-                help="Thời gian hoàn vốn"
-            )
+    # === DISPLAY METRICS ===
+    if st.session_state.metrics is not None:
+        render_metrics_section()
 
-        with col4:
-            dpp_value = DataFormatter.format_year(m['DPP']) if isinstance(m['DPP'], float) else m['DPP']
-            st.metric(
-                label="⌛ DPP",
-                value=dpp_value,
-                help="Thời gian hoàn vốn có chiết khấu"
-            )
+    # === SENSITIVITY ===
+    if st.session_state.metrics is not None:
+        render_sensitivity_section()
+        render_global_sensitivity_section()
+        render_stochastic_section()
 
     # === DISPLAY CASH FLOW TABLE ===
     if st.session_state.cash_flow_df is not None:
-        st.markdown('<p class="section-header">💰 Bảng dòng tiền</p>', unsafe_allow_html=True)
-
-        with st.expander("📋 Xem bảng dòng tiền chi tiết", expanded=False):
-            st.dataframe(
-                st.session_state.cash_flow_df.style.format({
-                    'Doanh thu': '{:,.0f}',
-                    'Chi phí': '{:,.0f}',
-                    'Lợi nhuận trước thuế': '{:,.0f}',
-                    'Thuế TNDN': '{:,.0f}',
-                    'Lợi nhuận sau thuế': '{:,.0f}',
-                    'Dòng tiền thuần (NCF)': '{:,.0f}',
-                    'Dòng tiền chiết khấu': '{:,.0f}',
-                    'Dòng tiền chiết khấu lũy kế': '{:,.0f}'
-                }),
-                use_container_width=True,
-                height=400
-            )
+        render_cash_flow_table_section()
 
     # === VISUALIZATIONS ===
     if st.session_state.cash_flow_df is not None and st.session_state.metrics is not None:
-        st.markdown('<p class="section-header">📊 Phân tích trực quan</p>', unsafe_allow_html=True)
+        render_visualizations_section()
 
-        ProjectVisualizer.render_all_visualizations(
-            st.session_state.cash_flow_df,
-            st.session_state.metrics,
-            st.session_state.project_data
-        )
+    # === GOAL SEEK ===
+    if st.session_state.metrics is not None:
+        render_goal_seek_section()
+        render_real_options_section()
+        render_horizon_section()
 
     # === AI ANALYSIS ===
     if st.session_state.metrics is not None:
-        st.markdown('<p class="section-header">🤖 Phân tích từ AI</p>', unsafe_allow_html=True)
+        render_ai_section(api_key)
 
-        col1, col2, col3 = st.columns([2, 2, 6])
-        with col1:
-            if st.button("🧠 Nhận phân tích từ AI", type="primary", use_container_width=True):
-                st.session_state.analysis_requested = True
-
-        if st.session_state.analysis_requested:
-            if st.session_state.ai_analysis_result is None:
-                with st.spinner("AI đang phân tích..."):
-                    ai_service = get_ai_service(api_key)
-                    if ai_service:
-                        success, analysis_text, error_msg = ai_service.analyze_metrics(
-                            st.session_state.metrics,
-                            st.session_state.project_data
-                        )
-                        if success:
-                            st.session_state.ai_analysis_result = analysis_text
-                        else:
-                            st.error(f"❌ {error_msg}")
-
-            if st.session_state.ai_analysis_result:
-                st.markdown("#### 📝 Nhận định từ chuyên gia AI")
-                st.info(st.session_state.ai_analysis_result)
+    # === REPORT EXPORT ===
+    if st.session_state.metrics is not None:
+        if selected_example == "📄 Upload File Word mới":
+            report_name = (st.session_state.uploaded_file_name or "Dự án").rsplit(".", 1)[0]
+        else:
+            report_name = selected_example.split(": ", 1)[-1]
+        render_report_section(report_name)
 
 # === FOOTER ===
 st.markdown("---")
@@ -576,3 +1801,5 @@ st.markdown(
     '<p style="text-align: center; color: #888; font-size: 0.9rem;">💡 Powered by Gemini AI & Streamlit | © 2024</p>',
     unsafe_allow_html=True
 )
+
+RerunTimer.record("app", (time.perf_counter() - _script_start) * 1000)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Module quản lý các tác vụ chạy nền (trích xuất, phân tích AI và prefetch)
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+import streamlit as st
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional
+from config import (
+    BACKGROUND_MAX_WORKERS,
+    AI_PREFETCH_RESERVED_CALLS,
+    GEMINI_API_TIMEOUT,
+    JOB_RETENTION_SECONDS,
+)
+from ai_service import GeminiAIService
+from resilience import Deadline, DeadlineExceeded, RequestCancelled
+
+
+@st.cache_resource
+def get_background_executor() -> ThreadPoolExecutor:
+    """Thread pool dùng chung cho các tác vụ nền của mọi session"""
+    return ThreadPoolExecutor(
+        max_workers=BACKGROUND_MAX_WORKERS,
+        thread_name_prefix="bg-worker"
+    )
+
+
+def make_inputs_key(*parts: Any) -> str:
+    """
+    Tạo key ổn định từ các dữ liệu đầu vào
+
+    Args:
+        *parts: Các dictionary/chuỗi đầu vào (metrics, project_data, ...)
+
+    Returns:
+        Chuỗi hash SHA-256
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Job:
+    """Trạng thái của một tác vụ chạy nền"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, kind: str, key: str, timeout: float):
+        """
+        Args:
+            kind: Loại tác vụ ("extract", "analyze", ...)
+            key: Hash của đầu vào, dùng để nhận biết tác vụ trùng
+            timeout: Thời hạn tối đa của tác vụ (giây)
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = Job.PENDING
+        self.progress = 0.0
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.deadline = Deadline(timeout)
+        self.future: Optional[Future] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (Job.PENDING, Job.RUNNING)
+
+    def update(self, progress: float, message: str):
+        """Cập nhật tiến độ từ luồng nền; dừng sớm nếu tác vụ đã bị hủy"""
+        self.deadline.check()
+        self.progress = progress
+        self.message = message
+
+    def cancel(self):
+        """Hủy tác vụ: chưa chạy thì bỏ khỏi hàng đợi, đang chạy thì dừng ở điểm kiểm tra kế tiếp"""
+        if not self.active:
+            return
+        self.deadline.cancel()
+        if self.future is not None:
+            self.future.cancel()
+        self.status = Job.CANCELLED
+        self.finished_at = time.time()
+
+
+class JobManager:
+    """Registry các tác vụ nền dùng chung giữa các lần rerun và các session"""
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self._executor = executor
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, key: str, fn: Callable[[Job], Any], timeout: float) -> Job:
+        """
+        Đưa tác vụ vào thread pool
+
+        Args:
+            kind: Loại tác vụ
+            key: Hash của đầu vào
+            fn: Hàm nhận Job (để báo tiến độ và đọc deadline) và trả về kết quả
+            timeout: Thời hạn của tác vụ (giây)
+
+        Returns:
+            Job vừa tạo
+        """
+        job = Job(kind, key, timeout)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @staticmethod
+    def _run(job: Job, fn: Callable[[Job], Any]):
+        if job.status == Job.CANCELLED:
+            return
+        job.status = Job.RUNNING
+        try:
+            job.result = fn(job)
+            job.status = Job.CANCELLED if job.deadline.cancelled else Job.DONE
+        except RequestCancelled:
+            job.status = Job.CANCELLED
+        except DeadlineExceeded:
+            job.error = f"Tác vụ vượt quá thời hạn {job.deadline.timeout:.0f} giây"
+            job.status = Job.FAILED
+        except Exception as e:
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.progress = 1.0
+            job.finished_at = time.time()
+
+    def _purge(self):
+        """Xóa các tác vụ đã kết thúc quá thời gian lưu giữ"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Job manager dùng chung cho mọi session"""
+    return JobManager(get_background_executor())
+
+
+class SessionJobs:
+    """Gắn tác vụ nền với session hiện tại (mỗi loại tác vụ một job)"""
+
+    STATE_KEY = "jobs"
+
+    @staticmethod
+    def _ids() -> Dict[str, str]:
+        if SessionJobs.STATE_KEY not in st.session_state:
+            st.session_state[SessionJobs.STATE_KEY] = {}
+        return st.session_state[SessionJobs.STATE_KEY]
+
+    @staticmethod
+    def get(kind: str) -> Optional[Job]:
+        """Job hiện tại của session cho loại tác vụ `kind`"""
+        return get_job_manager().get(SessionJobs._ids().get(kind))
+
+    @staticmethod
+    def submit(kind: str, key: str, fn: Callable[[Job], Any], timeout: float = GEMINI_API_TIMEOUT) -> Job:
+        """
+        Gửi tác vụ nếu session chưa có tác vụ cùng đầu vào đang chạy hoặc đã xong
+
+        Rerun hoặc bấm lại nút không tạo tác vụ mới cho cùng đầu vào.
+        """
+        existing = SessionJobs.get(kind)
+        if existing is not None:
+            if existing.key == key and (existing.active or existing.status == Job.DONE):
+                return existing
+            existing.cancel()
+
+        job = get_job_manager().submit(kind, key, fn, timeout)
+        SessionJobs._ids()[kind] = job.id
+        return job
+
+    @staticmethod
+    def cancel(kind: str):
+        """Hủy và bỏ liên kết tác vụ `kind` của session"""
+        job = SessionJobs.get(kind)
+        if job is not None:
+            job.cancel()
+        SessionJobs._ids().pop(kind, None)
+
+    @staticmethod
+    def clear(kind: str):
+        """Bỏ liên kết tác vụ đã xử lý xong kết quả"""
+        SessionJobs._ids().pop(kind, None)
+
+    @staticmethod
+    def cancel_all():
+        for kind in list(SessionJobs._ids()):
+            SessionJobs.cancel(kind)
+
+
+class AnalysisPrefetcher:
+    """Gửi phân tích AI thành tác vụ nền, có thể chuẩn bị trước ngay khi có chỉ số"""
+
+    JOB_KIND = "analyze"
+
+    @staticmethod
+    def cancel():
+        """Hủy phân tích đang chạy (nếu có) khi dữ liệu đầu vào thay đổi"""
+        SessionJobs.cancel(AnalysisPrefetcher.JOB_KIND)
+
+    @staticmethod
+    def prefetch(ai_service: GeminiAIService, metrics: Dict[str, Any], project_data: Dict[str, Any]) -> bool:
+        """
+        Gửi yêu cầu phân tích mang tính suy đoán nếu chưa có yêu cầu cho cùng đầu vào
+
+        Args:
+            ai_service: AI service đã khởi tạo
+            metrics: Dictionary chứa các chỉ số tài chính
+            project_data: Dictionary chứa thông tin dự án
+
+        Returns:
+            True nếu đã có (hoặc vừa tạo) tác vụ phân tích cho đầu vào này
+        """
+        key = make_inputs_key(metrics, project_data)
+        existing = SessionJobs.get(AnalysisPrefetcher.JOB_KIND)
+        if existing is not None and existing.key == key and existing.status != Job.CANCELLED:
+            return True
+
+        # Prefetch chỉ là suy đoán: không dùng đến các lượt dành cho người dùng. Lượt chỉ được lấy khi
+        # thực sự gửi request; thiếu lượt thì tác vụ kết thúc ở trạng thái hủy để lần sau gửi lại
+        SessionJobs.submit(
+            AnalysisPrefetcher.JOB_KIND,
+            key,
+            lambda job: ai_service.analyze_metrics(
+                metrics,
+                project_data,
+                rate_limit_reserve=AI_PREFETCH_RESERVED_CALLS,
+                deadline=job.deadline
+            )
+        )
+        return True
+
+    @staticmethod
+    def request(ai_service: GeminiAIService, metrics: Dict[str, Any], project_data: Dict[str, Any]) -> Job:
+        """Gửi (hoặc dùng lại tác vụ đã prefetch) phân tích AI theo yêu cầu của người dùng"""
+        return SessionJobs.submit(
+            AnalysisPrefetcher.JOB_KIND,
+            make_inputs_key(metrics, project_data),
+            lambda job: ai_service.analyze_metrics(metrics, project_data, deadline=job.deadline)
+        )
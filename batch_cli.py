@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Tạo báo cáo hàng loạt từ dòng lệnh
+
+Ví dụ:
+    python batch_cli.py du_an.json -o bao_cao.zip --pdf --ai
+
+File JSON là danh sách các dự án:
+    [{"name": "Nhà máy A", "project_data": {"von_dau_tu": ..., "dong_doi_du_an": ..., ...}}, ...]
+
+Chọn danh mục theo ngân sách (khóa "group" tùy chọn đánh dấu các dự án loại trừ lẫn nhau):
+    python batch_cli.py du_an.json --budget 10000000000,2000000000
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+from config import REPORT_MAX_WORKERS
+from portfolio import PortfolioOptimizer, to_portfolio_dataframe
+from report import PdfRenderer, ReportGenerator
+from validators import DataValidator
+
+
+def load_projects(path: str) -> List[Dict[str, Any]]:
+    """
+    Đọc danh sách dự án từ file JSON
+
+    Chấp nhận danh sách {"name", "project_data"} hoặc dictionary tên dự án -> project_data.
+    """
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+
+    if isinstance(raw, dict):
+        raw = [{"name": name, "project_data": data} for name, data in raw.items()]
+
+    projects = []
+    for i, item in enumerate(raw):
+        project_data = item.get("project_data", item)
+        is_valid, error_msg = DataValidator.validate_project_data(project_data)
+        if not is_valid:
+            raise ValueError(f"Dự án #{i + 1}: {error_msg}")
+        projects.append({
+            "name": item.get("name") or f"Dự án {i + 1}",
+            "project_data": project_data,
+            "analysis": item.get("analysis"),
+            "group": item.get("group"),
+        })
+    return projects
+
+
+def select_portfolio(projects: List[Dict[str, Any]], budget_text: str) -> int:
+    """In danh mục tối đa tổng NPV trong giới hạn ngân sách và giá bóng từng năm"""
+    try:
+        budgets = [float(part) for part in budget_text.split(",") if part.strip()]
+    except ValueError:
+        print("❌ Ngân sách phải là các số cách nhau bởi dấu phẩy", file=sys.stderr)
+        return 1
+
+    success, result, error_msg = PortfolioOptimizer.select(
+        projects, budgets, [project["group"] for project in projects]
+    )
+    if not success:
+        print(f"❌ {error_msg}", file=sys.stderr)
+        return 1
+
+    print(to_portfolio_dataframe(result).to_string(index=False, float_format="{:,.0f}".format))
+    print(f"✅ Chọn {int(result['selected'].sum())}/{len(projects)} dự án, tổng NPV {result['value']:,.0f} VNĐ")
+    for year, (spent, price) in enumerate(zip(result["spent"], result["shadow_prices"])):
+        print(f"   Năm {year}: dùng {spent:,.0f}/{budgets[year]:,.0f} VNĐ, giá bóng {price:.4f}")
+    if not result["optimal"]:
+        print(f"⚠️ Dừng ở giới hạn số nút, cận trên tổng NPV {result['bound']:,.0f} VNĐ", file=sys.stderr)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tạo báo cáo phân tích dự án hàng loạt")
+    parser.add_argument("input", help="File JSON chứa danh sách dự án")
+    parser.add_argument("-o", "--output", default="bao_cao.zip", help="File zip đầu ra")
+    parser.add_argument("--pdf", action="store_true", help="Xuất thêm PDF (cần Chromium/Chrome)")
+    parser.add_argument("--ai", action="store_true", help="Thêm nhận định AI (đọc GEMINI_API_KEY)")
+    parser.add_argument("--workers", type=int, default=REPORT_MAX_WORKERS, help="Số báo cáo xử lý song song")
+    parser.add_argument("--budget", help="Ngân sách năm 0, 1, ... cách nhau bởi dấu phẩy: "
+                                         "chỉ chọn danh mục tối đa tổng NPV, không tạo báo cáo")
+    args = parser.parse_args(argv)
+
+    try:
+        projects = load_projects(args.input)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    if args.budget:
+        return select_portfolio(projects, args.budget)
+
+    if args.pdf and not PdfRenderer.available():
+        print("⚠️ Không tìm thấy Chromium/Chrome, chỉ xuất HTML", file=sys.stderr)
+
+    ai_service = None
+    if args.ai:
+        from ai_service import get_ai_service
+        ai_service = get_ai_service(os.environ.get("GEMINI_API_KEY", ""))
+        if ai_service is None:
+            print("❌ GEMINI_API_KEY không hợp lệ", file=sys.stderr)
+            return 1
+
+    archive, failures = ReportGenerator.generate_batch(
+        projects,
+        ai_service=ai_service,
+        include_pdf=args.pdf,
+        max_workers=args.workers
+    )
+    with open(args.output, "wb") as f:
+        f.write(archive)
+
+    print(f"✅ Đã tạo {len(projects) - len(failures)}/{len(projects)} báo cáo: {args.output}")
+    for name, error in failures.items():
+        print(f"⚠️ {name}: {error}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,839 @@
+# -*- coding: utf-8 -*-
+"""
+Module tính dòng tiền và chỉ số cho nhiều dự án cùng lúc (vector hóa bằng numpy)
+
+Các dự án có dòng đời khác nhau được xếp vào ma trận (số dự án x (H + 1)) với H là dòng đời
+dài nhất; các năm sau dòng đời được đệm bằng 0 nên không làm thay đổi NPV, IRR hay thời gian hoàn vốn.
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from discounting import discount_factor_matrix, index_keys, price_index_matrix, project_curve_key, shifted_discount_factors
+
+IRR_LOWER_BOUND = -0.9999  # Cận dưới tìm IRR (-99.99%)
+IRR_UPPER_BOUND = 1e6  # Cận trên tìm IRR (đủ lớn cho mọi dự án thực tế)
+IRR_ITERATIONS = 100
+IRR_TOLERANCE = 1e-12  # Dừng chia đôi sớm khi mọi khoảng đã hẹp hơn ngưỡng (tương đối)
+# Lưới lãi suất để cô lập nghiệm khi dòng tiền đổi dấu nhiều lần (dày ở vùng lãi suất thông dụng)
+IRR_SCAN_GRID = np.unique(np.concatenate([
+    np.linspace(IRR_LOWER_BOUND, 1.0, 400, endpoint=False),
+    np.geomspace(1.0, IRR_UPPER_BOUND, 200),
+]))
+
+# Mã phương pháp khấu hao trong ProjectBatch.depreciation_method
+DEPRECIATION_METHODS = {None: 0, "duong_thang": 1, "so_du_giam_dan": 2}
+LOAN_METHODS = {None: 0, "nien_kim": 0, "goc_deu": 1}
+DEFAULT_DECLINING_BALANCE_FACTOR = 2.0
+
+
+def _series_values(series: Sequence[Any]) -> np.ndarray:
+    """Chuỗi giá trị theo năm (None -> NaN nghĩa là giữ giá trị mặc định)"""
+    return np.array([np.nan if v is None else float(v) for v in series], dtype=float)
+
+
+class ProjectBatch:
+    """Tham số của một lô dự án dưới dạng mảng numpy (các năm sau dòng đời bằng 0)"""
+
+    # Trường cơ bản có thể thay bằng mảng mẫu trong ProjectBatch.variants -> (tham số, hệ số đổi đơn vị)
+    SAMPLE_FIELDS = {
+        "von_dau_tu": ("investment", 1.0),
+        "dong_doi_du_an": ("lifespan", 1.0),
+        "doanh_thu_nam": ("base_revenue", 1.0),
+        "chi_phi_nam": ("base_costs", 1.0),
+        "wacc": ("wacc", 0.01),
+        "thue_suat": ("tax_rate", 0.01),
+    }
+    # Trường có thể nhân với hệ số theo từng năm trong ProjectBatch.variants -> tham số
+    PATH_FIELDS = {
+        "doanh_thu_nam": "revenue_paths",
+        "chi_phi_nam": "cost_paths",
+    }
+
+    def __init__(self, projects: Sequence[Dict[str, Any]]):
+        """
+        Args:
+            projects: Danh sách project_data (cùng định dạng với FinancialCalculator). Ngoài các trường
+                bắt buộc có thể có: doanh_thu_theo_nam, chi_phi_theo_nam (danh sách theo năm 1..n,
+                None = dùng giá trị mặc định), tang_truong_doanh_thu, tang_truong_chi_phi (%/năm),
+                nam_dat_cong_suat (số năm tăng dần tới công suất tối đa),
+                dau_tu_bo_sung ([{"nam", "so_tien"}]), gia_tri_thanh_ly,
+                phuong_phap_khau_hao ("duong_thang" / "so_du_giam_dan"), thoi_gian_khau_hao (năm),
+                he_so_khau_hao (hệ số số dư giảm dần), ty_le_von_luu_dong (% doanh thu năm kế tiếp),
+                so_nam_chuyen_lo (số năm được chuyển lỗ, 0 = không chuyển lỗ),
+                duong_cong_lai_suat + phan_bu_rui_ro hoặc wacc_theo_giai_doan (xem discounting),
+                khoan_vay, lai_suat_vay, thoi_han_vay, an_han_vay, phuong_thuc_tra_no,
+                chi_phi_von_chu_so_huu (xem financing; không ảnh hưởng NPV theo WACC),
+                lam_phat, truot_gia_doanh_thu, truot_gia_chi_phi (doanh thu, chi phí, đầu tư bổ sung và
+                giá trị thanh lý khi đó là giá năm 0) và loai_wacc ("thuc" / "danh_nghia") - xem discounting.
+                Thiếu các trường này thì kết quả giống mô hình gốc.
+        """
+        params = ProjectBatch._parse(projects)
+        self._assemble(params, discount_factor_matrix(params["curve_keys"], params["horizon"]))
+
+    @classmethod
+    def variants(cls, project_data: Dict[str, Any], samples: Dict[str, np.ndarray],
+                 paths: Optional[Dict[str, np.ndarray]] = None) -> "ProjectBatch":
+        """
+        Lô gồm nhiều phương án của một dự án, trong đó các trường cơ bản lấy từ mảng mẫu
+
+        Dự án gốc chỉ được đọc một lần, các tham số còn lại được broadcast nên không phải tạo
+        dictionary cho từng phương án (dùng cho mô phỏng, phân tích độ nhạy toàn cục).
+
+        Args:
+            project_data: Dự án gốc
+            samples: Trường trong ProjectBatch.SAMPLE_FIELDS -> mảng giá trị cùng độ dài (đơn vị như
+                project_data). WACC mẫu được hiểu là dịch chuyển song song đường cong chiết khấu
+                của dự án gốc, như trong SensitivityKernel.
+            paths: Trường trong ProjectBatch.PATH_FIELDS -> ma trận hệ số nhân (số phương án x số năm) áp lên
+                doanh thu/chi phí các năm 1, 2, ... (năm sau cột cuối dùng hệ số của cột cuối), dùng cho
+                mô phỏng đường doanh thu, chi phí ngẫu nhiên
+
+        Returns:
+            ProjectBatch với số dự án bằng độ dài mảng mẫu (hoặc số hàng của ma trận hệ số)
+        """
+        return cls.grouped_variants([project_data], samples, paths)
+
+    @classmethod
+    def grouped_variants(cls, projects: Sequence[Dict[str, Any]], samples: Dict[str, np.ndarray],
+                         paths: Optional[Dict[str, np.ndarray]] = None) -> "ProjectBatch":
+        """
+        Như ProjectBatch.variants cho nhiều dự án gốc cùng lúc
+
+        Mảng mẫu (và ma trận hệ số) gồm len(projects) khối liên tiếp có độ dài bằng nhau, khối i là các
+        phương án của projects[i]. Mỗi dự án gốc chỉ được đọc một lần.
+        """
+        base = ProjectBatch._parse(projects)
+        paths = paths or {}
+        if samples:
+            size = len(next(iter(samples.values())))
+        else:
+            size = len(next(iter(paths.values()))) if paths else len(projects)
+        n = len(projects)
+        rows = np.repeat(np.arange(n), size // n) if n else np.zeros(0, dtype=int)
+
+        params = {}
+        for name, value in base.items():
+            if isinstance(value, np.ndarray):
+                if size == n:
+                    params[name] = value
+                else:
+                    params[name] = np.broadcast_to(value, (size,) + value.shape[1:]) if n == 1 else value[rows]
+        for field, values in samples.items():
+            name, scale = ProjectBatch.SAMPLE_FIELDS[field]
+            values = np.asarray(values, dtype=float) * scale
+            params[name] = np.maximum(np.rint(values).astype(int), 1) if name == "lifespan" else values
+        for field, factors in paths.items():
+            params[ProjectBatch.PATH_FIELDS[field]] = np.asarray(factors, dtype=float)
+
+        params["curve_keys"] = [base["curve_keys"][i] for i in rows]
+        params["index_keys"] = base["index_keys"] if n == 1 else [base["index_keys"][i] for i in rows]
+        params["horizon"] = int(params["lifespan"].max()) if size else 0
+
+        # Mỗi đường cong gốc dịch chuyển theo WACC mẫu của các phương án dùng nó
+        unique: Dict[Any, int] = {}
+        curve = np.array([unique.setdefault(key, len(unique)) for key in base["curve_keys"]], dtype=int)[rows]
+        shift = params["wacc"] - base["wacc"][rows]
+        if len(unique) == 1:
+            factors = shifted_discount_factors(base["curve_keys"][0], params["horizon"], shift)
+        else:
+            factors = np.empty((size, params["horizon"] + 1))
+            for key, k in unique.items():
+                selected = curve == k
+                factors[selected] = shifted_discount_factors(key, params["horizon"], shift[selected])
+
+        batch = cls.__new__(cls)
+        batch._assemble(params, factors)
+        return batch
+
+    @staticmethod
+    def _parse(projects: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Đọc tham số của các dự án thành mảng theo dự án (chưa phụ thuộc dòng đời)
+
+        Số liệu theo năm và đầu tư bổ sung được lưu thành ma trận riêng (NaN / 0 ở năm không nhập)
+        rồi mới cắt theo dòng đời khi ghép lô.
+        """
+        n = len(projects)
+        lifespan = np.array([int(p['dong_doi_du_an']) for p in projects], dtype=int)
+
+        def schedule(key: str) -> np.ndarray:
+            series = [_series_values(p.get(key) or []) for p in projects]
+            width = max([len(s) for s in series] + [0])
+            matrix = np.full((n, width), np.nan)
+            for i, values in enumerate(series):
+                matrix[i, :len(values)] = values
+            return matrix
+
+        extra = [
+            [(int(item['nam']), float(item['so_tien'])) for item in p.get('dau_tu_bo_sung') or []]
+            for p in projects
+        ]
+        extra_capex = np.zeros((n, max([year for items in extra for year, _ in items] + [0]) + 1))
+        for i, items in enumerate(extra):
+            for year, amount in items:
+                if year > 0:
+                    extra_capex[i, year] += amount
+
+        return {
+            "investment": np.array([float(p['von_dau_tu']) for p in projects]),
+            "lifespan": lifespan,
+            "wacc": np.array([float(p['wacc']) for p in projects]) / 100.0,
+            "tax_rate": np.array([float(p['thue_suat']) for p in projects]) / 100.0,
+            "salvage": np.array([float(p.get('gia_tri_thanh_ly') or 0) for p in projects]),
+            "base_revenue": np.array([float(p['doanh_thu_nam']) for p in projects]),
+            "base_costs": np.array([float(p['chi_phi_nam']) for p in projects]),
+            "revenue_growth": np.array([float(p.get('tang_truong_doanh_thu') or 0) for p in projects]) / 100.0,
+            "cost_growth": np.array([float(p.get('tang_truong_chi_phi') or 0) for p in projects]) / 100.0,
+            "ramp_years": np.array([int(p.get('nam_dat_cong_suat') or 0) for p in projects], dtype=int),
+            "revenue_overrides": schedule('doanh_thu_theo_nam'),
+            "cost_overrides": schedule('chi_phi_theo_nam'),
+            "extra_capex": extra_capex,
+            "depreciation_method": np.array(
+                [DEPRECIATION_METHODS[p.get('phuong_phap_khau_hao') or None] for p in projects], dtype=int
+            ),
+            # 0 = khấu hao hết trong dòng đời dự án
+            "depreciation_life": np.array([int(p.get('thoi_gian_khau_hao') or 0) for p in projects], dtype=int),
+            "declining_factor": np.array(
+                [float(p.get('he_so_khau_hao') or DEFAULT_DECLINING_BALANCE_FACTOR) for p in projects]
+            ),
+            "working_capital_rate": np.array([float(p.get('ty_le_von_luu_dong') or 0) for p in projects]) / 100.0,
+            "loss_carryforward_years": np.array([int(p.get('so_nam_chuyen_lo') or 0) for p in projects], dtype=int),
+            "loan_amount": np.array([float(p.get('khoan_vay') or 0) for p in projects]),
+            "loan_rate": np.array([float(p.get('lai_suat_vay') or 0) for p in projects]) / 100.0,
+            "loan_term": np.array([int(p.get('thoi_han_vay') or 0) for p in projects], dtype=int),
+            "loan_grace": np.array([int(p.get('an_han_vay') or 0) for p in projects], dtype=int),
+            "loan_method": np.array([LOAN_METHODS[p.get('phuong_thuc_tra_no') or None] for p in projects], dtype=int),
+            "equity_cost": np.array([
+                float(p['chi_phi_von_chu_so_huu']) if p.get('chi_phi_von_chu_so_huu') else np.nan for p in projects
+            ]) / 100.0,
+            "curve_keys": [project_curve_key(p) for p in projects],
+            "index_keys": [index_keys(p) for p in projects],
+            "horizon": int(lifespan.max()) if n else 0,
+        }
+
+    def _assemble(self, params: Dict[str, Any], discount_factors: np.ndarray):
+        """Dựng các ma trận theo năm của lô từ tham số đã đọc (vector hóa trên cả lô)"""
+        self.size = len(params["lifespan"])
+        self.investment = params["investment"]
+        self.lifespan = params["lifespan"]
+        self.wacc = params["wacc"]
+        self.tax_rate = params["tax_rate"]
+        self.horizon = params["horizon"]
+        self.years = np.arange(self.horizon + 1)
+        width = self.horizon + 1
+
+        # Chỉ số giá chung, giá bán, giá chi phí (các dự án cùng tốc độ dùng chung một vector đã cache)
+        general_index, revenue_index, cost_index = (
+            np.broadcast_to(price_index_matrix([keys[k] for keys in params["index_keys"]], self.horizon), (self.size, width))
+            for k in range(3)
+        )
+
+        revenue_growth = params["revenue_growth"]
+        cost_growth = params["cost_growth"]
+        ramp_years = params["ramp_years"]
+
+        # Năm 1 là năm gốc của tăng trưởng
+        periods = np.maximum(self.years - 1, 0)[None, :]
+        revenue = params["base_revenue"][:, None] * (1.0 + revenue_growth[:, None]) ** periods
+        costs = params["base_costs"][:, None] * (1.0 + cost_growth[:, None]) ** periods
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ramp = np.where(
+                ramp_years[:, None] > 0,
+                np.minimum(self.years[None, :] / ramp_years[:, None], 1.0),
+                1.0
+            )
+        revenue = revenue * ramp
+        # Đạo hàm doanh thu/chi phí từng năm theo mức năm cơ sở (0 ở các năm nhập trực tiếp)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            revenue_scale = (1.0 + revenue_growth[:, None]) ** periods * ramp
+            cost_scale = np.broadcast_to((1.0 + cost_growth[:, None]) ** periods, costs.shape).copy()
+
+        # Số liệu nhập theo năm thay cho giá trị mặc định (năm 1..dòng đời)
+        for schedule, scale, overrides in ((revenue, revenue_scale, params["revenue_overrides"]),
+                                           (costs, cost_scale, params["cost_overrides"])):
+            span = min(overrides.shape[1], self.horizon)
+            if span:
+                entered = ~np.isnan(overrides[:, :span])
+                schedule[:, 1:span + 1] = np.where(entered, overrides[:, :span], schedule[:, 1:span + 1])
+                scale[:, 1:span + 1] = np.where(entered, 0.0, scale[:, 1:span + 1])
+
+        # Số liệu theo giá năm 0 -> danh nghĩa, nhân thêm hệ số theo đường mô phỏng (nếu có)
+        revenue_index = revenue_index * ProjectBatch._path_factors(params.get("revenue_paths"), width)
+        cost_index = cost_index * ProjectBatch._path_factors(params.get("cost_paths"), width)
+        revenue = revenue * revenue_index
+        costs = costs * cost_index
+        revenue_scale = revenue_scale * revenue_index
+        cost_scale = cost_scale * cost_index
+
+        capex = np.zeros((self.size, width))
+        capex[:, 0] = self.investment
+        extra_capex = params["extra_capex"]
+        span = min(extra_capex.shape[1], width)
+        in_life = self.years[None, :span] <= self.lifespan[:, None]
+        capex[:, 1:span] += np.where(in_life[:, 1:], extra_capex[:, 1:span], 0.0)
+        capex = capex * general_index
+        self.salvage = params["salvage"] * general_index[np.arange(self.size), self.lifespan]
+        self.general_index = general_index
+
+        self.depreciation_method = params["depreciation_method"]
+        self.depreciation_life = np.where(params["depreciation_life"] > 0, params["depreciation_life"], self.lifespan)
+        self.declining_factor = params["declining_factor"]
+        self.working_capital_rate = params["working_capital_rate"]
+        self.loss_carryforward_years = params["loss_carryforward_years"]
+        # Khoản vay: thời hạn 0 = bằng dòng đời; chi phí vốn chủ sở hữu NaN = dùng đường chiết khấu của dự án
+        self.loan_amount = params["loan_amount"]
+        self.loan_rate = params["loan_rate"]
+        self.loan_term = np.where(params["loan_term"] > 0, params["loan_term"], self.lifespan)
+        self.loan_grace = params["loan_grace"]
+        self.loan_method = params["loan_method"]
+        self.equity_cost = params["equity_cost"]
+
+        mask = self.operating_mask
+        self.revenue = np.where(mask, revenue, 0.0)
+        self.costs = np.where(mask, costs, 0.0)
+        self.revenue_scale = np.where(mask, revenue_scale, 0.0)
+        self.cost_scale = np.where(mask, cost_scale, 0.0)
+        self.capex = capex
+        self.salvage_flows = np.where(self.years[None, :] == self.lifespan[:, None], self.salvage[:, None], 0.0)
+
+        # Các dự án cùng đường cong dùng chung một vector hệ số chiết khấu (đã cache)
+        self.curve_keys = params["curve_keys"]
+        self.discount_factors = discount_factors
+
+    @staticmethod
+    def _path_factors(factors: Optional[np.ndarray], width: int) -> Any:
+        """Hệ số theo đường cho các năm 0..width - 1 (năm 0 bằng 1, kéo dài cột cuối), 1.0 nếu không có"""
+        if factors is None:
+            return 1.0
+        columns = np.minimum(np.arange(width - 1), factors.shape[1] - 1)
+        return np.concatenate([np.ones((factors.shape[0], 1)), factors[:, columns]], axis=1)
+
+    @property
+    def operating_mask(self) -> np.ndarray:
+        """Ma trận bool: True ở các năm hoạt động (1..dòng đời) của từng dự án"""
+        return (self.years[None, :] >= 1) & (self.years[None, :] <= self.lifespan[:, None])
+
+
+class CashFlowEngine:
+    """Các phép tính dòng tiền và chỉ số trên cả lô dự án"""
+
+    @staticmethod
+    def depreciation_rates(batch: ProjectBatch) -> np.ndarray:
+        """
+        Tỷ lệ khấu hao theo tuổi tài sản (0..H) trên nguyên giá, shape (số dự án, H + 1)
+
+        Đường thẳng: 1/L mỗi năm. Số dư giảm dần: tỷ lệ d = hệ số/L trên giá trị còn lại,
+        năm cuối khấu hao hết phần còn lại. Không khấu hao: toàn 0.
+        """
+        age = batch.years[None, :].astype(float)
+        life = batch.depreciation_life[:, None].astype(float)
+        in_life = (age >= 1) & (age <= life)
+
+        straight_line = np.where(in_life, 1.0 / life, 0.0)
+
+        d = np.minimum(batch.declining_factor[:, None] / life, 1.0)
+        remaining_before = (1.0 - d) ** np.maximum(age - 1, 0)
+        declining = np.where(age < life, d * remaining_before, remaining_before)
+        declining = np.where(in_life, declining, 0.0)
+
+        method = batch.depreciation_method[:, None]
+        return np.where(method == 1, straight_line, np.where(method == 2, declining, 0.0))
+
+    @staticmethod
+    def depreciation(capex: np.ndarray, rates: np.ndarray) -> np.ndarray:
+        """
+        Khấu hao từng năm = tổng các lớp tài sản (theo năm đầu tư) nhân tỷ lệ theo tuổi
+
+        Chỉ lặp qua các năm có đầu tư (thường rất ít), mỗi lớp được broadcast trên cả lô.
+        """
+        width = capex.shape[1]
+        result = np.zeros_like(capex)
+        for vintage in np.nonzero(capex.any(axis=0))[0]:
+            result[:, vintage:] += capex[:, vintage, None] * rates[:, :width - vintage]
+        return result
+
+    @staticmethod
+    def taxable_income(batch: ProjectBatch, profit_before_tax: np.ndarray) -> np.ndarray:
+        """Thu nhập chịu thuế từ lợi nhuận trước thuế, có chuyển lỗ với các dự án được chuyển lỗ"""
+        return np.where(
+            batch.loss_carryforward_years[:, None] > 0,
+            CashFlowEngine.loss_carryforward(profit_before_tax, np.maximum(batch.loss_carryforward_years, 1)),
+            np.maximum(profit_before_tax, 0.0)
+        )
+
+    @staticmethod
+    def loss_carryforward(income: np.ndarray, expiry_years: np.ndarray) -> np.ndarray:
+        """
+        Thu nhập chịu thuế sau khi chuyển lỗ (lỗ cũ dùng trước, hết hạn sau `expiry_years` năm)
+
+        Args:
+            income: Lợi nhuận trước thuế từng năm, shape (số dự án, số năm)
+            expiry_years: Số năm được chuyển lỗ của từng dự án (> 0)
+
+        Returns:
+            Thu nhập chịu thuế từng năm
+        """
+        return np.maximum(income - CashFlowEngine.loss_pool(income, expiry_years), 0.0)
+
+    @staticmethod
+    def loss_pool(income: np.ndarray, expiry_years: np.ndarray) -> np.ndarray:
+        """
+        Lỗ còn được chuyển sẵn có trước mỗi năm (năm 0 bằng 0)
+
+        Lỗ còn được chuyển sau năm t thỏa R_t = min(max(R_{t-1} - x_t, 0), W_t), với W_t là tổng lỗ
+        phát sinh trong `expiry_years` năm gần nhất. Mỗi bước là một hàm kẹp f(R) = clip(R + c, lo, hi)
+        và hợp của hai hàm kẹp vẫn là hàm kẹp, nên R_t được tính bằng phép quét tiền tố song song
+        (log2(số năm) bước vector hóa) thay vì vòng lặp theo năm.
+
+        Args:
+            income: Lợi nhuận trước thuế từng năm, shape (số dự án, số năm)
+            expiry_years: Số năm được chuyển lỗ của từng dự án (> 0)
+
+        Returns:
+            Lỗ sẵn có để trừ vào thu nhập của từng năm
+        """
+        n, width = income.shape
+        losses = np.maximum(-income, 0.0)
+        cumulative_losses = np.cumsum(losses, axis=1)
+
+        # W_t: tổng lỗ của các năm t - k + 1..t (còn hạn cho năm t + 1)
+        start = np.arange(width)[None, :] - expiry_years[:, None]
+        expired = np.where(
+            start >= 0,
+            np.take_along_axis(cumulative_losses, np.clip(start, 0, width - 1), axis=1),
+            0.0
+        )
+        window = cumulative_losses - expired
+
+        shift_c = -income
+        low = np.zeros_like(income)
+        high = window
+        shift = 1
+        while shift < width:
+            c1, lo1, hi1 = shift_c[:, :-shift], low[:, :-shift], high[:, :-shift]
+            c2, lo2, hi2 = shift_c[:, shift:], low[:, shift:], high[:, shift:]
+            combined_c = c1 + c2
+            combined_lo = np.clip(lo1 + c2, lo2, hi2)
+            combined_hi = np.clip(hi1 + c2, lo2, hi2)
+            shift_c = np.concatenate([shift_c[:, :shift], combined_c], axis=1)
+            low = np.concatenate([low[:, :shift], combined_lo], axis=1)
+            high = np.concatenate([high[:, :shift], combined_hi], axis=1)
+            shift *= 2
+
+        # Lỗ còn chuyển sau mỗi năm (bắt đầu từ 0) và lỗ sẵn có trước mỗi năm
+        pool = np.clip(shift_c, low, high)
+        return np.concatenate([np.zeros((n, 1)), pool[:, :-1]], axis=1)
+
+    @staticmethod
+    def working_capital_change(batch: ProjectBatch, revenue: np.ndarray) -> np.ndarray:
+        """
+        Vốn lưu động tăng thêm từng năm
+
+        Vốn lưu động cuối năm t bằng tỷ lệ x doanh thu năm t + 1, nên được ứng trước từ năm 0
+        và tự động thu hồi toàn bộ ở năm cuối dòng đời (doanh thu năm sau bằng 0).
+        """
+        next_revenue = np.concatenate([revenue[:, 1:], np.zeros((revenue.shape[0], 1))], axis=1)
+        level = batch.working_capital_rate[:, None] * next_revenue
+        return np.diff(level, axis=1, prepend=0.0)
+
+    @staticmethod
+    def build(batch: ProjectBatch) -> Dict[str, np.ndarray]:
+        """
+        Xây dựng các dòng của bảng dòng tiền cho cả lô
+
+        Returns:
+            Dictionary tên dòng -> ma trận (số dự án x (H + 1))
+        """
+        revenue = batch.revenue
+        costs = batch.costs
+        mask = batch.operating_mask
+
+        depreciation = CashFlowEngine.depreciation(batch.capex, CashFlowEngine.depreciation_rates(batch))
+        depreciation = np.where(mask, depreciation, 0.0)
+
+        # Có khấu hao thì phần thanh lý vượt giá trị còn lại là thu nhập (hoặc lỗ) chịu thuế
+        book_value = np.cumsum(batch.capex - depreciation, axis=1)
+        end_of_life = batch.years[None, :] == batch.lifespan[:, None]
+        disposal_gain = np.where(
+            end_of_life & (batch.depreciation_method[:, None] > 0),
+            batch.salvage_flows - book_value,
+            0.0
+        )
+
+        profit_before_tax = revenue - costs - depreciation + disposal_gain
+        taxable_income = CashFlowEngine.taxable_income(batch, profit_before_tax)
+        tax = taxable_income * batch.tax_rate[:, None]
+        profit_after_tax = profit_before_tax - tax
+
+        working_capital = CashFlowEngine.working_capital_change(batch, revenue)
+        net_cash_flow = revenue - costs - tax - batch.capex - working_capital + batch.salvage_flows
+
+        discount_factors = batch.discount_factors
+        discounted = net_cash_flow * discount_factors
+        return {
+            "revenue": revenue,
+            "costs": costs,
+            "depreciation": depreciation,
+            "profit_before_tax": profit_before_tax,
+            "taxable_income": taxable_income,
+            "tax": tax,
+            "profit_after_tax": profit_after_tax,
+            "capex": batch.capex,
+            "working_capital": working_capital,
+            "salvage": batch.salvage_flows,
+            "net_cash_flow": net_cash_flow,
+            "discount_factors": discount_factors,
+            "discounted": discounted,
+            "cumulative": np.cumsum(net_cash_flow, axis=1),
+            "cumulative_discounted": np.cumsum(discounted, axis=1),
+        }
+
+    @staticmethod
+    def _scaled_npv(net_cash_flow: np.ndarray, rate: np.ndarray, years: np.ndarray) -> np.ndarray:
+        """
+        NPV nhân với một hằng số dương (cùng dấu với NPV) và không bị tràn số
+
+        Với r < 0 nhân thêm (1 + r)^T để mọi lũy thừa có số mũ không âm và cơ số < 1.
+        Lô lớn (nhiều dự án hơn số năm) dùng sơ đồ Horner theo năm: chỉ gồm nhân và cộng
+        trên vector theo dự án, nhanh hơn nhiều so với tính lũy thừa cho từng phần tử.
+        """
+        n, width = net_cash_flow.shape
+        if n >= width:
+            negative = rate < 0
+            result = np.zeros(n)
+            if not negative.all():
+                x = 1.0 / (1.0 + np.maximum(rate, 0.0))  # r >= 0: tổng c_t x^t
+                for t in range(width - 1, -1, -1):
+                    result *= x
+                    result += net_cash_flow[:, t]
+            if negative.any():
+                y = 1.0 + np.minimum(rate, 0.0)  # r < 0: tổng c_t y^(T - t)
+                acc = np.zeros(n)
+                for t in range(width):
+                    acc *= y
+                    acc += net_cash_flow[:, t]
+                result = np.where(negative, acc, result)
+            return result
+
+        t = years[None, :].astype(float)
+        exponent = np.where(rate[:, None] < 0, years[-1] - t, -t)
+        return np.sum(net_cash_flow * (1.0 + rate[:, None]) ** exponent, axis=1)
+
+    @staticmethod
+    def irr(net_cash_flow: np.ndarray, years: np.ndarray) -> np.ndarray:
+        """
+        IRR của từng dự án bằng chia đôi đồng thời trên cả lô (dừng khi mọi khoảng đủ hẹp)
+
+        Returns:
+            Mảng IRR (tỷ lệ, không phải %), NaN nếu NPV không đổi dấu trong khoảng tìm kiếm
+        """
+        n = net_cash_flow.shape[0]
+        # Lưu theo cột để sơ đồ Horner trong _scaled_npv đọc từng năm liên tục trong bộ nhớ
+        net_cash_flow = np.asfortranarray(net_cash_flow)
+        lo = np.full(n, IRR_LOWER_BOUND)
+        hi = np.full(n, IRR_UPPER_BOUND)
+        f_lo = np.sign(CashFlowEngine._scaled_npv(net_cash_flow, lo, years))
+        f_hi = np.sign(CashFlowEngine._scaled_npv(net_cash_flow, hi, years))
+        valid = f_lo * f_hi <= 0
+
+        for _ in range(IRR_ITERATIONS):
+            mid = (lo + hi) / 2
+            f_mid = np.sign(CashFlowEngine._scaled_npv(net_cash_flow, mid, years))
+            same_side = f_mid == f_lo
+            lo = np.where(same_side, mid, lo)
+            hi = np.where(same_side, hi, mid)
+            if np.all(hi - lo <= IRR_TOLERANCE * np.maximum(np.abs(lo), 1.0)):
+                break
+
+        return np.where(valid, (lo + hi) / 2, np.nan)
+
+    @staticmethod
+    def sign_changes(net_cash_flow: np.ndarray) -> np.ndarray:
+        """
+        Số lần đổi dấu của dòng tiền (bỏ qua các năm bằng 0)
+
+        Theo quy tắc dấu Descartes, số IRR (r > -100%) không vượt quá số lần đổi dấu,
+        nên dòng tiền đổi dấu một lần (dự án thông thường) có tối đa một IRR.
+        """
+        signs = np.sign(net_cash_flow)
+        positions = np.arange(signs.shape[1])[None, :]
+        # Dấu khác 0 gần nhất tính đến mỗi năm
+        last_nonzero = np.maximum.accumulate(np.where(signs != 0, positions, 0), axis=1)
+        filled = np.take_along_axis(signs, last_nonzero, axis=1)
+        return np.sum(filled[:, 1:] * filled[:, :-1] < 0, axis=1)
+
+    @staticmethod
+    def _scaled_npv_grid(net_cash_flow: np.ndarray, rates: np.ndarray) -> np.ndarray:
+        """
+        NPV (nhân hằng số dương như _scaled_npv) của từng dự án tại mọi lãi suất trong lưới
+
+        Dùng sơ đồ Horner theo năm nên bộ nhớ chỉ là (số dự án x số điểm lưới).
+
+        Returns:
+            Ma trận shape (số dự án, số điểm lưới)
+        """
+        n, width = net_cash_flow.shape
+        negative = rates < 0
+        x = 1.0 / (1.0 + rates[~negative])  # r >= 0: tổng c_t x^t
+        y = 1.0 + rates[negative]  # r < 0: tổng c_t y^(T - t)
+
+        acc_pos = np.zeros((n, x.size))
+        for t in range(width - 1, -1, -1):
+            acc_pos = acc_pos * x + net_cash_flow[:, t, None]
+        acc_neg = np.zeros((n, y.size))
+        for t in range(width):
+            acc_neg = acc_neg * y + net_cash_flow[:, t, None]
+
+        result = np.empty((n, rates.size))
+        result[:, ~negative] = acc_pos
+        result[:, negative] = acc_neg
+        return result
+
+    @staticmethod
+    def irr_roots(net_cash_flow: np.ndarray, years: np.ndarray, grid: np.ndarray = IRR_SCAN_GRID) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tất cả IRR của từng dự án: quét dấu NPV trên lưới lãi suất rồi chia đôi trong từng khoảng đổi dấu
+
+        Hai nghiệm nằm trong cùng một ô lưới (rất sát nhau) có thể bị bỏ sót.
+
+        Returns:
+            (roots, falling): ma trận IRR (tỷ lệ) tăng dần theo hàng, đệm NaN, số cột bằng số nghiệm
+            nhiều nhất; và ma trận bool cho biết NPV chuyển từ dương sang âm khi lãi suất tăng qua nghiệm
+        """
+        n = net_cash_flow.shape[0]
+        signs = np.sign(CashFlowEngine._scaled_npv_grid(net_cash_flow, grid))
+
+        # Khoảng đổi dấu (nghiệm nằm giữa hai điểm lưới) và điểm lưới là nghiệm đúng
+        bracket_rows, bracket_cols = np.nonzero(signs[:, :-1] * signs[:, 1:] < 0)
+        exact_rows, exact_cols = np.nonzero(signs == 0)
+
+        lo = grid[bracket_cols]
+        hi = grid[bracket_cols + 1]
+        flows = np.asfortranarray(net_cash_flow[bracket_rows])
+        if bracket_rows.size:
+            f_lo = np.sign(CashFlowEngine._scaled_npv(flows, lo, years))
+            for _ in range(IRR_ITERATIONS):
+                mid = (lo + hi) / 2
+                same_side = np.sign(CashFlowEngine._scaled_npv(flows, mid, years)) == f_lo
+                lo = np.where(same_side, mid, lo)
+                hi = np.where(same_side, hi, mid)
+
+        after_exact = signs[exact_rows, np.minimum(exact_cols + 1, grid.size - 1)]
+        rows = np.concatenate([bracket_rows, exact_rows])
+        roots = np.concatenate([(lo + hi) / 2, grid[exact_cols]])
+        falling = np.concatenate([signs[bracket_rows, bracket_cols + 1] < 0, after_exact < 0])
+        order = np.lexsort((roots, rows))
+        rows, roots, falling = rows[order], roots[order], falling[order]
+
+        counts = np.bincount(rows, minlength=n)
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        columns = np.arange(rows.size) - offsets[rows]
+        width = int(counts.max()) if n else 0
+        root_matrix = np.full((n, width), np.nan)
+        falling_matrix = np.zeros((n, width), dtype=bool)
+        root_matrix[rows, columns] = roots
+        falling_matrix[rows, columns] = falling
+        return root_matrix, falling_matrix
+
+    @staticmethod
+    def irr_analysis(net_cash_flow: np.ndarray, years: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        IRR kèm phát hiện nhiều nghiệm cho dòng tiền không thông thường
+
+        Dự án đổi dấu tối đa một lần dùng chia đôi trên cả khoảng tìm kiếm (tối đa một nghiệm);
+        chỉ các dự án đổi dấu nhiều lần mới quét lưới để tìm tất cả nghiệm. Khi có nhiều nghiệm,
+        IRR đại diện là nghiệm lớn nhất mà NPV giảm qua 0 (dự án có lãi khi WACC thấp hơn nó),
+        nếu không có thì là nghiệm nhỏ nhất.
+
+        Returns:
+            Dictionary "irr" (IRR đại diện, NaN nếu không có), "irr_roots" (ma trận nghiệm tăng dần
+            đệm NaN), "irr_count" (số nghiệm), "sign_changes" (số lần đổi dấu)
+        """
+        n = net_cash_flow.shape[0]
+        changes = CashFlowEngine.sign_changes(net_cash_flow)
+        non_conventional = np.nonzero(changes > 1)[0]
+
+        irr = CashFlowEngine.irr(net_cash_flow, years)
+        scanned, falling = CashFlowEngine.irr_roots(net_cash_flow[non_conventional], years)
+
+        if scanned.shape[1]:
+            falling_roots = np.where(falling, scanned, -np.inf).max(axis=1)
+            irr[non_conventional] = np.where(np.isfinite(falling_roots), falling_roots, scanned[:, 0])
+        else:
+            irr[non_conventional] = np.nan
+
+        roots = np.full((n, max(scanned.shape[1], 1)), np.nan)
+        roots[:, 0] = irr
+        roots[non_conventional] = np.nan
+        roots[non_conventional, :scanned.shape[1]] = scanned
+
+        return {
+            "irr": irr,
+            "irr_roots": roots,
+            "irr_count": np.sum(np.isfinite(roots), axis=1),
+            "sign_changes": changes,
+        }
+
+    @staticmethod
+    def payback(flows: np.ndarray, cumulative: np.ndarray) -> np.ndarray:
+        """
+        Thời gian hoàn vốn (cùng quy tắc với FinancialCalculator) cho cả lô
+
+        Args:
+            flows: Dòng tiền từng năm (thuần hoặc đã chiết khấu)
+            cumulative: Lũy kế tương ứng
+
+        Returns:
+            Mảng số năm, NaN nếu không hoàn vốn
+        """
+        n, width = flows.shape
+        negative = cumulative < 0
+        has_negative = negative.any(axis=1)
+        # Năm cuối cùng lũy kế còn âm
+        last_negative = width - 1 - np.argmax(negative[:, ::-1], axis=1)
+        next_year = np.minimum(last_negative + 1, width - 1)
+        rows = np.arange(n)
+        recovery_flow = flows[rows, next_year]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pp = last_negative - cumulative[rows, last_negative] / recovery_flow
+
+        recovered = (cumulative[:, -1] >= 0) & (last_negative + 1 < width) & (recovery_flow > 0)
+        pp = np.where(recovered, pp, np.nan)
+        return np.where(has_negative, pp, np.where(cumulative[:, -1] >= 0, 0.0, np.nan))
+
+    @staticmethod
+    def profitability_index(npv: np.ndarray, investment: np.ndarray) -> np.ndarray:
+        """PI = (NPV + giá trị hiện tại vốn đầu tư) / giá trị hiện tại vốn đầu tư"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(investment > 0, (npv + investment) / investment, np.nan)
+
+    @staticmethod
+    def npv(net_cash_flow: np.ndarray, discount_factors: np.ndarray) -> np.ndarray:
+        """NPV của từng dự án = tích vô hướng dòng tiền với vector hệ số chiết khấu"""
+        return np.einsum("ij,ij->i", net_cash_flow, discount_factors)
+
+    @staticmethod
+    def equivalent_annual_annuity(npv: np.ndarray, discount_factors: np.ndarray, lifespan: np.ndarray) -> np.ndarray:
+        """
+        EAA: khoản đều hàng năm có cùng giá trị hiện tại với NPV trong dòng đời dự án
+
+        Hệ số niên kim là tổng hệ số chiết khấu các năm 1..dòng đời, nên dùng được cho cả
+        đường cong lãi suất (với WACC cố định trùng công thức r / (1 - (1 + r)^-n)).
+        """
+        years = np.arange(discount_factors.shape[1])[None, :]
+        in_life = (years >= 1) & (years <= lifespan[:, None])
+        annuity_factor = np.sum(np.where(in_life, discount_factors, 0.0), axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return npv / annuity_factor
+
+    @staticmethod
+    def modified_irr(net_cash_flow: np.ndarray, discount_factors: np.ndarray, lifespan: np.ndarray) -> np.ndarray:
+        """
+        MIRR: dòng tiền âm chiết khấu về năm 0, dòng tiền dương tái đầu tư tới cuối dòng đời
+        theo cùng đường cong chiết khấu (với WACC cố định trùng công thức MIRR thông thường)
+
+        Returns:
+            Mảng MIRR (tỷ lệ), NaN nếu không có dòng tiền âm hoặc dương
+        """
+        rows = np.arange(net_cash_flow.shape[0])
+        pv_negative = -np.einsum("ij,ij->i", np.minimum(net_cash_flow, 0.0), discount_factors)
+        pv_positive = np.einsum("ij,ij->i", np.maximum(net_cash_flow, 0.0), discount_factors)
+        fv_positive = pv_positive / discount_factors[rows, lifespan]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = fv_positive / pv_negative
+            mirr = ratio ** (1.0 / lifespan) - 1.0
+        return np.where((pv_negative > 0) & (fv_positive > 0), mirr, np.nan)
+
+    @staticmethod
+    def metrics_kernel(
+        net_cash_flow: np.ndarray,
+        discount_factors: np.ndarray,
+        lifespan: Any = None,
+        capex: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Tính NPV, IRR, MIRR, PI, EAA, PP, DPP từ dòng tiền thuần trong một lượt
+
+        Args:
+            net_cash_flow: Dòng tiền thuần, shape (số năm,) cho một dự án hoặc (số dự án, số năm)
+            discount_factors: Hệ số chiết khấu cùng shape (hoặc một vector dùng chung)
+            lifespan: Dòng đời từng dự án (mặc định: số năm - 1)
+            capex: Dòng vốn đầu tư cho PI (mặc định: phần âm của dòng tiền thuần)
+
+        Returns:
+            Dictionary "npv", "irr", "mirr", "pi", "eaa", "pp", "dpp" cùng "irr_roots", "irr_count",
+            "sign_changes" của CashFlowEngine.irr_analysis (mảng theo dự án, giá trị đơn nếu đầu vào
+            là một vector; NaN nếu không tính được)
+        """
+        single = np.ndim(net_cash_flow) == 1
+        flows = np.atleast_2d(np.asarray(net_cash_flow, dtype=float))
+        factors = np.broadcast_to(np.atleast_2d(discount_factors), flows.shape)
+        n, width = flows.shape
+        life = np.broadcast_to(np.asarray(width - 1 if lifespan is None else lifespan, dtype=int), (n,))
+        investment = -np.minimum(flows, 0.0) if capex is None else np.atleast_2d(capex)
+
+        discounted = flows * factors
+        cumulative = np.cumsum(flows, axis=1)
+        cumulative_discounted = np.cumsum(discounted, axis=1)
+        npv = CashFlowEngine.npv(flows, factors)
+
+        results = CashFlowEngine.irr_analysis(flows, np.arange(width))
+        results.update({
+            "npv": npv,
+            "mirr": CashFlowEngine.modified_irr(flows, factors, life),
+            "pi": CashFlowEngine.profitability_index(npv, CashFlowEngine.npv(investment, factors)),
+            "eaa": CashFlowEngine.equivalent_annual_annuity(npv, factors, life),
+            "pp": CashFlowEngine.payback(flows, cumulative),
+            "dpp": CashFlowEngine.payback(discounted, cumulative_discounted),
+        })
+        if single:
+            results = {key: value[0] for key, value in results.items()}
+            results["irr_roots"] = results["irr_roots"][np.isfinite(results["irr_roots"])]
+            return {key: value if key == "irr_roots" else value.item() for key, value in results.items()}
+        return results
+
+    @staticmethod
+    def calculate_metrics(batch: ProjectBatch) -> Dict[str, np.ndarray]:
+        """
+        Tính bảng dòng tiền và toàn bộ chỉ số cho cả lô
+
+        Returns:
+            Dictionary gồm các dòng của CashFlowEngine.build và các mảng
+            "npv", "irr", "mirr", "pi", "eaa", "pp", "dpp" (NaN nếu không tính được)
+        """
+        flows = CashFlowEngine.build(batch)
+        flows.update(CashFlowEngine.metrics_kernel(
+            flows["net_cash_flow"], flows["discount_factors"], batch.lifespan, flows["capex"]
+        ))
+        return flows
+
+
+def to_metrics_dicts(results: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Chuyển kết quả mảng sang danh sách dictionary chỉ số theo định dạng của ứng dụng
+
+    IRR và MIRR tính theo %, giá trị không tính được được thay bằng chuỗi hiển thị như FinancialCalculator.
+    Khi dòng tiền có nhiều IRR, "IRR" là IRR đại diện (xem CashFlowEngine.irr_analysis), "IRR_ROOTS" liệt kê tất cả và
+    "IRR_AMBIGUOUS" bằng True.
+    """
+    def value(x: float, scale: float = 1.0, missing: str = "Không thể tính") -> Any:
+        return float(x * scale) if np.isfinite(x) else missing
+
+    metrics = []
+    for i in range(len(results["npv"])):
+        metrics.append({
+            "NPV": float(results["npv"][i]),
+            "IRR": value(results["irr"][i], 100),
+            "MIRR": value(results["mirr"][i], 100),
+            "PI": value(results["pi"][i]),
+            "EAA": value(results["eaa"][i]),
+            "PP": value(results["pp"][i], missing="Không hoàn vốn"),
+            "DPP": value(results["dpp"][i], missing="Không hoàn vốn"),
+            "IRR_ROOTS": [float(r * 100) for r in results["irr_roots"][i] if np.isfinite(r)],
+            "IRR_AMBIGUOUS": bool(results["irr_count"][i] > 1),
+        })
+    return metrics
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Module so sánh nhiều phương án: tính theo lô, cache kết quả từng dự án trong session
+"""
+
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from background import make_inputs_key
+from cash_flow_engine import CashFlowEngine, ProjectBatch, to_metrics_dicts
+
+# Tiêu chí xếp hạng -> (cột trong bảng, giá trị lớn hơn là tốt hơn)
+RANKING_CRITERIA = {
+    "NPV": ("NPV", True),
+    "IRR": ("IRR (%)", True),
+    "MIRR": ("MIRR (%)", True),
+    "PI": ("PI", True),
+    "EAA": ("EAA", True),
+}
+
+
+class ComparisonManager:
+    """Quản lý danh sách dự án đang so sánh và cache kết quả theo từng dự án"""
+
+    PROJECTS_KEY = "comparison_projects"
+    RESULTS_KEY = "comparison_results"
+
+    @staticmethod
+    def _projects() -> List[Dict[str, Any]]:
+        if ComparisonManager.PROJECTS_KEY not in st.session_state:
+            st.session_state[ComparisonManager.PROJECTS_KEY] = []
+        return st.session_state[ComparisonManager.PROJECTS_KEY]
+
+    @staticmethod
+    def _results() -> Dict[str, Dict[str, Any]]:
+        if ComparisonManager.RESULTS_KEY not in st.session_state:
+            st.session_state[ComparisonManager.RESULTS_KEY] = {}
+        return st.session_state[ComparisonManager.RESULTS_KEY]
+
+    @staticmethod
+    def names() -> List[str]:
+        return [p["name"] for p in ComparisonManager._projects()]
+
+    @staticmethod
+    def add(name: str, project_data: Dict[str, Any]) -> bool:
+        """
+        Thêm dự án (hoặc cập nhật dữ liệu nếu trùng tên)
+
+        Returns:
+            True nếu là dự án mới
+        """
+        projects = ComparisonManager._projects()
+        for project in projects:
+            if project["name"] == name:
+                project["project_data"] = dict(project_data)
+                return False
+        projects.append({"name": name, "project_data": dict(project_data)})
+        return True
+
+    @staticmethod
+    def remove(name: str):
+        projects = ComparisonManager._projects()
+        projects[:] = [p for p in projects if p["name"] != name]
+        ComparisonManager._prune()
+
+    @staticmethod
+    def clear():
+        ComparisonManager._projects().clear()
+        ComparisonManager._results().clear()
+
+    @staticmethod
+    def _prune():
+        """Bỏ kết quả của các dự án không còn trong danh sách"""
+        keys = {make_inputs_key(p["project_data"]) for p in ComparisonManager._projects()}
+        results = ComparisonManager._results()
+        for key in list(results):
+            if key not in keys:
+                del results[key]
+
+    @staticmethod
+    def compute() -> List[Dict[str, Any]]:
+        """
+        Tính các dự án chưa có trong cache trong một lô, rồi trả về kết quả theo thứ tự danh sách
+
+        Returns:
+            Danh sách {"name", "project_data", "metrics", "years", "cumulative", "cumulative_discounted"}
+        """
+        projects = ComparisonManager._projects()
+        results = ComparisonManager._results()
+        keys = [make_inputs_key(p["project_data"]) for p in projects]
+
+        missing = {}
+        for key, project in zip(keys, projects):
+            if key not in results:
+                missing.setdefault(key, project["project_data"])
+
+        if missing:
+            batch = ProjectBatch(list(missing.values()))
+            flows = CashFlowEngine.calculate_metrics(batch)
+            metrics = to_metrics_dicts(flows)
+            for i, key in enumerate(missing):
+                width = int(batch.lifespan[i]) + 1
+                results[key] = {
+                    "metrics": metrics[i],
+                    "years": batch.years[:width].tolist(),
+                    "cumulative": flows["cumulative"][i, :width].tolist(),
+                    "cumulative_discounted": flows["cumulative_discounted"][i, :width].tolist(),
+                }
+
+        return [
+            {"name": project["name"], "project_data": project["project_data"], **results[key]}
+            for key, project in zip(keys, projects)
+        ]
+
+    @staticmethod
+    def ranking_table(results: List[Dict[str, Any]], sort_by: str = "NPV") -> pd.DataFrame:
+        """
+        Bảng xếp hạng các dự án theo một tiêu chí
+
+        Args:
+            results: Kết quả từ ComparisonManager.compute
+            sort_by: Khóa trong RANKING_CRITERIA
+
+        Returns:
+            DataFrame (NaN ở các chỉ số không tính được), cột "Hạng" theo tiêu chí đã chọn
+        """
+        def numeric(value) -> Optional[float]:
+            return float(value) if isinstance(value, (int, float)) else np.nan
+
+        rows = []
+        for result in results:
+            m = result["metrics"]
+            rows.append({
+                "Dự án": result["name"],
+                "NPV": m["NPV"],
+                "IRR (%)": numeric(m["IRR"]),
+                "MIRR (%)": numeric(m["MIRR"]),
+                "PI": numeric(m["PI"]),
+                "EAA": numeric(m["EAA"]),
+                "PP (năm)": numeric(m["PP"]),
+                "DPP (năm)": numeric(m["DPP"]),
+            })
+        df = pd.DataFrame(rows)
+        if df.empty:
+            return df
+
+        column, descending = RANKING_CRITERIA[sort_by]
+        df = df.sort_values(column, ascending=not descending, na_position="last").reset_index(drop=True)
+        df.insert(0, "Hạng", range(1, len(df) + 1))
+        return df
@@ -6,6 +6,90 @@ File cấu hình cho ứng dụng Phân tích Phương án Kinh doanh
 # === GEMINI AI CONFIG ===
 GEMINI_MODEL_NAME = "gemini-2.5-flash"
 GEMINI_API_TIMEOUT = 60  # seconds
+GEMINI_REQUESTS_PER_MINUTE = 10  # Giới hạn request/phút của gói miễn phí
+
+# === DEADLINE / HEDGED REQUEST CONFIG ===
+REQUEST_MAX_WORKERS = 8
+GEMINI_HEDGE_ENABLED = True
+GEMINI_HEDGE_PERCENTILE = 95  # Gửi request thứ hai khi request đầu vượt p95
+GEMINI_HEDGE_MIN_SAMPLES = 20  # Số mẫu độ trễ tối thiểu trước khi bật hedge
+GEMINI_HEDGE_BUDGET_RATIO = 0.1  # Tối đa 10% request được gửi kép
+LATENCY_WINDOW_SIZE = 200
+
+# === BACKGROUND / PREFETCH CONFIG ===
+BACKGROUND_MAX_WORKERS = 4
+AI_PREFETCH_ENABLED = False  # Opt-in: chuẩn bị trước phân tích AI khi có chỉ số
+AI_PREFETCH_RESERVED_CALLS = 2  # Số lượt request luôn để dành cho thao tác của người dùng
+JOB_POLL_INTERVAL = 1.0  # Chu kỳ (giây) fragment cập nhật tiến độ tác vụ nền
+JOB_RETENTION_SECONDS = 3600  # Thời gian giữ tác vụ đã kết thúc trong registry
+
+# === NEAR-DUPLICATE DOCUMENT CONFIG ===
+SIMILARITY_SHINGLE_SIZE = 5  # Số từ trong một shingle
+SIMILARITY_NUM_PERM = 128  # Số hàm hash của chữ ký MinHash
+SIMILARITY_LSH_BANDS = 16  # 16 band x 8 hàng => ngưỡng ứng viên ~0.7
+SIMILARITY_THRESHOLD = 0.8  # Jaccard tối thiểu để coi là bản nháp gần giống
+SIMILARITY_MAX_DOCUMENTS = 500
+FINANCIAL_KEYWORDS = (
+    "vốn", "doanh thu", "chi phí", "wacc", "thuế", "lãi suất", "lợi nhuận",
+    "dòng đời", "thời gian hoạt động", "tỷ", "triệu", "đồng", "vnđ", "%"
+)
+
+# === VISUALIZATION CONFIG ===
+FIGURE_CACHE_MAX_ENTRIES = 64  # Số bộ biểu đồ tối đa giữ trong cache
+WEBGL_POINT_THRESHOLD = 1000  # Trên ngưỡng này chuyển SVG sang WebGL (Scattergl)
+LTTB_TARGET_POINTS = 1500  # Số điểm giữ lại khi giảm mẫu bằng LTTB
+BAR_TEXT_MAX_POINTS = 40  # Chỉ ghi nhãn giá trị trên cột khi số cột nhỏ
+FAN_CHART_MIN_PATHS = 50  # Từ số đường này trở lên vẽ dải phân vị thay vì từng đường
+FAN_CHART_PERCENTILES = (5, 25, 50, 75, 95)
+
+# === REPORT CONFIG ===
+REPORT_MAX_WORKERS = 4  # Số báo cáo tạo song song trong một lô
+REPORT_PLOTLY_BUNDLE = "plotly.min.js"  # Tên file plotly.js dùng chung trong file zip
+REPORT_PDF_TIMEOUT = 60  # Thời gian tối đa (giây) để trình duyệt in một file PDF
+REPORT_PDF_BROWSERS = ("chromium", "chromium-browser", "google-chrome", "google-chrome-stable", "msedge")
+
+# === GOAL SEEK CONFIG ===
+GOAL_SEEK_GRID_POINTS = 33  # Số điểm quét để tìm khoảng chứa nghiệm
+GOAL_SEEK_ITERATIONS = 60  # Số bước chia đôi trong khoảng đã tìm
+GOAL_SEEK_MONEY_RANGE = 10  # Cận trên tìm kiếm cho các khoản tiền = hệ số x khoản lớn nhất của dự án
+
+# === GLOBAL SENSITIVITY (SOBOL) CONFIG ===
+SOBOL_DEFAULT_SAMPLES = 4096  # Số mẫu cơ sở N (lũy thừa của 2), tổng số lần tính = N x (số đầu vào + 2)
+SOBOL_MAX_SAMPLES = 131072
+SOBOL_DEFAULT_SPREAD = 20  # Biên độ thay đổi mặc định của mỗi đầu vào: ± 20% giá trị hiện tại
+SOBOL_BOOTSTRAP_RESAMPLES = 200
+SOBOL_CONFIDENCE_LEVEL = 0.95
+SOBOL_CHUNK_SIZE = 65536  # Số phương án tối đa trong một lô tính toán (giới hạn bộ nhớ)
+
+# === REAL OPTIONS CONFIG ===
+REAL_OPTION_RISK_FREE_RATE = 4.0  # Lãi suất phi rủi ro mặc định (%/năm)
+REAL_OPTION_VOLATILITY = 30.0  # Độ biến động năm mặc định của giá trị dự án (%)
+REAL_OPTION_STEPS_PER_YEAR = 12  # Số bước cây nhị phân mỗi năm
+REAL_OPTION_ABANDON_RATIO = 0.5  # Giá trị thu hồi khi từ bỏ ngay sau đầu tư = tỷ lệ x vốn đầu tư
+REAL_OPTION_EXPAND_RATIO = 30.0  # Mở rộng quy mô thêm 30%
+REAL_OPTION_EXPAND_COST_RATIO = 0.25  # Chi phí mở rộng = tỷ lệ x vốn đầu tư
+REAL_OPTION_DEFER_YEARS = 2  # Số năm tối đa được trì hoãn đầu tư
+
+# === OPERATING HORIZON CONFIG ===
+HORIZON_MAX_EXTRA_YEARS = 20  # Số năm tối đa được xét kéo dài thêm so với dòng đời kế hoạch
+HORIZON_MAX_YEARS = 100  # Trần dòng đời (trùng giới hạn của DataValidator)
+
+# === PORTFOLIO SELECTION CONFIG ===
+PORTFOLIO_MAX_NODES = 200000  # Giới hạn số nút nhánh cận (vượt quá thì trả về lời giải tốt nhất đã tìm được)
+PORTFOLIO_NEWTON_ITERATIONS = 50  # Số bước Newton tối đa ở mỗi mức làm trơn khi tìm giá bóng nhiều kỳ
+PORTFOLIO_TOLERANCE = 1e-9  # Sai số tương đối khi so sánh cận trên với lời giải tốt nhất
+
+# === STOCHASTIC PATH SIMULATION CONFIG ===
+STOCHASTIC_DEFAULT_PATHS = 5000
+STOCHASTIC_MAX_PATHS = 200000
+STOCHASTIC_CHUNK_SIZE = 4096  # Số đường tối đa trong một lô tính toán (giới hạn bộ nhớ)
+STOCHASTIC_CHART_PATHS = 1000  # Số đường giữ lại để vẽ biểu đồ quạt
+STOCHASTIC_VOLATILITY = 15.0  # Độ biến động năm mặc định của doanh thu/chi phí (%)
+STOCHASTIC_REVERSION = 0.5  # Tốc độ hồi quy về kịch bản dự kiến (1/năm), chu kỳ bán rã ~ 1.4 năm
+STOCHASTIC_JUMP_INTENSITY = 0.1  # Số cú sốc đổi chế độ kỳ vọng mỗi năm
+STOCHASTIC_JUMP_MEAN = -20.0  # Mức thay đổi trung bình mỗi cú sốc (%)
+STOCHASTIC_JUMP_STD = 10.0  # Độ lệch chuẩn (log) của mỗi cú sốc (%)
+STOCHASTIC_CORRELATION = 0.5  # Tương quan giữa cú sốc doanh thu và chi phí
 
 # === APP CONFIG ===
 APP_TITLE = "Trình Phân Tích Phương Án Kinh Doanh"
@@ -22,6 +106,68 @@ DEFAULT_VALUES = {
     "thue_suat": 0
 }
 
+# Các trường tùy chọn: dòng tiền thay đổi theo năm, khấu hao, vốn lưu động, chuyển lỗ, vốn vay, lạm phát
+OPTIONAL_PROJECT_FIELDS = [
+    "doanh_thu_theo_nam",
+    "chi_phi_theo_nam",
+    "tang_truong_doanh_thu",
+    "tang_truong_chi_phi",
+    "nam_dat_cong_suat",
+    "dau_tu_bo_sung",
+    "gia_tri_thanh_ly",
+    "phuong_phap_khau_hao",
+    "thoi_gian_khau_hao",
+    "he_so_khau_hao",
+    "ty_le_von_luu_dong",
+    "so_nam_chuyen_lo",
+    "duong_cong_lai_suat",
+    "phan_bu_rui_ro",
+    "wacc_theo_giai_doan",
+    "khoan_vay",
+    "lai_suat_vay",
+    "thoi_han_vay",
+    "an_han_vay",
+    "phuong_thuc_tra_no",
+    "chi_phi_von_chu_so_huu",
+    "lam_phat",
+    "truot_gia_doanh_thu",
+    "truot_gia_chi_phi",
+    "loai_wacc",
+    "ky_tinh",
+    "he_so_mua_vu",
+]
+
+# Số đường cong chiết khấu (vector hệ số chiết khấu) được giữ trong cache
+DISCOUNT_CURVE_CACHE_SIZE = 256
+
+# Số vector chỉ số giá (lạm phát, trượt giá) được giữ trong cache
+PRICE_INDEX_CACHE_SIZE = 256
+
+# Phương pháp khấu hao -> tên hiển thị
+DEPRECIATION_METHOD_LABELS = {
+    "duong_thang": "Đường thẳng",
+    "so_du_giam_dan": "Số dư giảm dần",
+}
+
+# Phương thức trả nợ vay -> tên hiển thị
+LOAN_METHOD_LABELS = {
+    "nien_kim": "Niên kim (gốc + lãi đều)",
+    "goc_deu": "Gốc đều",
+}
+
+# Loại WACC -> tên hiển thị (WACC thực được quy đổi sang danh nghĩa theo lạm phát chung)
+WACC_BASIS_LABELS = {
+    "danh_nghia": "Danh nghĩa",
+    "thuc": "Thực (đã loại trừ lạm phát)",
+}
+
+# Kỳ tính của bảng dòng tiền -> tên hiển thị (số liệu nhập vẫn theo năm, được chia cho các kỳ trong năm)
+PERIOD_LABELS = {
+    "nam": "Năm",
+    "quy": "Quý",
+    "thang": "Tháng",
+}
+
 # === EXTRACTION PROMPT ===
 EXTRACTION_PROMPT_TEMPLATE = """
 Bạn là một chuyên gia phân tích tài chính. Hãy đọc kỹ văn bản phương án kinh doanh dưới đây.
@@ -35,6 +181,34 @@ Nếu không tìm thấy thông tin nào, hãy trả về giá trị 0 cho trư
 5. "wacc": Tỷ lệ chiết khấu hoặc chi phí sử dụng vốn bình quân (WACC) (đơn vị: phần trăm, ví dụ: 12.5 cho 12.5%).
 6. "thue_suat": Thuế suất thuế thu nhập doanh nghiệp (đơn vị: phần trăm, ví dụ: 20 cho 20%).
 
+Các trường sau là TÙY CHỌN, chỉ đưa vào JSON khi văn bản có nêu rõ (không tự suy đoán):
+7. "doanh_thu_theo_nam": Danh sách doanh thu từng năm từ năm 1 (VNĐ), dùng null cho năm không nêu.
+8. "chi_phi_theo_nam": Danh sách chi phí hoạt động từng năm từ năm 1 (VNĐ), dùng null cho năm không nêu.
+9. "tang_truong_doanh_thu": Tốc độ tăng doanh thu hàng năm (phần trăm).
+10. "tang_truong_chi_phi": Tốc độ tăng chi phí hàng năm (phần trăm).
+11. "nam_dat_cong_suat": Số năm để dự án đạt công suất tối đa (doanh thu tăng dần trong giai đoạn này).
+12. "dau_tu_bo_sung": Các khoản đầu tư/tái đầu tư ở các năm sau, dạng [{{"nam": 5, "so_tien": 800000000}}].
+13. "gia_tri_thanh_ly": Giá trị thu hồi khi thanh lý tài sản cuối dự án (VNĐ).
+14. "phuong_phap_khau_hao": Phương pháp khấu hao tài sản cố định, "duong_thang" hoặc "so_du_giam_dan".
+15. "thoi_gian_khau_hao": Thời gian khấu hao (năm).
+16. "ty_le_von_luu_dong": Nhu cầu vốn lưu động (phần trăm doanh thu).
+17. "so_nam_chuyen_lo": Số năm được chuyển lỗ sang các năm sau khi tính thuế (ví dụ: 5).
+18. "duong_cong_lai_suat": Lãi suất (spot) theo kỳ hạn 1, 2, 3... năm dùng để chiết khấu (phần trăm), ví dụ [4.5, 5.0, 5.4].
+19. "phan_bu_rui_ro": Phần bù rủi ro cộng thêm vào đường cong lãi suất (phần trăm).
+20. "wacc_theo_giai_doan": WACC thay đổi theo giai đoạn, dạng [{{"tu_nam": 4, "wacc": 10}}] (áp dụng từ năm đó trở đi).
+21. "khoan_vay": Số tiền vay ngân hàng để tài trợ dự án, giải ngân ở năm 0 (VNĐ).
+22. "lai_suat_vay": Lãi suất khoản vay (phần trăm/năm).
+23. "thoi_han_vay": Thời hạn khoản vay (năm), kể cả thời gian ân hạn.
+24. "an_han_vay": Số năm ân hạn nợ gốc (chỉ trả lãi).
+25. "phuong_thuc_tra_no": Cách trả nợ, "nien_kim" (gốc + lãi đều mỗi năm) hoặc "goc_deu" (gốc đều, lãi theo dư nợ).
+26. "chi_phi_von_chu_so_huu": Chi phí vốn chủ sở hữu (phần trăm), dùng chiết khấu dòng tiền chủ sở hữu.
+27. "lam_phat": Lạm phát dự kiến (phần trăm/năm), một số hoặc danh sách theo năm từ năm 1. Khi có lạm phát, doanh thu và chi phí được hiểu là theo giá năm 0.
+28. "truot_gia_doanh_thu": Tốc độ tăng giá bán nếu khác lạm phát chung (phần trăm/năm).
+29. "truot_gia_chi_phi": Tốc độ tăng giá chi phí đầu vào nếu khác lạm phát chung (phần trăm/năm).
+30. "loai_wacc": "thuc" nếu tỷ lệ chiết khấu đã loại trừ lạm phát, "danh_nghia" nếu chưa.
+31. "ky_tinh": Kỳ lập dòng tiền nếu văn bản lập theo tháng hoặc quý: "thang", "quy" hoặc "nam".
+32. "he_so_mua_vu": Doanh thu có tính mùa vụ: danh sách 12 hệ số theo tháng 1-12 (1 = tháng trung bình), ví dụ tháng Tết 1.6.
+
 Văn bản cần phân tích:
 ---
 {text}
@@ -64,17 +238,24 @@ Với vai trò là một chuyên gia tư vấn đầu tư, hãy phân tích dự
 - Chi phí vận hành/năm: {chi_phi} VNĐ
 - Chi phí sử dụng vốn (WACC): {wacc}%
 - Thuế suất: {thue_suat}%
+{gia_dinh_theo_nam}
 
 **CÁC CHỈ SỐ HIỆU QUẢ:**
 - Giá trị hiện tại ròng (NPV): {npv} VNĐ
-- Tỷ suất hoàn vốn nội bộ (IRR): {irr}
+- Tỷ suất hoàn vốn nội bộ (IRR): {irr}{irr_note}
+- IRR điều chỉnh (MIRR, tái đầu tư theo chi phí vốn): {mirr}
+- Chỉ số sinh lời (PI): {pi}
+- Giá trị đều hàng năm tương đương (EAA): {eaa}
 - Thời gian hoàn vốn (PP): {pp}
-- Thời gian hoàn vốn có chiết khấu (DPP): {dpp}
+- Thời gian hoàn vốn có chiết khấu (DPP): {dpp}{tai_tro}{gia_thuc}
+
+**ĐỘ NHẠY (mỗi chỉ tiêu tăng 1%, các chỉ tiêu khác giữ nguyên):**
+{do_nhay}
 
 **YÊU CẦU PHÂN TÍCH:**
-1. Đánh giá từng chỉ số tài chính (NPV, IRR, PP, DPP) trong bối cảnh dự án này
-2. So sánh IRR với WACC để đánh giá hiệu quả đầu tư
-3. Phân tích khả năng sinh lời dựa trên doanh thu và chi phí
+1. Đánh giá từng chỉ số tài chính (NPV, IRR, MIRR, PI, EAA, PP, DPP) trong bối cảnh dự án này
+2. So sánh IRR và MIRR với WACC để đánh giá hiệu quả đầu tư
+3. Phân tích khả năng sinh lời dựa trên doanh thu và chi phí, chỉ ra các yếu tố NPV nhạy cảm nhất
 4. Đưa ra kết luận tổng quan về tính khả thi (rất khả thi / khả thi / cần cân nhắc / rủi ro cao / không khả thi)
 5. Đề xuất các khuyến nghị (nếu có)
 
@@ -102,4 +283,6 @@ ERROR_MESSAGES = {
     "invalid_data": "Dữ liệu đầu vào không hợp lệ để tính toán. Lỗi: {}",
     "file_read_error": "Không thể đọc file: {}",
     "calculation_error": "Lỗi khi tính toán các chỉ số tài chính: {}",
+    "api_timeout": "⏱️ AI không phản hồi trong {} giây. Vui lòng thử lại sau.",
+    "api_cancelled": "Yêu cầu AI đã bị hủy.",
 }
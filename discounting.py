@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Module đường cong chiết khấu: WACC cố định, đường cong lãi suất + phần bù rủi ro, WACC theo giai đoạn;
+và đường cong chỉ số giá (lạm phát, trượt giá) kèm quy đổi WACC thực sang danh nghĩa
+
+Vector hệ số chiết khấu (và chỉ số giá) được tính một lần cho mỗi đường cong (và độ dài) rồi dùng chung,
+nên hàng nghìn dự án có cùng đường cong chỉ dùng một mảng.
+"""
+
+from functools import lru_cache
+from typing import Dict, Any, List, Sequence, Tuple
+
+import numpy as np
+
+from config import DISCOUNT_CURVE_CACHE_SIZE, PRICE_INDEX_CACHE_SIZE
+
+FLAT = "flat"
+YIELD_CURVE = "yield_curve"
+STEPPED = "stepped"
+
+# Khóa đường cong: (loại, các lãi suất theo năm dạng tỷ lệ, phần bù rủi ro)
+CurveKey = Tuple[str, Tuple[float, ...], float]
+
+REAL_WACC = "thuc"
+
+# Khóa chỉ số giá: tốc độ tăng giá năm 1, 2, ... dạng tỷ lệ (kéo dài tốc độ cuối); () = giá không đổi
+IndexKey = Tuple[float, ...]
+
+
+def _extend(rates: Sequence[float], length: int) -> np.ndarray:
+    """Lãi suất cho các năm 1..length, kéo dài lãi suất cuối nếu đường cong ngắn hơn"""
+    rates = np.asarray(rates, dtype=float)
+    if len(rates) >= length:
+        return rates[:length]
+    return np.concatenate([rates, np.full(length - len(rates), rates[-1])])
+
+
+def curve_key(project_data: Dict[str, Any]) -> CurveKey:
+    """
+    Xác định đường cong chiết khấu của dự án
+
+    Args:
+        project_data: Dictionary chứa thông tin dự án. Ưu tiên "duong_cong_lai_suat" (lãi suất spot
+            theo năm, %) cộng "phan_bu_rui_ro" (%), sau đó "wacc_theo_giai_doan"
+            ([{"tu_nam", "wacc"}]), cuối cùng là "wacc" cố định.
+
+    Returns:
+        Khóa hashable mô tả đường cong
+    """
+    if project_data.get('duong_cong_lai_suat'):
+        rates = tuple(float(r) / 100.0 for r in project_data['duong_cong_lai_suat'])
+        premium = float(project_data.get('phan_bu_rui_ro') or 0) / 100.0
+        return YIELD_CURVE, rates, premium
+
+    if project_data.get('wacc_theo_giai_doan'):
+        steps = sorted(project_data['wacc_theo_giai_doan'], key=lambda s: int(s['tu_nam']))
+        base = float(project_data['wacc']) / 100.0
+        last_year = max(int(steps[-1]['tu_nam']), 1)
+        rates: List[float] = []
+        for year in range(1, last_year + 1):
+            current = base
+            for step in steps:
+                if int(step['tu_nam']) <= year:
+                    current = float(step['wacc']) / 100.0
+            rates.append(current)
+        return STEPPED, tuple(rates), 0.0
+
+    return FLAT, (float(project_data['wacc']) / 100.0,), 0.0
+
+
+@lru_cache(maxsize=DISCOUNT_CURVE_CACHE_SIZE)
+def discount_factors(key: CurveKey, length: int) -> np.ndarray:
+    """
+    Hệ số chiết khấu cho các năm 0..length của một đường cong (đã cache, chỉ đọc)
+
+    - flat: 1 / (1 + r)^t
+    - yield_curve: 1 / (1 + s_t + phần bù)^t với s_t là lãi suất spot kỳ hạn t năm
+    - stepped: tích 1 / (1 + r_u) với u = 1..t (mỗi năm chiết khấu theo WACC của giai đoạn đó)
+    """
+    kind, rates, premium = key
+    years = np.arange(length + 1, dtype=float)
+
+    if kind == FLAT:
+        factors = (1.0 + rates[0]) ** -years
+    elif kind == YIELD_CURVE:
+        spot = np.concatenate([[0.0], _extend(rates, length) + premium])
+        factors = (1.0 + spot) ** -years
+    else:
+        period_rates = _extend(rates, length)
+        factors = np.concatenate([[1.0], np.cumprod(1.0 / (1.0 + period_rates))])
+
+    factors.setflags(write=False)
+    return factors
+
+
+@lru_cache(maxsize=DISCOUNT_CURVE_CACHE_SIZE)
+def discount_factor_derivatives(key: CurveKey, length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Đạo hàm bậc 1 và bậc 2 của hệ số chiết khấu khi cả đường cong dịch chuyển song song
+    (mỗi đơn vị lãi suất, đã cache, chỉ đọc)
+
+    Với ln DF_t = -sum ln(1 + r_u) (giai đoạn) hoặc -t ln(1 + y_t) (cố định, đường cong):
+    DF' = -DF x g_t và DF'' = DF x (g_t^2 + q_t), trong đó g_t = sum 1/(1 + r_u) và q_t = sum 1/(1 + r_u)^2
+    (hoặc t/(1 + y_t) và t/(1 + y_t)^2).
+    """
+    kind, rates, premium = key
+    factors = discount_factors(key, length)
+    years = np.arange(length + 1, dtype=float)
+
+    if kind == STEPPED:
+        inverse = np.concatenate([[0.0], 1.0 / (1.0 + _extend(rates, length))])
+        g = np.cumsum(inverse)
+        q = np.cumsum(inverse ** 2)
+    else:
+        if kind == FLAT:
+            spot = np.full(length + 1, rates[0])
+        else:
+            spot = np.concatenate([[0.0], _extend(rates, length) + premium])
+        g = years / (1.0 + spot)
+        q = years / (1.0 + spot) ** 2
+
+    first = -factors * g
+    second = factors * (g ** 2 + q)
+    first.setflags(write=False)
+    second.setflags(write=False)
+    return first, second
+
+
+def shifted_discount_factors(key: CurveKey, length: int, shifts: np.ndarray) -> np.ndarray:
+    """
+    Hệ số chiết khấu khi cả đường cong dịch chuyển song song một lượng `shifts` (tỷ lệ, mỗi phần tử
+    một phương án), shape (len(shifts), length + 1)
+
+    Dùng cho các lô mẫu của cùng một dự án: thay vì tạo một đường cong (và một mục cache) cho mỗi
+    mẫu, mọi phương án được tính trong một phép toán mảng.
+    """
+    kind, rates, premium = key
+    shifts = np.asarray(shifts, dtype=float)[:, None]
+    years = np.arange(length + 1, dtype=float)
+
+    if kind == FLAT:
+        return (1.0 + rates[0] + shifts) ** -years
+    if kind == YIELD_CURVE:
+        spot = np.concatenate([[0.0], _extend(rates, length) + premium])
+        return (1.0 + spot + shifts) ** -years
+
+    period_rates = _extend(rates, length)[None, :] + shifts
+    ones = np.ones((shifts.shape[0], 1))
+    return np.concatenate([ones, np.cumprod(1.0 / (1.0 + period_rates), axis=1)], axis=1)
+
+
+def _stack(keys: Sequence[CurveKey], length: int, curve) -> np.ndarray:
+    """Xếp vector của từng đường cong thành ma trận theo dự án, mỗi đường cong chỉ lấy một lần"""
+    unique: Dict[CurveKey, int] = {}
+    index = np.array([unique.setdefault(key, len(unique)) for key in keys], dtype=int)
+    curves = np.stack([curve(key) for key in unique]) if unique else np.zeros((0, length + 1))
+    return curves[index]
+
+
+def discount_factor_matrix(keys: Sequence[CurveKey], length: int) -> np.ndarray:
+    """
+    Ma trận hệ số chiết khấu (số dự án x (length + 1)) cho một lô dự án
+
+    Mỗi đường cong khác nhau chỉ được tính (hoặc lấy từ cache) một lần.
+    """
+    return _stack(keys, length, lambda key: discount_factors(key, length))
+
+
+def discount_derivative_matrices(keys: Sequence[CurveKey], length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Ma trận đạo hàm bậc 1 và bậc 2 của hệ số chiết khấu theo lãi suất cho một lô dự án"""
+    first = _stack(keys, length, lambda key: discount_factor_derivatives(key, length)[0])
+    second = _stack(keys, length, lambda key: discount_factor_derivatives(key, length)[1])
+    return first, second
+
+
+def rate_key(value: Any) -> IndexKey:
+    """Tốc độ tăng giá (%/năm, một số hoặc danh sách theo năm) thành khóa chỉ số giá"""
+    if value is None or value == []:
+        return ()
+    values = value if isinstance(value, (list, tuple)) else [value]
+    rates = tuple(float(v) / 100.0 for v in values)
+    return rates if any(rates) else ()
+
+
+def index_keys(project_data: Dict[str, Any]) -> Tuple[IndexKey, IndexKey, IndexKey]:
+    """
+    Xác định các chỉ số giá của dự án
+
+    Args:
+        project_data: Dictionary chứa thông tin dự án với "lam_phat" (lạm phát chung), "truot_gia_doanh_thu",
+            "truot_gia_chi_phi" (%/năm, một số hoặc danh sách theo năm). Trượt giá không nhập thì bằng lạm phát chung.
+
+    Returns:
+        Khóa chỉ số giá (chung, doanh thu, chi phí)
+    """
+    general = rate_key(project_data.get('lam_phat'))
+    revenue = project_data.get('truot_gia_doanh_thu')
+    costs = project_data.get('truot_gia_chi_phi')
+    return (
+        general,
+        general if revenue is None else rate_key(revenue),
+        general if costs is None else rate_key(costs),
+    )
+
+
+@lru_cache(maxsize=PRICE_INDEX_CACHE_SIZE)
+def price_index(key: IndexKey, length: int) -> np.ndarray:
+    """Chỉ số giá các năm 0..length: năm 0 bằng 1, năm t là tích (1 + tốc độ năm u) với u = 1..t (đã cache, chỉ đọc)"""
+    if key:
+        index = np.concatenate([[1.0], np.cumprod(1.0 + _extend(key, length))])
+    else:
+        index = np.ones(length + 1)
+    index.setflags(write=False)
+    return index
+
+
+def price_index_matrix(keys: Sequence[IndexKey], length: int) -> np.ndarray:
+    """Ma trận chỉ số giá (số dự án x (length + 1)), mỗi khóa khác nhau chỉ được tính (hoặc lấy từ cache) một lần"""
+    return _stack(keys, length, lambda key: price_index(key, length))
+
+
+def nominal_curve_key(key: CurveKey, inflation: IndexKey) -> CurveKey:
+    """
+    Đường cong chiết khấu danh nghĩa từ đường cong thực và lạm phát chung (công thức Fisher)
+
+    WACC cố định và lạm phát cố định cho WACC cố định (1 + r)(1 + i) - 1. Các trường hợp khác được quy
+    về lãi suất kỳ hạn từng năm, nhân với (1 + lạm phát năm đó) và lưu thành đường cong theo giai đoạn,
+    đủ dài để lãi suất năm cuối cũng đúng cho mọi năm sau.
+    """
+    if not inflation:
+        return key
+    kind, rates, _ = key
+    if kind == FLAT and len(inflation) == 1:
+        return FLAT, ((1.0 + rates[0]) * (1.0 + inflation[0]) - 1.0,), 0.0
+
+    length = max(len(rates) + 1, len(inflation))
+    factors = discount_factors(key, length)
+    forward = factors[:-1] / factors[1:] - 1.0
+    nominal = (1.0 + forward) * (1.0 + _extend(inflation, length)) - 1.0
+    return STEPPED, tuple(float(r) for r in nominal), 0.0
+
+
+def project_curve_key(project_data: Dict[str, Any]) -> CurveKey:
+    """Đường cong chiết khấu danh nghĩa của dự án ("loai_wacc" = "thuc": quy đổi từ WACC thực theo lạm phát chung)"""
+    key = curve_key(project_data)
+    if project_data.get('loai_wacc') == REAL_WACC:
+        return nominal_curve_key(key, rate_key(project_data.get('lam_phat')))
+    return key
+
+
+def cache_info():
+    """Thống kê cache đường cong (hits, misses, currsize)"""
+    return discount_factors.cache_info()
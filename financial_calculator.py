@@ -3,10 +3,74 @@
 Module tính toán các chỉ số tài chính dự án
 """
 
+import numpy as np
 import pandas as pd
-import numpy_financial as npf
-from typing import Dict, Any, Tuple, Optional
-from config import ERROR_MESSAGES
+from typing import Dict, Any, List, Sequence, Tuple, Optional
+from config import (
+    ERROR_MESSAGES,
+    REAL_OPTION_RISK_FREE_RATE,
+    REAL_OPTION_VOLATILITY,
+    SOBOL_DEFAULT_SAMPLES,
+    SOBOL_DEFAULT_SPREAD,
+    STOCHASTIC_CORRELATION,
+    STOCHASTIC_DEFAULT_PATHS,
+)
+from cash_flow_engine import CashFlowEngine, ProjectBatch, to_metrics_dicts
+from discounting import discount_factors, index_keys
+from financing import FinancingEngine, to_financing_dicts
+from goal_seek import GoalSeeker
+from horizon import HorizonAnalyzer
+from inflation import InflationEngine, to_inflation_dicts
+from periods import MONTHS_PER_YEAR, PERIODS_PER_YEAR, PeriodicCashFlow, season_weights, to_periodic_dicts
+from global_sensitivity import GlobalSensitivityAnalyzer
+from real_options import RealOptionValuator
+from sensitivity import SensitivityKernel, to_sensitivity_dicts
+from stochastic import StochasticSimulator
+
+# Cột của bảng dòng tiền -> dòng tương ứng trong kết quả CashFlowEngine.build
+CASH_FLOW_COLUMNS = {
+    "Doanh thu": "revenue",
+    "Chi phí": "costs",
+    "Khấu hao": "depreciation",
+    "Lợi nhuận trước thuế": "profit_before_tax",
+    "Thu nhập chịu thuế": "taxable_income",
+    "Thuế TNDN": "tax",
+    "Lợi nhuận sau thuế": "profit_after_tax",
+    "Đầu tư": "capex",
+    "Vốn lưu động tăng thêm": "working_capital",
+    "Thanh lý": "salvage",
+    "Dòng tiền thuần (NCF)": "net_cash_flow",
+    "Dòng tiền chiết khấu": "discounted",
+    "Dòng tiền chiết khấu lũy kế": "cumulative_discounted",
+}
+
+# Cột thêm vào bảng dòng tiền khi dự án có vay -> dòng trong kết quả FinancingEngine.compute
+FINANCING_COLUMNS = {
+    "Dư nợ cuối năm": "debt_balance",
+    "Lãi vay": "interest",
+    "Trả nợ gốc": "principal",
+    "Tấm chắn thuế lãi vay": "interest_tax_shield",
+    "Dòng tiền chủ sở hữu (FCFE)": "fcfe",
+}
+
+# Cột thêm vào bảng dòng tiền khi dự án có lạm phát/trượt giá -> dòng trong kết quả InflationEngine.compute
+INFLATION_COLUMNS = {
+    "Dòng tiền thuần theo giá năm 0": "real_net_cash_flow",
+}
+
+# Cột của bảng dòng tiền theo kỳ (tháng/quý) -> dòng trong kết quả PeriodicCashFlow.compute
+PERIOD_COLUMNS = {
+    "Doanh thu": "revenue",
+    "Chi phí": "costs",
+    "Thuế TNDN": "tax",
+    "Đầu tư": "capex",
+    "Vốn lưu động tăng thêm": "working_capital",
+    "Thanh lý": "salvage",
+    "Dòng tiền thuần (NCF)": "net_cash_flow",
+    "Dòng tiền chiết khấu": "discounted",
+    "Dòng tiền thuần lũy kế": "cumulative",
+    "Dòng tiền chiết khấu lũy kế": "cumulative_discounted",
+}
 
 
 class FinancialCalculator:
@@ -17,7 +81,10 @@ class FinancialCalculator:
         Khởi tạo calculator với dữ liệu dự án
 
         Args:
-            project_data: Dictionary chứa thông tin dự án
+            project_data: Dictionary chứa thông tin dự án (có thể kèm số liệu theo năm,
+                tốc độ tăng trưởng, đầu tư bổ sung, giá trị thanh lý, khấu hao, vốn lưu động
+                chuyển lỗ, đường cong chiết khấu, vốn vay và lạm phát - xem ProjectBatch - cùng kỳ tính
+                "ky_tinh" và hệ số mùa vụ "he_so_mua_vu" - xem PeriodicCashFlow)
         """
         self.investment = float(project_data['von_dau_tu'])
         self.lifespan = int(project_data['dong_doi_du_an'])
@@ -25,6 +92,73 @@ class FinancialCalculator:
         self.costs = float(project_data['chi_phi_nam'])
         self.wacc = float(project_data['wacc']) / 100.0
         self.tax_rate = float(project_data['thue_suat']) / 100.0
+        self.project_data = dict(project_data)
+        self.batch = ProjectBatch([project_data])
+        self.has_debt = float(project_data.get('khoan_vay') or 0) > 0
+        self._results: Optional[Dict[str, np.ndarray]] = None
+        self.has_inflation = any(index_keys(project_data))
+        self._financing: Optional[Dict[str, np.ndarray]] = None
+        self._inflation: Optional[Dict[str, np.ndarray]] = None
+        self.periods_per_year = PERIODS_PER_YEAR[project_data.get('ky_tinh') or "nam"]
+        self._periodic: Dict[int, Dict[str, np.ndarray]] = {}
+
+        # Cùng quy tắc với DataValidator: hệ số sai làm tỷ trọng kỳ lỗi shape hoặc NaN (tổng bằng 0)
+        seasonality = project_data.get('he_so_mua_vu')
+        if seasonality:
+            weights = np.asarray(seasonality, dtype=float)
+            if (weights.shape != (MONTHS_PER_YEAR,) or not np.isfinite(weights).all()
+                    or (weights < 0).any() or weights.sum() <= 0):
+                raise ValueError("Hệ số mùa vụ phải gồm 12 giá trị không âm, tổng lớn hơn 0")
+
+    def _calculate(self) -> Dict[str, np.ndarray]:
+        """Tính toàn bộ bảng dòng tiền và chỉ số một lần (vector hóa theo năm)"""
+        if self._results is None:
+            self._results = CashFlowEngine.calculate_metrics(self.batch)
+        return self._results
+
+    def calculate_financing(self) -> Dict[str, np.ndarray]:
+        """Lịch trả nợ, tấm chắn thuế lãi vay, FCFE, APV và chỉ số vốn chủ sở hữu (xem FinancingEngine)"""
+        if self._financing is None:
+            self._financing = FinancingEngine.compute(self.batch, self._calculate())
+        return self._financing
+
+    def calculate_inflation(self) -> Dict[str, np.ndarray]:
+        """Dòng tiền theo giá năm 0, IRR thực, WACC thực và lạm phát bình quân (xem InflationEngine)"""
+        if self._inflation is None:
+            self._inflation = InflationEngine.compute(self.batch, self._calculate())
+        return self._inflation
+
+    def calculate_periodic(self, periods_per_year: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Dòng tiền, NPV, IRR, PP, DPP theo kỳ (xem PeriodicCashFlow)
+
+        Args:
+            periods_per_year: Số kỳ mỗi năm (1, 4, 12); mặc định theo kỳ tính của dự án
+        """
+        m = periods_per_year or self.periods_per_year
+        if m not in self._periodic:
+            weights = season_weights([self.project_data], m)
+            self._periodic[m] = PeriodicCashFlow.compute(self.batch, self._calculate(), m, weights)
+        return self._periodic[m]
+
+    def build_period_table(self, periods_per_year: Optional[int] = None) -> pd.DataFrame:
+        """
+        Xây dựng bảng dòng tiền theo kỳ (gộp về năm bằng periods.aggregate_to_years)
+
+        Args:
+            periods_per_year: Số kỳ mỗi năm (1, 4, 12); mặc định theo kỳ tính của dự án
+
+        Returns:
+            DataFrame có cột "Kỳ", "Năm" (năm chứa kỳ) và các cột PERIOD_COLUMNS
+        """
+        m = periods_per_year or self.periods_per_year
+        periodic = self.calculate_periodic(m)
+        width = self.lifespan * m + 1
+
+        period_df = pd.DataFrame({"Kỳ": np.arange(width), "Năm": periodic["period_years"][:width]})
+        for column, key in PERIOD_COLUMNS.items():
+            period_df[column] = periodic[key][0, :width]
+        return period_df
 
     def build_cash_flow_table(self) -> pd.DataFrame:
         """
@@ -33,44 +167,20 @@ class FinancialCalculator:
         Returns:
             DataFrame chứa bảng dòng tiền
         """
-        years = list(range(self.lifespan + 1))
-
-        # Khởi tạo các mảng
-        profit_before_tax = [0] * (self.lifespan + 1)
-        tax = [0] * (self.lifespan + 1)
-        profit_after_tax = [0] * (self.lifespan + 1)
-        net_cash_flow = [0] * (self.lifespan + 1)
-
-        # Năm 0: Vốn đầu tư
-        net_cash_flow[0] = -self.investment
-
-        # Các năm tiếp theo
-        for year in range(1, self.lifespan + 1):
-            profit_before_tax[year] = self.revenue - self.costs
-            tax[year] = profit_before_tax[year] * self.tax_rate if profit_before_tax[year] > 0 else 0
-            profit_after_tax[year] = profit_before_tax[year] - tax[year]
-            net_cash_flow[year] = profit_after_tax[year]
-
-        # Tạo DataFrame
-        cash_flow_df = pd.DataFrame({
-            "Năm": years,
-            "Doanh thu": [0] + [self.revenue] * self.lifespan,
-            "Chi phí": [0] + [self.costs] * self.lifespan,
-            "Lợi nhuận trước thuế": profit_before_tax,
-            "Thuế TNDN": tax,
-            "Lợi nhuận sau thuế": profit_after_tax,
-            "Dòng tiền thuần (NCF)": net_cash_flow
-        })
-
-        # Tính dòng tiền chiết khấu
-        cash_flow_df['Dòng tiền chiết khấu'] = [
-            ncf / ((1 + self.wacc) ** year)
-            for year, ncf in enumerate(net_cash_flow)
-        ]
-
-        # Tính dòng tiền chiết khấu lũy kế
-        cash_flow_df['Dòng tiền chiết khấu lũy kế'] = cash_flow_df['Dòng tiền chiết khấu'].cumsum()
-
+        results = self._calculate()
+        width = self.lifespan + 1
+
+        cash_flow_df = pd.DataFrame({"Năm": self.batch.years[:width]})
+        for column, key in CASH_FLOW_COLUMNS.items():
+            cash_flow_df[column] = results[key][0, :width]
+        if self.has_debt:
+            financing = self.calculate_financing()
+            for column, key in FINANCING_COLUMNS.items():
+                cash_flow_df[column] = financing[key][0, :width]
+        if self.has_inflation:
+            inflation = self.calculate_inflation()
+            for column, key in INFLATION_COLUMNS.items():
+                cash_flow_df[column] = inflation[key][0, :width]
         return cash_flow_df
 
     def calculate_npv(self, net_cash_flow: list) -> float:
@@ -83,7 +193,9 @@ class FinancialCalculator:
         Returns:
             Giá trị NPV
         """
-        return npf.npv(self.wacc, net_cash_flow)
+        flows = np.asarray(net_cash_flow, dtype=float)
+        factors = discount_factors(self.batch.curve_keys[0], len(flows) - 1)
+        return float(np.dot(flows, factors))
 
     def calculate_irr(self, net_cash_flow: list) -> Any:
         """
@@ -93,15 +205,34 @@ class FinancialCalculator:
             net_cash_flow: List các dòng tiền thuần
 
         Returns:
-            Giá trị IRR (%) hoặc string "Không thể tính"
+            Giá trị IRR (%) hoặc string "Không thể tính". Nếu dòng tiền có nhiều IRR,
+            trả về IRR đại diện (xem CashFlowEngine.irr_analysis và calculate_irr_roots)
         """
-        try:
-            irr = npf.irr(net_cash_flow)
-            if irr is None or pd.isna(irr):
-                return "Không thể tính"
-            return irr * 100
-        except:
-            return "Không thể tính"
+        flows = np.asarray(net_cash_flow, dtype=float)[None, :]
+        irr = CashFlowEngine.irr_analysis(flows, np.arange(flows.shape[1]))["irr"][0]
+        return float(irr * 100) if np.isfinite(irr) else "Không thể tính"
+
+    def calculate_irr_roots(self, net_cash_flow: list) -> List[float]:
+        """
+        Tìm tất cả IRR của dòng tiền (dòng tiền đổi dấu nhiều lần có thể có nhiều IRR)
+
+        Args:
+            net_cash_flow: List các dòng tiền thuần
+
+        Returns:
+            Danh sách IRR (%) tăng dần, rỗng nếu không có
+        """
+        flows = np.asarray(net_cash_flow, dtype=float)[None, :]
+        roots = CashFlowEngine.irr_analysis(flows, np.arange(flows.shape[1]))["irr_roots"][0]
+        return [float(r * 100) for r in roots if np.isfinite(r)]
+
+    @staticmethod
+    def _payback(flows: pd.Series, cumulative: pd.Series) -> Any:
+        pp = CashFlowEngine.payback(
+            flows.to_numpy(dtype=float)[None, :],
+            cumulative.to_numpy(dtype=float)[None, :]
+        )[0]
+        return float(pp) if np.isfinite(pp) else "Không hoàn vốn"
 
     def calculate_payback_period(self, cash_flow_df: pd.DataFrame) -> Any:
         """
@@ -113,37 +244,8 @@ class FinancialCalculator:
         Returns:
             Thời gian hoàn vốn (năm) hoặc string "Không hoàn vốn"
         """
-        try:
-            cumulative_cash_flow = cash_flow_df['Dòng tiền thuần (NCF)'].cumsum()
-
-            # Kiểm tra xem có hoàn vốn không
-            if cumulative_cash_flow.iloc[-1] < 0:
-                return "Không hoàn vốn"
-
-            # Tìm năm cuối cùng còn âm
-            negative_years = cumulative_cash_flow[cumulative_cash_flow < 0]
-            if len(negative_years) == 0:
-                return 0  # Hoàn vốn ngay từ đầu
-
-            last_negative_year = negative_years.index[-1]
-
-            # Số tiền cần bù đắp
-            recovery_needed = -cumulative_cash_flow.iloc[last_negative_year]
-
-            # Dòng tiền năm hoàn vốn
-            if last_negative_year + 1 >= len(cash_flow_df):
-                return "Không hoàn vốn"
-
-            cash_flow_recovery_year = cash_flow_df['Dòng tiền thuần (NCF)'].iloc[last_negative_year + 1]
-
-            if cash_flow_recovery_year <= 0:
-                return "Không hoàn vốn"
-
-            pp = last_negative_year + (recovery_needed / cash_flow_recovery_year)
-            return pp
-
-        except Exception as e:
-            return "Không hoàn vốn"
+        ncf = cash_flow_df['Dòng tiền thuần (NCF)']
+        return self._payback(ncf, ncf.cumsum())
 
     def calculate_discounted_payback_period(self, cash_flow_df: pd.DataFrame) -> Any:
         """
@@ -155,37 +257,73 @@ class FinancialCalculator:
         Returns:
             Thời gian hoàn vốn có chiết khấu (năm) hoặc string "Không hoàn vốn"
         """
-        try:
-            cumulative_discounted = cash_flow_df['Dòng tiền chiết khấu lũy kế']
+        return self._payback(cash_flow_df['Dòng tiền chiết khấu'], cash_flow_df['Dòng tiền chiết khấu lũy kế'])
 
-            # Kiểm tra xem có hoàn vốn không
-            if cumulative_discounted.iloc[-1] < 0:
-                return "Không hoàn vốn"
+    def goal_seek(self, field: str, metric: str, target: float) -> Tuple[bool, Optional[float], str]:
+        """
+        Tìm giá trị một trường của dự án để chỉ số đạt mục tiêu (xem GoalSeeker)
 
-            # Tìm năm cuối cùng còn âm
-            negative_years = cumulative_discounted[cumulative_discounted < 0]
-            if len(negative_years) == 0:
-                return 0  # Hoàn vốn ngay từ đầu
+        Args:
+            field: Trường cần tìm, ví dụ 'doanh_thu_nam', 'wacc'
+            metric: 'NPV', 'IRR', 'PP' hoặc 'DPP'
+            target: Giá trị mục tiêu (VNĐ cho NPV, % cho IRR, năm cho PP/DPP)
 
-            last_negative_year = negative_years.index[-1]
+        Returns:
+            Tuple[bool, float, str]: (success, value, error_message)
+        """
+        return GoalSeeker.solve_project(self.project_data, field, metric, target)
 
-            # Số tiền cần bù đắp
-            recovery_needed = -cumulative_discounted.iloc[last_negative_year]
+    def global_sensitivity(self, spread: float = SOBOL_DEFAULT_SPREAD, n_samples: int = SOBOL_DEFAULT_SAMPLES,
+                           seed: Optional[int] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Chỉ số Sobol của NPV và IRR khi các đầu vào cơ bản cùng thay đổi ± spread% (xem GlobalSensitivityAnalyzer)
 
-            # Dòng tiền chiết khấu năm hoàn vốn
-            if last_negative_year + 1 >= len(cash_flow_df):
-                return "Không hoàn vốn"
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message)
+        """
+        return GlobalSensitivityAnalyzer.analyze_project(self.project_data, spread, n_samples, seed)
+
+    def value_real_options(self, volatilities: Sequence[float] = (REAL_OPTION_VOLATILITY,),
+                           parameters: Optional[Dict[str, float]] = None,
+                           risk_free: float = REAL_OPTION_RISK_FREE_RATE) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Giá trị các quyền từ bỏ, mở rộng, trì hoãn theo từng giả định độ biến động (xem RealOptionValuator)
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message)
+        """
+        return RealOptionValuator.analyze_project(self.project_data, volatilities, parameters, risk_free)
 
-            cash_flow_recovery_year = cash_flow_df['Dòng tiền chiết khấu'].iloc[last_negative_year + 1]
+    def simulate_paths(self, revenue: Optional[Dict[str, Any]] = None, costs: Optional[Dict[str, Any]] = None,
+                       n_paths: int = STOCHASTIC_DEFAULT_PATHS, correlation: float = STOCHASTIC_CORRELATION,
+                       seed: Optional[int] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Phân phối NPV, IRR, PP, DPP khi doanh thu/chi phí từng năm đi theo quá trình ngẫu nhiên (xem StochasticSimulator)
 
-            if cash_flow_recovery_year <= 0:
-                return "Không hoàn vốn"
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message)
+        """
+        return StochasticSimulator.simulate_project(self.project_data, revenue, costs, n_paths, correlation, seed)
 
-            dpp = last_negative_year + (recovery_needed / cash_flow_recovery_year)
-            return dpp
+    def evaluate_paths(self, revenue_factors: Optional[np.ndarray] = None,
+                       cost_factors: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Chỉ số của dự án trên ma trận hệ số doanh thu/chi phí (số đường x số năm) cho sẵn
 
-        except Exception as e:
-            return "Không hoàn vốn"
+        Returns:
+            Kết quả StochasticSimulator.evaluate ("npv", "irr", "pp", "dpp" theo đường, ...)
+        """
+        return StochasticSimulator.evaluate(self.project_data, revenue_factors, cost_factors)
+
+    def analyze_horizon(self, max_horizon: Optional[int] = None, closure_cost: float = 0.0,
+                        salvage_start: Optional[float] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        NPV theo từng năm dừng dự án và năm dừng tối ưu (xem HorizonAnalyzer)
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message)
+        """
+        return HorizonAnalyzer.analyze_project(self.project_data, max_horizon, closure_cost, salvage_start)
 
     def calculate_all_metrics(self) -> Tuple[Optional[pd.DataFrame], Optional[Dict[str, Any]], Optional[str]]:
         """
@@ -195,22 +333,18 @@ class FinancialCalculator:
             Tuple[DataFrame, Dict, str]: (cash_flow_df, metrics, error_message)
         """
         try:
-            # Xây dựng bảng dòng tiền
             cash_flow_df = self.build_cash_flow_table()
-            net_cash_flow = cash_flow_df['Dòng tiền thuần (NCF)'].tolist()
-
-            # Tính các chỉ số
-            npv = self.calculate_npv(net_cash_flow)
-            irr = self.calculate_irr(net_cash_flow)
-            pp = self.calculate_payback_period(cash_flow_df)
-            dpp = self.calculate_discounted_payback_period(cash_flow_df)
-
-            metrics = {
-                "NPV": npv,
-                "IRR": irr,
-                "PP": pp,
-                "DPP": dpp
-            }
+            # NPV, IRR, MIRR, PI, EAA, PP, DPP được tính cùng lúc bởi CashFlowEngine.metrics_kernel,
+            # độ nhạy được lan truyền trên chính các dòng tiền đó
+            results = self._calculate()
+            metrics = to_metrics_dicts(results)[0]
+            metrics["SENSITIVITY"] = to_sensitivity_dicts(SensitivityKernel.compute(self.batch, results))[0]
+            if self.has_debt:
+                metrics["FINANCING"] = to_financing_dicts(self.calculate_financing())[0]
+            if self.has_inflation:
+                metrics["INFLATION"] = to_inflation_dicts(self.calculate_inflation())[0]
+            if self.periods_per_year > 1:
+                metrics["PERIODIC"] = to_periodic_dicts(self.calculate_periodic())[0]
 
             return cash_flow_df, metrics, None
 
@@ -235,3 +369,20 @@ def calculate_project_financials(project_data: Dict[str, Any]) -> Tuple[Optional
     except (TypeError, ValueError, KeyError) as e:
         error_msg = ERROR_MESSAGES["invalid_data"].format(str(e))
         return None, None, error_msg
+
+
+def calculate_period_table(project_data: Dict[str, Any], periods_per_year: int) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Function tiện ích để lập bảng dòng tiền theo kỳ
+
+    Args:
+        project_data: Dictionary chứa dữ liệu dự án
+        periods_per_year: Số kỳ mỗi năm (1, 4, 12)
+
+    Returns:
+        Tuple[DataFrame, str]: (period_df, error_message)
+    """
+    try:
+        return FinancialCalculator(project_data).build_period_table(periods_per_year), None
+    except (TypeError, ValueError, KeyError) as e:
+        return None, ERROR_MESSAGES["invalid_data"].format(str(e))
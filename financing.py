@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Module tài trợ bằng vốn vay: lịch trả nợ, tấm chắn thuế lãi vay, dòng tiền chủ sở hữu (FCFE) và APV
+
+NPV theo WACC giữ nguyên (dòng tiền dự án không phụ thuộc cơ cấu vốn). APV = NPV khi không vay
+(chiết khấu theo đường chiết khấu của dự án) + giá trị hiện tại của tấm chắn thuế lãi vay (chiết
+khấu theo lãi suất vay). Dư nợ được tính theo công thức đóng cho mọi năm và mọi dự án cùng lúc.
+"""
+
+from typing import Dict, Any, List
+
+import numpy as np
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+
+
+class DebtSchedule:
+    """Lịch trả nợ của cả lô: khoản vay giải ngân năm 0, ân hạn gốc rồi trả theo niên kim hoặc gốc đều"""
+
+    @staticmethod
+    def balances(batch: ProjectBatch) -> np.ndarray:
+        """
+        Dư nợ cuối mỗi năm, shape (số dự án, H + 1)
+
+        Sau k kỳ trả gốc (trong m = thời hạn - ân hạn kỳ), dư nợ niên kim là
+        A·((1 + r)^m - (1 + r)^k) / ((1 + r)^m - 1) và dư nợ gốc đều là A·(1 - k/m).
+        Nợ còn lại khi dự án kết thúc được trả hết ở năm cuối dòng đời.
+        """
+        years = batch.years[None, :]
+        periods = np.maximum(batch.loan_term - batch.loan_grace, 1)[:, None]
+        paid = np.clip(years - batch.loan_grace[:, None], 0, periods)
+        rate = batch.loan_rate[:, None]
+
+        remaining_share = 1.0 - paid / periods
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            growth_total = (1.0 + rate) ** periods
+            annuity_share = (growth_total - (1.0 + rate) ** paid) / (growth_total - 1.0)
+        annuity_share = np.where(rate > 0, annuity_share, remaining_share)
+
+        share = np.where(batch.loan_method[:, None] == 1, remaining_share, annuity_share)
+        return np.where(years < batch.lifespan[:, None], batch.loan_amount[:, None] * share, 0.0)
+
+    @staticmethod
+    def build(batch: ProjectBatch) -> Dict[str, np.ndarray]:
+        """
+        Các dòng của lịch trả nợ
+
+        Returns:
+            Dictionary "loan_draw" (giải ngân), "debt_balance" (dư nợ cuối năm), "interest" (lãi vay),
+            "principal" (trả gốc), "debt_service" (gốc + lãi), mỗi dòng shape (số dự án, H + 1)
+        """
+        balance = DebtSchedule.balances(batch)
+        opening = np.concatenate([np.zeros((batch.size, 1)), balance[:, :-1]], axis=1)
+        draw = np.zeros_like(balance)
+        draw[:, 0] = batch.loan_amount
+        interest = opening * batch.loan_rate[:, None]
+        principal = opening - balance + draw
+        return {
+            "loan_draw": draw,
+            "debt_balance": balance,
+            "interest": interest,
+            "principal": principal,
+            "debt_service": interest + principal,
+        }
+
+
+class FinancingEngine:
+    """Dòng tiền chủ sở hữu và APV trên cả lô"""
+
+    @staticmethod
+    def compute(batch: ProjectBatch, results: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Lịch trả nợ, tấm chắn thuế lãi vay, FCFE và các chỉ số theo vốn chủ sở hữu
+
+        Tấm chắn thuế = thuế khi không vay - thuế khi trừ lãi vay (tính lại cả chuyển lỗ), nên
+        năm lỗ không được hưởng tấm chắn cho tới khi khoản lỗ được bù trừ.
+
+        Args:
+            batch: Lô dự án
+            results: Kết quả CashFlowEngine.calculate_metrics của lô
+
+        Returns:
+            Các dòng của DebtSchedule.build và "interest_tax_shield", "fcfe" (shape (số dự án, H + 1)),
+            cùng các mảng theo dự án "pv_tax_shield", "apv", "equity_npv", "equity_irr"
+        """
+        schedule = DebtSchedule.build(batch)
+        levered_taxable = CashFlowEngine.taxable_income(batch, results["profit_before_tax"] - schedule["interest"])
+        tax_shield = results["tax"] - levered_taxable * batch.tax_rate[:, None]
+        fcfe = results["net_cash_flow"] + schedule["loan_draw"] - schedule["debt_service"] + tax_shield
+
+        years = batch.years[None, :].astype(float)
+        debt_factors = (1.0 + batch.loan_rate[:, None]) ** -years
+        equity_factors = np.where(
+            np.isnan(batch.equity_cost)[:, None],
+            results["discount_factors"],
+            (1.0 + np.nan_to_num(batch.equity_cost)[:, None]) ** -years
+        )
+        pv_tax_shield = CashFlowEngine.npv(tax_shield, debt_factors)
+        return {
+            **schedule,
+            "interest_tax_shield": tax_shield,
+            "fcfe": fcfe,
+            "pv_tax_shield": pv_tax_shield,
+            "apv": results["npv"] + pv_tax_shield,
+            "equity_npv": CashFlowEngine.npv(fcfe, equity_factors),
+            "equity_irr": CashFlowEngine.irr_analysis(fcfe, batch.years)["irr"],
+        }
+
+
+def to_financing_dicts(financing: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Chỉ số tài trợ theo định dạng metrics của ứng dụng ("IRR_VCSH" theo %, "Không thể tính" nếu không có)
+    """
+    return [
+        {
+            "APV": float(financing["apv"][i]),
+            "PV_TAX_SHIELD": float(financing["pv_tax_shield"][i]),
+            "NPV_VCSH": float(financing["equity_npv"][i]),
+            "IRR_VCSH": float(financing["equity_irr"][i] * 100) if np.isfinite(financing["equity_irr"][i]) else "Không thể tính",
+        }
+        for i in range(len(financing["apv"]))
+    ]
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Module độ nhạy toàn cục (chỉ số Sobol) theo thiết kế Saltelli trên dãy Sobol xáo trộn
+
+Khác với độ nhạy giải tích (đạo hàm tại một điểm), chỉ số Sobol chia phương sai của NPV/IRR
+khi mọi đầu vào cùng thay đổi trong khoảng của chúng:
+- Bậc nhất S_i: phần phương sai do riêng đầu vào i
+- Toàn phần ST_i: phần phương sai có liên quan tới đầu vào i, kể cả tương tác với đầu vào khác
+ST_i - S_i lớn nghĩa là đầu vào i tác động chủ yếu qua tương tác (ví dụ WACC x doanh thu).
+"""
+
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from config import (
+    SOBOL_BOOTSTRAP_RESAMPLES,
+    SOBOL_CHUNK_SIZE,
+    SOBOL_CONFIDENCE_LEVEL,
+    SOBOL_DEFAULT_SAMPLES,
+    SOBOL_DEFAULT_SPREAD,
+    SOBOL_MAX_SAMPLES,
+)
+
+# Đầu vào được thay đổi -> tên hiển thị
+SOBOL_FIELDS = {
+    "von_dau_tu": "Vốn đầu tư",
+    "dong_doi_du_an": "Dòng đời dự án",
+    "doanh_thu_nam": "Doanh thu/năm",
+    "chi_phi_nam": "Chi phí/năm",
+    "wacc": "WACC",
+    "thue_suat": "Thuế suất",
+}
+SOBOL_METRICS = ("NPV", "IRR")
+
+SOBOL_BITS = 32  # Độ phân giải của dãy: 2^-32, đủ cho tới 2^32 điểm
+
+# Số chiều 2..21 của bảng hướng Joe-Kuo (new-joe-kuo-6.21201): (bậc s, hệ số a, m_1..m_s)
+# Chiều 1 là dãy van der Corput. Thiết kế Saltelli cần 2 x số đầu vào chiều.
+_DIRECTION_NUMBERS = (
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+)
+SOBOL_MAX_DIMENSIONS = len(_DIRECTION_NUMBERS) + 1
+
+
+class SobolSequence:
+    """Dãy Sobol xáo trộn (linear matrix scrambling + digital shift) chỉ dùng numpy"""
+
+    @staticmethod
+    def direction_numbers(dimensions: int, bits: int = SOBOL_BITS) -> np.ndarray:
+        """
+        Số hướng V_k (số nguyên `bits` bit) của từng chiều
+
+        Returns:
+            Mảng uint64 shape (dimensions, bits)
+        """
+        if dimensions > SOBOL_MAX_DIMENSIONS:
+            raise ValueError(f"Dãy Sobol hỗ trợ tối đa {SOBOL_MAX_DIMENSIONS} chiều")
+
+        v = np.zeros((dimensions, bits), dtype=np.uint64)
+        v[0] = [1 << (bits - 1 - k) for k in range(bits)]
+        for d in range(1, dimensions):
+            s, a, m_init = _DIRECTION_NUMBERS[d - 1]
+            m = list(m_init)
+            # m_k = 2a_1 m_{k-1} xor 2^2 a_2 m_{k-2} xor ... xor 2^s m_{k-s} xor m_{k-s}
+            for k in range(s, bits):
+                value = m[k - s] ^ (m[k - s] << s)
+                for j in range(1, s):
+                    if (a >> (s - 1 - j)) & 1:
+                        value ^= m[k - j] << j
+                m.append(value)
+            v[d] = [m[k] << (bits - 1 - k) for k in range(bits)]
+        return v
+
+    @staticmethod
+    def scramble(v: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Linear matrix scrambling: nhân số hướng với ma trận tam giác dưới ngẫu nhiên trên GF(2)
+
+        Cột j của ma trận (tính từ bit cao nhất) có bit j bằng 1 và các bit thấp hơn ngẫu nhiên,
+        nên tích là XOR các cột ứng với bit 1 của số hướng. Dãy vẫn giữ tính chất (t, s)-dãy.
+        """
+        dimensions, bits = v.shape
+        positions = np.arange(bits - 1, -1, -1, dtype=np.uint64)  # vị trí bit của cột j
+        lower = (np.uint64(1) << positions) - np.uint64(1)
+        noise = rng.integers(0, 1 << bits, size=(dimensions, bits), dtype=np.uint64)
+        columns = (np.uint64(1) << positions)[None, :] | (noise & lower[None, :])
+
+        scrambled = np.zeros_like(v)
+        for j in range(bits):
+            has_bit = (v >> positions[j]) & np.uint64(1)
+            scrambled ^= np.where(has_bit == 1, columns[:, j, None], np.uint64(0))
+        return scrambled
+
+    @staticmethod
+    def generate(n: int, dimensions: int, seed: Optional[int] = None, scramble: bool = True) -> np.ndarray:
+        """
+        n điểm đầu tiên của dãy Sobol trong [0, 1)^dimensions
+
+        Điểm thứ i là XOR các số hướng ứng với bit 1 của mã Gray của i, tính cho mọi điểm cùng lúc
+        theo từng bit (log2(n) phép toán mảng). Số điểm nên là lũy thừa của 2 để giữ cân bằng.
+
+        Returns:
+            Mảng shape (n, dimensions)
+        """
+        v = SobolSequence.direction_numbers(dimensions)
+        rng = np.random.default_rng(seed)
+        if scramble:
+            v = SobolSequence.scramble(v, rng)
+
+        index = np.arange(n, dtype=np.uint64)
+        gray = index ^ (index >> np.uint64(1))
+        points = np.zeros((n, dimensions), dtype=np.uint64)
+        for k in range(max(int(n - 1).bit_length(), 1)):
+            has_bit = ((gray >> np.uint64(k)) & np.uint64(1)).astype(bool)
+            points[has_bit] ^= v[:, k]
+
+        if scramble:
+            points ^= rng.integers(0, 1 << SOBOL_BITS, size=dimensions, dtype=np.uint64)
+        return points.astype(float) / float(1 << SOBOL_BITS)
+
+
+class GlobalSensitivityAnalyzer:
+    """Chỉ số Sobol bậc nhất và toàn phần của NPV/IRR cho một dự án"""
+
+    @staticmethod
+    def default_ranges(project_data: Dict[str, Any], spread: float = SOBOL_DEFAULT_SPREAD,
+                       fields: Sequence[str] = tuple(SOBOL_FIELDS)) -> Dict[str, Tuple[float, float]]:
+        """
+        Khoảng thay đổi mặc định: giá trị hiện tại ± spread%
+
+        Dòng đời được làm tròn thành số năm nguyên (tối thiểu 1) khi đánh giá.
+        """
+        ranges = {}
+        for field in fields:
+            value = float(project_data[field])
+            ranges[field] = (max(value * (1 - spread / 100.0), 0.0), value * (1 + spread / 100.0))
+        return ranges
+
+    @staticmethod
+    def design(ranges: Dict[str, Tuple[float, float]], n_samples: int,
+               seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Hai ma trận mẫu độc lập A, B của thiết kế Saltelli (cùng một dãy Sobol 2 x d chiều)
+
+        Returns:
+            (A, B): shape (n_samples, số đầu vào), theo đơn vị của project_data
+        """
+        d = len(ranges)
+        low = np.array([r[0] for r in ranges.values()])
+        high = np.array([r[1] for r in ranges.values()])
+        unit = SobolSequence.generate(n_samples, 2 * d, seed=seed)
+        return low + unit[:, :d] * (high - low), low + unit[:, d:] * (high - low)
+
+    @staticmethod
+    def evaluate(project_data: Dict[str, Any], fields: Sequence[str], samples: np.ndarray,
+                 chunk_size: int = SOBOL_CHUNK_SIZE) -> Dict[str, np.ndarray]:
+        """
+        NPV và IRR (%) của dự án tại từng hàng mẫu, theo từng khối để giới hạn bộ nhớ
+
+        Mỗi khối là một ProjectBatch.variants nên cả khối được tính bằng các phép toán mảng.
+
+        Returns:
+            Dictionary "NPV", "IRR" -> mảng shape (số mẫu,), NaN nếu không tính được
+        """
+        npv = np.empty(len(samples))
+        irr = np.empty(len(samples))
+        for start in range(0, len(samples), chunk_size):
+            block = samples[start:start + chunk_size]
+            batch = ProjectBatch.variants(project_data, {field: block[:, j] for j, field in enumerate(fields)})
+            flows = CashFlowEngine.build(batch)
+            ncf = flows["net_cash_flow"]
+            npv[start:start + len(block)] = CashFlowEngine.npv(ncf, flows["discount_factors"])
+            irr[start:start + len(block)] = CashFlowEngine.irr_analysis(ncf, batch.years)["irr"] * 100
+        return {"NPV": npv, "IRR": irr}
+
+    @staticmethod
+    def estimator_terms(f_a: np.ndarray, f_b: np.ndarray, f_ab: np.ndarray) -> np.ndarray:
+        """
+        Các số hạng theo hàng mẫu mà trung bình của chúng cho ra chỉ số Sobol
+
+        Giá trị được trừ trung bình chung trước để tránh mất chính xác khi NPV rất lớn.
+
+        Args:
+            f_a, f_b: Giá trị mô hình tại A và B, shape (N,)
+            f_ab: Giá trị tại A_B^(i) (cột i của A thay bằng cột i của B), shape (d, N)
+
+        Returns:
+            Ma trận shape (N, 2d + 4): f_B(f_ABi - f_A), (f_A - f_ABi)^2 / 2, f_A, f_B, f_A^2, f_B^2
+        """
+        center = (f_a.mean() + f_b.mean()) / 2
+        f_a, f_b, f_ab = f_a - center, f_b - center, f_ab - center
+        return np.column_stack([
+            (f_b * (f_ab - f_a)).T,
+            (0.5 * (f_a - f_ab) ** 2).T,
+            f_a, f_b, f_a ** 2, f_b ** 2,
+        ])
+
+    @staticmethod
+    def indices(means: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ước lượng Saltelli (2010) cho S_i và Jansen cho ST_i từ trung bình các số hạng
+
+        Args:
+            means: Trung bình (có thể có trọng số) của GlobalSensitivityAnalyzer.estimator_terms,
+                shape (..., 2d + 4)
+
+        Returns:
+            (first_order, total_order): shape (..., d)
+        """
+        d = (means.shape[-1] - 4) // 2
+        mean_a, mean_b, square_a, square_b = np.moveaxis(means[..., 2 * d:], -1, 0)
+        variance = (square_a + square_b) / 2 - ((mean_a + mean_b) / 2) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return means[..., :d] / variance[..., None], means[..., d:2 * d] / variance[..., None]
+
+    @staticmethod
+    def bootstrap(terms: np.ndarray, resamples: int, confidence: float, rng: np.random.Generator,
+                  chunk_size: int = SOBOL_CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Khoảng tin cậy bootstrap (phân vị) của S_i và ST_i
+
+        Mỗi lần lấy lại mẫu theo hàng được biểu diễn bằng số lần xuất hiện của từng hàng, nên
+        trung bình của cả khối lần lấy mẫu là một phép nhân ma trận (số lần x N) @ (N x số hạng).
+
+        Returns:
+            (first_ci, total_ci): shape (d, 2)
+        """
+        n = terms.shape[0]
+        per_block = max(1, min(resamples, chunk_size * 16 // max(n, 1)))
+        means = []
+        for start in range(0, resamples, per_block):
+            block = min(per_block, resamples - start)
+            rows = rng.integers(0, n, size=(block, n)) + (np.arange(block) * n)[:, None]
+            counts = np.bincount(rows.ravel(), minlength=block * n).reshape(block, n)
+            means.append(counts @ terms / n)
+        first, total = GlobalSensitivityAnalyzer.indices(np.concatenate(means))
+        tail = (1.0 - confidence) / 2 * 100
+        percentiles = [tail, 100 - tail]
+        return np.nanpercentile(first, percentiles, axis=0).T, np.nanpercentile(total, percentiles, axis=0).T
+
+    @staticmethod
+    def analyze(project_data: Dict[str, Any],
+                ranges: Optional[Dict[str, Tuple[float, float]]] = None,
+                n_samples: int = SOBOL_DEFAULT_SAMPLES,
+                resamples: int = SOBOL_BOOTSTRAP_RESAMPLES,
+                confidence: float = SOBOL_CONFIDENCE_LEVEL,
+                seed: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Chỉ số Sobol của NPV và IRR với N x (d + 2) lần đánh giá mô hình
+
+        Mẫu có IRR không tính được (NaN) bị loại khỏi ước lượng của IRR.
+
+        Args:
+            project_data: Dự án gốc
+            ranges: Trường -> (thấp, cao), mặc định GlobalSensitivityAnalyzer.default_ranges
+            n_samples: Số mẫu cơ sở N (nên là lũy thừa của 2)
+            resamples: Số lần bootstrap
+            confidence: Mức tin cậy của khoảng bootstrap
+            seed: Hạt giống cho xáo trộn dãy Sobol và bootstrap
+
+        Returns:
+            Dictionary "fields", "samples", "evaluations" và với mỗi chỉ số trong SOBOL_METRICS:
+            {"S1", "S1_CI", "ST", "ST_CI", "valid_share"} (mảng theo thứ tự "fields")
+        """
+        ranges = ranges or GlobalSensitivityAnalyzer.default_ranges(project_data)
+        fields = list(ranges)
+        d = len(fields)
+        a, b = GlobalSensitivityAnalyzer.design(ranges, n_samples, seed=seed)
+
+        # Ghép A, B và các ma trận A_B^(i) để đánh giá trong một lượt
+        ab = np.repeat(a[None, :, :], d, axis=0)
+        ab[np.arange(d), :, np.arange(d)] = b.T
+        stacked = np.concatenate([a, b, ab.reshape(d * n_samples, d)])
+        values = GlobalSensitivityAnalyzer.evaluate(project_data, fields, stacked)
+
+        rng = np.random.default_rng(None if seed is None else seed + 1)
+        result: Dict[str, Any] = {"fields": fields, "samples": n_samples, "evaluations": len(stacked)}
+        for metric in SOBOL_METRICS:
+            f = values[metric].reshape(d + 2, n_samples)
+            valid = np.all(np.isfinite(f), axis=0)
+            f_a, f_b, f_ab = f[0, valid], f[1, valid], f[2:, valid]
+            if valid.sum() < 2 or np.var(np.concatenate([f_a, f_b])) == 0:
+                nan = np.full(d, np.nan)
+                result[metric] = {"S1": nan, "S1_CI": np.full((d, 2), np.nan), "ST": nan,
+                                  "ST_CI": np.full((d, 2), np.nan), "valid_share": float(valid.mean())}
+                continue
+
+            terms = GlobalSensitivityAnalyzer.estimator_terms(f_a, f_b, f_ab)
+            first, total = GlobalSensitivityAnalyzer.indices(terms.mean(axis=0))
+            first_ci, total_ci = GlobalSensitivityAnalyzer.bootstrap(terms, resamples, confidence, rng)
+            result[metric] = {"S1": first, "S1_CI": first_ci, "ST": total, "ST_CI": total_ci,
+                              "valid_share": float(valid.mean())}
+        return result
+
+    @staticmethod
+    def analyze_project(project_data: Dict[str, Any], spread: float = SOBOL_DEFAULT_SPREAD,
+                        n_samples: int = SOBOL_DEFAULT_SAMPLES,
+                        seed: Optional[int] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Phân tích Sobol cho một dự án với khoảng ± spread% quanh giá trị hiện tại
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message)
+        """
+        if not 0 < spread < 100:
+            return False, None, "Biên độ thay đổi phải trong khoảng (0, 100)%"
+        if not 2 <= n_samples <= SOBOL_MAX_SAMPLES:
+            return False, None, f"Số mẫu phải trong khoảng 2 - {SOBOL_MAX_SAMPLES:,}"
+        try:
+            ranges = GlobalSensitivityAnalyzer.default_ranges(project_data, spread)
+            return True, GlobalSensitivityAnalyzer.analyze(project_data, ranges, n_samples, seed=seed), ""
+        except (KeyError, TypeError, ValueError) as e:
+            return False, None, f"Không thể phân tích độ nhạy toàn cục: {str(e)}"
+
+
+def to_sobol_dataframe(result: Dict[str, Any], metric: str) -> pd.DataFrame:
+    """Bảng chỉ số Sobol của một chỉ số: mỗi đầu vào một hàng, kèm khoảng tin cậy"""
+    data = result[metric]
+    return pd.DataFrame({
+        "Chỉ tiêu": [SOBOL_FIELDS.get(field, field) for field in result["fields"]],
+        "S1": data["S1"],
+        "S1 thấp": data["S1_CI"][:, 0],
+        "S1 cao": data["S1_CI"][:, 1],
+        "ST": data["ST"],
+        "ST thấp": data["ST_CI"][:, 0],
+        "ST cao": data["ST_CI"][:, 1],
+    })
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Module tìm giá trị đầu vào (goal seek / hòa vốn) để một chỉ số đạt mục tiêu
+
+Ví dụ: doanh thu bao nhiêu thì NPV = 0, vốn đầu tư tối đa để IRR đạt 15%, chi phí tối đa để
+thời gian hoàn vốn không quá 5 năm. Mỗi mục tiêu được quy về tìm nghiệm của một hàm:
+- NPV = X: NPV - X
+- IRR = r: NPV chiết khấu theo lãi suất r (IRR >= r khi và chỉ khi hàm này >= 0)
+- PP / DPP = T: dòng tiền (chiết khấu) lũy kế nội suy tại thời điểm T
+"""
+
+from typing import Callable, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from config import (
+    GOAL_SEEK_GRID_POINTS,
+    GOAL_SEEK_ITERATIONS,
+    GOAL_SEEK_MONEY_RANGE,
+    OPTIONAL_PROJECT_FIELDS,
+)
+
+# Trường có thể tìm -> tên hiển thị
+GOAL_SEEK_FIELDS = {
+    "doanh_thu_nam": "Doanh thu/năm",
+    "chi_phi_nam": "Chi phí/năm",
+    "von_dau_tu": "Vốn đầu tư",
+    "wacc": "WACC (%)",
+    "thue_suat": "Thuế suất (%)",
+}
+
+# Chỉ số mục tiêu -> tên hiển thị
+GOAL_SEEK_METRICS = {
+    "NPV": "NPV (VNĐ)",
+    "IRR": "IRR (%)",
+    "PP": "PP (năm)",
+    "DPP": "DPP (năm)",
+}
+
+MONEY_FIELDS = ("doanh_thu_nam", "chi_phi_nam", "von_dau_tu")
+
+
+class GoalSeeker:
+    """Tìm giá trị một trường của project_data để chỉ số đạt mục tiêu, cho một hoặc nhiều dự án"""
+
+    @staticmethod
+    def _objective(flows: Dict[str, np.ndarray], batch: ProjectBatch, metric: str, target: float) -> np.ndarray:
+        """Hàm mục tiêu (bằng 0 tại nghiệm, tăng khi dự án tốt hơn) cho cả lô"""
+        ncf = flows["net_cash_flow"]
+        if metric == "NPV":
+            return CashFlowEngine.npv(ncf, flows["discount_factors"]) - target
+        if metric == "IRR":
+            factors = (1.0 + target / 100.0) ** -batch.years.astype(float)
+            return ncf @ factors
+
+        flow = ncf if metric == "PP" else flows["discounted"]
+        cumulative = np.cumsum(flow, axis=1)
+        rows = np.arange(ncf.shape[0])
+        # Cùng quy tắc nội suy tuyến tính trong năm với CashFlowEngine.payback
+        point = np.clip(float(target), 0.0, batch.lifespan.astype(float))
+        year = np.floor(point).astype(int)
+        next_year = np.minimum(year + 1, batch.horizon)
+        return cumulative[rows, year] + (point - year) * np.where(year < batch.lifespan, flow[rows, next_year], 0.0)
+
+    @staticmethod
+    def evaluate_fields(project_data: Dict[str, Any], fields: Sequence[str], values: np.ndarray,
+                        metric: str, target: float) -> np.ndarray:
+        """
+        Giá trị hàm mục tiêu khi thay lần lượt từng trường của một dự án (các trường khác giữ nguyên)
+
+        Mọi trường và mọi phương án được ghép thành một lô ProjectBatch.variants nên dự án chỉ
+        được đọc một lần cho mỗi lượt đánh giá.
+
+        Args:
+            project_data: Dự án gốc
+            fields: Các trường cần thay (khóa trong GOAL_SEEK_FIELDS)
+            values: Mảng shape (số trường,) hoặc (số trường, k) - hàng i là giá trị của fields[i]
+            metric: Chỉ số mục tiêu (khóa trong GOAL_SEEK_METRICS)
+            target: Giá trị mục tiêu (VNĐ cho NPV, % cho IRR, năm cho PP/DPP)
+
+        Returns:
+            Mảng cùng shape với `values`
+        """
+        values = np.asarray(values, dtype=float)
+        grid = values.reshape(len(fields), -1)
+        samples = {}
+        for i, field in enumerate(fields):
+            column = samples.setdefault(field, np.full(grid.shape, float(project_data[field])))
+            column[i] = grid[i]
+        batch = ProjectBatch.variants(project_data, {field: column.ravel() for field, column in samples.items()})
+        objective = GoalSeeker._objective(CashFlowEngine.build(batch), batch, metric, target)
+        return objective.reshape(values.shape)
+
+    @staticmethod
+    def evaluate(projects: Sequence[Dict[str, Any]], field: str, values: np.ndarray,
+                 metric: str, target: float) -> np.ndarray:
+        """
+        Giá trị hàm mục tiêu khi thay `field` của từng dự án bằng giá trị tương ứng trong `values`
+
+        Mọi dự án và mọi phương án nằm trong một lô ProjectBatch.grouped_variants; WACC được hiểu là
+        dịch chuyển song song đường chiết khấu của dự án.
+
+        Args:
+            projects: Danh sách project_data
+            field: Trường cần thay (khóa trong GOAL_SEEK_FIELDS)
+            values: Mảng shape (số dự án,) hoặc (số dự án, k) - mỗi cột là một phương án
+            metric: Chỉ số mục tiêu (khóa trong GOAL_SEEK_METRICS)
+            target: Giá trị mục tiêu (VNĐ cho NPV, % cho IRR, năm cho PP/DPP)
+
+        Returns:
+            Mảng cùng shape với `values`
+        """
+        values = np.asarray(values, dtype=float)
+        batch = ProjectBatch.grouped_variants(projects, {field: values.ravel()})
+        objective = GoalSeeker._objective(CashFlowEngine.build(batch), batch, metric, target)
+        return objective.reshape(values.shape)
+
+    @staticmethod
+    def default_bounds(projects: Sequence[Dict[str, Any]], field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Khoảng tìm kiếm mặc định: 0-100% cho tỷ lệ, 0 tới bội số khoản tiền lớn nhất cho số tiền"""
+        n = len(projects)
+        if field not in MONEY_FIELDS:
+            return np.zeros(n), np.full(n, 100.0)
+        scale = np.array([
+            max(float(p['von_dau_tu']), float(p['doanh_thu_nam']), float(p['chi_phi_nam']), 1.0)
+            for p in projects
+        ])
+        return np.zeros(n), scale * GOAL_SEEK_MONEY_RANGE
+
+    @staticmethod
+    def _is_constant_flow(project_data: Dict[str, Any]) -> bool:
+        """Dự án theo mô hình dòng tiền đều (không có trường tùy chọn nào)"""
+        return not any(project_data.get(key) for key in OPTIONAL_PROJECT_FIELDS)
+
+    @staticmethod
+    def _analytic(projects: Sequence[Dict[str, Any]], field: str, metric: str, target: float) -> np.ndarray:
+        """
+        Nghiệm giải tích cho mô hình dòng tiền đều: NCF năm 1..n bằng nhau nên mọi mục tiêu
+        đều có dạng -I + NCF x A = mục tiêu, với A là hệ số niên kim (NPV, IRR) hoặc số năm (PP)
+
+        Returns:
+            Mảng nghiệm, NaN nếu không có nghiệm hợp lệ (giá trị âm)
+        """
+        investment = np.array([float(p['von_dau_tu']) for p in projects])
+        lifespan = np.array([int(p['dong_doi_du_an']) for p in projects], dtype=float)
+        revenue = np.array([float(p['doanh_thu_nam']) for p in projects])
+        costs = np.array([float(p['chi_phi_nam']) for p in projects])
+        tax_rate = np.array([float(p['thue_suat']) for p in projects]) / 100.0
+
+        if metric == "PP":
+            annuity = np.minimum(float(target), lifespan)
+            goal = np.zeros(len(projects))
+        else:
+            if metric == "NPV":
+                rate = np.array([float(p['wacc']) for p in projects]) / 100.0
+                goal = np.full(len(projects), float(target))
+            else:
+                rate = np.full(len(projects), float(target) / 100.0)
+                goal = np.zeros(len(projects))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                annuity = np.where(rate != 0, (1.0 - (1.0 + rate) ** -lifespan) / rate, lifespan)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if field == "von_dau_tu":
+                margin = revenue - costs
+                ncf = np.where(margin >= 0, margin * (1.0 - tax_rate), margin)
+                result = ncf * annuity - goal
+            else:
+                # Dòng tiền thuần cần có mỗi năm, đổi ra chênh lệch doanh thu - chi phí trước thuế
+                need = (goal + investment) / annuity
+                margin = np.where(need >= 0, need / (1.0 - tax_rate), need)
+                result = costs + margin if field == "doanh_thu_nam" else revenue - margin
+
+        return np.where(np.isfinite(result) & (result >= 0), result, np.nan)
+
+    @staticmethod
+    def solve(projects: Sequence[Dict[str, Any]], field: str, metric: str, target: float,
+              bounds: Optional[Tuple[Any, Any]] = None) -> np.ndarray:
+        """
+        Tìm giá trị `field` để chỉ số `metric` đạt `target` cho cả lô dự án
+
+        Dùng nghiệm giải tích khi dự án theo mô hình dòng tiền đều; còn lại quét lưới
+        trong khoảng tìm kiếm (mọi dự án và mọi điểm lưới trong một lô) để tìm khoảng đổi dấu
+        gần giá trị hiện tại nhất, rồi chia đôi đồng thời trên cả lô.
+
+        Args:
+            projects: Danh sách project_data
+            field: Trường cần tìm (khóa trong GOAL_SEEK_FIELDS)
+            metric: Chỉ số mục tiêu (khóa trong GOAL_SEEK_METRICS)
+            target: Giá trị mục tiêu (VNĐ cho NPV, % cho IRR, năm cho PP/DPP)
+            bounds: (cận dưới, cận trên) - số hoặc mảng theo dự án; mặc định GoalSeeker.default_bounds
+
+        Returns:
+            Mảng giá trị tìm được, NaN nếu không có nghiệm trong khoảng tìm kiếm
+        """
+        if field not in GOAL_SEEK_FIELDS:
+            raise ValueError(f"Không hỗ trợ tìm trường: {field}")
+        if metric not in GOAL_SEEK_METRICS:
+            raise ValueError(f"Không hỗ trợ chỉ số: {metric}")
+
+        n = len(projects)
+        result = np.full(n, np.nan)
+        if n == 0:
+            return result
+
+        if bounds is None:
+            lo, hi = GoalSeeker.default_bounds(projects, field)
+        else:
+            lo = np.broadcast_to(np.asarray(bounds[0], dtype=float), (n,)).copy()
+            hi = np.broadcast_to(np.asarray(bounds[1], dtype=float), (n,)).copy()
+
+        analytic = np.array([
+            field in MONEY_FIELDS and metric != "DPP" and GoalSeeker._is_constant_flow(p)
+            for p in projects
+        ])
+        if analytic.any():
+            index = np.nonzero(analytic)[0]
+            values = GoalSeeker._analytic([projects[i] for i in index], field, metric, target)
+            in_bounds = (values >= lo[index]) & (values <= hi[index])
+            result[index] = np.where(in_bounds, values, np.nan)
+
+        numeric = np.nonzero(~analytic)[0]
+        if numeric.size:
+            subset = [projects[i] for i in numeric]
+            result[numeric] = GoalSeeker._bracket_and_bisect(
+                lambda values: GoalSeeker.evaluate(subset, field, values, metric, target),
+                np.array([float(p[field]) for p in subset]), lo[numeric], hi[numeric]
+            )
+        return result
+
+    @staticmethod
+    def _bracket_and_bisect(objective: Callable[[np.ndarray], np.ndarray], current: np.ndarray,
+                            lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """
+        Quét lưới tìm khoảng đổi dấu của hàm mục tiêu rồi chia đôi trên cả lô
+
+        Args:
+            objective: Hàm nhận mảng giá trị shape (số hàng,) hoặc (số hàng, k), trả về hàm mục tiêu cùng shape
+            current: Giá trị hiện tại của từng hàng (chọn khoảng chứa nghiệm gần nhất)
+            lo, hi: Khoảng tìm kiếm của từng hàng
+        """
+        n = len(current)
+        steps = np.linspace(0.0, 1.0, GOAL_SEEK_GRID_POINTS)
+        grid = lo[:, None] + (hi - lo)[:, None] * steps[None, :]
+        signs = np.sign(objective(grid))
+
+        exact = signs == 0
+        brackets = (signs[:, :-1] * signs[:, 1:] < 0) | exact[:, :-1]
+
+        # Khoảng chứa nghiệm gần giá trị hiện tại nhất
+        midpoints = (grid[:, :-1] + grid[:, 1:]) / 2
+        distance = np.where(brackets, np.abs(midpoints - current[:, None]), np.inf)
+        chosen = np.argmin(distance, axis=1)
+        found = np.isfinite(distance[np.arange(n), chosen]) | exact[:, -1]
+
+        rows = np.arange(n)
+        a = grid[rows, chosen]
+        b = grid[rows, chosen + 1]
+        # Chỉ điểm cuối lưới là nghiệm đúng
+        last_only = exact[:, -1] & ~brackets.any(axis=1)
+        a = np.where(last_only, grid[:, -1], a)
+        b = np.where(last_only, grid[:, -1], b)
+
+        f_a = signs[rows, np.where(last_only, -1, chosen)]
+        for _ in range(GOAL_SEEK_ITERATIONS):
+            mid = (a + b) / 2
+            f_mid = np.sign(objective(mid))
+            same_side = (f_mid == f_a) & (f_a != 0)
+            a = np.where(same_side, mid, a)
+            b = np.where(same_side, b, mid)
+
+        # Trả về đầu khoảng thỏa mục tiêu (hàm mục tiêu >= 0)
+        return np.where(found, np.where(f_a >= 0, a, b), np.nan)
+
+    @staticmethod
+    def solve_project(project_data: Dict[str, Any], field: str, metric: str,
+                      target: float) -> Tuple[bool, Optional[float], str]:
+        """
+        Goal seek cho một dự án
+
+        Returns:
+            Tuple[bool, float, str]: (success, value, error_message)
+        """
+        try:
+            value = GoalSeeker.solve([project_data], field, metric, target)[0]
+        except (ValueError, KeyError, TypeError) as e:
+            return False, None, str(e)
+        if not np.isfinite(value):
+            return False, None, (
+                f"Không tìm được {GOAL_SEEK_FIELDS[field]} để {metric} đạt {target:g} "
+                "trong khoảng tìm kiếm"
+            )
+        return True, float(value), ""
+
+    @staticmethod
+    def breakeven_points(project_data: Dict[str, Any],
+                         fields: Sequence[str] = tuple(GOAL_SEEK_FIELDS)) -> Dict[str, Optional[float]]:
+        """
+        Giá trị hòa vốn (NPV = 0) của các trường trong GOAL_SEEK_FIELDS
+
+        Khoản tiền của dự án dòng tiền đều dùng nghiệm giải tích; các trường còn lại được quét lưới
+        và chia đôi cùng nhau trong một lô (mỗi hàng là một trường).
+
+        Returns:
+            Dictionary trường -> giá trị hòa vốn (None nếu không có)
+        """
+        fields = list(fields)
+        for field in fields:
+            if field not in GOAL_SEEK_FIELDS:
+                raise ValueError(f"Không hỗ trợ tìm trường: {field}")
+
+        values = np.full(len(fields), np.nan)
+        constant_flow = GoalSeeker._is_constant_flow(project_data)
+        numeric = []
+        for i, field in enumerate(fields):
+            if constant_flow and field in MONEY_FIELDS:
+                lo, hi = GoalSeeker.default_bounds([project_data], field)
+                value = GoalSeeker._analytic([project_data], field, "NPV", 0.0)[0]
+                values[i] = value if lo[0] <= value <= hi[0] else np.nan
+            else:
+                numeric.append(i)
+
+        if numeric:
+            numeric_fields = [fields[i] for i in numeric]
+            bounds = [GoalSeeker.default_bounds([project_data], field) for field in numeric_fields]
+            values[numeric] = GoalSeeker._bracket_and_bisect(
+                lambda grid: GoalSeeker.evaluate_fields(project_data, numeric_fields, grid, "NPV", 0.0),
+                np.array([float(project_data[field]) for field in numeric_fields]),
+                np.concatenate([lo for lo, _ in bounds]), np.concatenate([hi for _, hi in bounds])
+            )
+        return {field: float(value) if np.isfinite(value) else None for field, value in zip(fields, values)}
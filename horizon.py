@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Module xác định thời điểm dừng dự án (dòng đời) tối ưu theo NPV
+
+Dừng ở năm h chỉ thay đổi dòng tiền của năm h: các năm 1..h-1 giữ nguyên, còn năm h
+nhận thêm giá trị thanh lý, thu hồi vốn lưu động, chi phí đóng cửa và thuế trên lãi/lỗ thanh lý.
+Vì vậy NPV(h) = dòng tiền chiết khấu lũy kế đến năm h - 1 + dòng tiền năm h khi dừng x hệ số
+chiết khấu năm h, và mọi h của cả lô được tính từ một lần dựng bảng dòng tiền duy nhất.
+"""
+
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from config import HORIZON_MAX_YEARS
+
+
+class HorizonAnalyzer:
+    """NPV theo từng năm dừng và năm dừng tối ưu cho cả lô dự án"""
+
+    @staticmethod
+    def extended_projects(projects: Sequence[Dict[str, Any]], max_horizons: Sequence[int]) -> list:
+        """
+        Bản sao project_data với dòng đời kéo dài đến `max_horizons`
+
+        Thời gian khấu hao được cố định theo dòng đời kế hoạch để việc kéo dài không làm
+        thay đổi chi phí khấu hao của các năm đầu.
+        """
+        extended = []
+        for project, horizon in zip(projects, max_horizons):
+            data = dict(project)
+            data['dong_doi_du_an'] = int(horizon)
+            if not project.get('thoi_gian_khau_hao'):
+                data['thoi_gian_khau_hao'] = int(project['dong_doi_du_an'])
+            extended.append(data)
+        return extended
+
+    @staticmethod
+    def salvage_schedule(salvage: np.ndarray, lifespan: np.ndarray, width: int,
+                         salvage_start: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Giá trị thanh lý nếu dừng ở từng năm, shape (số dự án, width)
+
+        Giảm tuyến tính từ `salvage_start` (năm 0) về giá trị thanh lý cuối dòng đời kế hoạch
+        và giữ nguyên sau đó; mặc định bằng giá trị thanh lý cuối dòng đời ở mọi năm.
+        """
+        start = salvage if salvage_start is None else np.asarray(salvage_start, dtype=float)
+        years = np.arange(width)[None, :]
+        progress = np.minimum(years / np.maximum(lifespan, 1)[:, None], 1.0)
+        return start[:, None] + (salvage - start)[:, None] * progress
+
+    @staticmethod
+    def curves(batch: ProjectBatch, results: Dict[str, np.ndarray], salvage: np.ndarray,
+               closure_costs: np.ndarray) -> np.ndarray:
+        """
+        NPV nếu dừng dự án ở từng năm
+
+        Args:
+            batch: Lô dự án với dòng đời bằng năm dừng xa nhất được xét
+            results: Kết quả CashFlowEngine.build của lô
+            salvage: Giá trị thanh lý (danh nghĩa) nếu dừng ở từng năm, shape (số dự án, H + 1)
+            closure_costs: Chi phí đóng cửa (được trừ thuế, theo giá năm 0) của từng dự án
+
+        Returns:
+            Ma trận NPV shape (số dự án, H), cột h - 1 ứng với dừng ở năm h; NaN sau năm dừng xa nhất
+        """
+        revenue = results["revenue"]
+        costs = results["costs"]
+        depreciation = results["depreciation"]
+        closure = closure_costs[:, None] * batch.general_index
+
+        book_value = np.cumsum(batch.capex - depreciation, axis=1)
+        disposal_gain = np.where(batch.depreciation_method[:, None] > 0, salvage - book_value, 0.0)
+        profit_before_tax = revenue - costs - depreciation - closure + disposal_gain
+
+        # Lỗ chuyển sang năm h chỉ phụ thuộc các năm trước h, vốn không đổi khi dừng ở năm h
+        carryforward = batch.loss_carryforward_years[:, None] > 0
+        if carryforward.any():
+            pool = CashFlowEngine.loss_pool(results["profit_before_tax"], np.maximum(batch.loss_carryforward_years, 1))
+            profit_before_tax = np.where(carryforward, profit_before_tax - pool, profit_before_tax)
+        tax = np.maximum(profit_before_tax, 0.0) * batch.tax_rate[:, None]
+
+        # Vốn lưu động cuối năm h - 1 (= tỷ lệ x doanh thu năm h) được thu hồi toàn bộ khi dừng
+        closing_flow = (revenue - costs - tax - batch.capex - closure + salvage
+                        + batch.working_capital_rate[:, None] * revenue)
+        npv = results["cumulative_discounted"][:, :-1] + (closing_flow * results["discount_factors"])[:, 1:]
+        return np.where(batch.operating_mask[:, 1:], npv, np.nan)
+
+    @staticmethod
+    def analyze(projects: Sequence[Dict[str, Any]], max_horizons: Optional[Sequence[int]] = None,
+                closure_costs: Optional[Sequence[float]] = None,
+                salvage_start: Optional[Sequence[float]] = None) -> Dict[str, np.ndarray]:
+        """
+        Đường NPV theo năm dừng và năm dừng tối ưu của cả lô
+
+        Args:
+            projects: Danh sách project_data
+            max_horizons: Năm dừng xa nhất được xét của từng dự án (không nhỏ hơn dòng đời kế hoạch);
+                các năm sau dòng đời kế hoạch dùng doanh thu, chi phí theo tăng trưởng mặc định
+            closure_costs: Chi phí đóng cửa (VNĐ) phát sinh ở năm dừng (mặc định 0)
+            salvage_start: Giá trị thanh lý nếu dừng ngay sau đầu tư (mặc định bằng giá trị thanh lý cuối dòng đời);
+                giá trị thanh lý và chi phí đóng cửa theo giá năm 0 được nhân chỉ số giá chung của năm dừng
+
+        Returns:
+            Dictionary "horizons" (1..H), "npv" (số dự án x H), "planned" (dòng đời kế hoạch),
+            "planned_npv", "optimal" (năm dừng có NPV lớn nhất), "optimal_npv"
+        """
+        planned = np.array([int(p['dong_doi_du_an']) for p in projects], dtype=int)
+        if max_horizons is None:
+            max_horizons = planned
+        max_horizons = np.clip(np.asarray(max_horizons, dtype=int), planned, HORIZON_MAX_YEARS)
+        closure = np.zeros(len(projects)) if closure_costs is None else np.asarray(closure_costs, dtype=float)
+
+        batch = ProjectBatch(HorizonAnalyzer.extended_projects(projects, max_horizons))
+        results = CashFlowEngine.build(batch)
+        salvage = HorizonAnalyzer.salvage_schedule(
+            np.array([float(p.get('gia_tri_thanh_ly') or 0) for p in projects]),
+            planned, batch.horizon + 1,
+            None if salvage_start is None else np.asarray(salvage_start, dtype=float)
+        ) * batch.general_index
+        npv = HorizonAnalyzer.curves(batch, results, salvage, closure)
+
+        optimal = np.argmax(np.where(np.isnan(npv), -np.inf, npv), axis=1)
+        rows = np.arange(len(projects))
+        return {
+            "horizons": batch.years[1:],
+            "npv": npv,
+            "planned": planned,
+            "planned_npv": npv[rows, planned - 1],
+            "optimal": optimal + 1,
+            "optimal_npv": npv[rows, optimal],
+        }
+
+    @staticmethod
+    def analyze_project(project_data: Dict[str, Any], max_horizon: Optional[int] = None,
+                        closure_cost: float = 0.0,
+                        salvage_start: Optional[float] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Đường NPV theo năm dừng của một dự án
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message) với result gồm "horizons",
+            "npv" (mảng theo năm dừng), "planned", "planned_npv", "optimal", "optimal_npv"
+        """
+        if closure_cost < 0:
+            return False, None, "Chi phí đóng cửa không được âm"
+        if salvage_start is not None and salvage_start < 0:
+            return False, None, "Giá trị thanh lý không được âm"
+        try:
+            result = HorizonAnalyzer.analyze(
+                [project_data],
+                None if max_horizon is None else [max_horizon],
+                [closure_cost],
+                None if salvage_start is None else [salvage_start]
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return False, None, f"Không thể phân tích năm dừng dự án: {str(e)}"
+
+        horizon = int(np.sum(~np.isnan(result["npv"][0])))
+        return True, {
+            "horizons": result["horizons"][:horizon],
+            "npv": result["npv"][0, :horizon],
+            "planned": int(result["planned"][0]),
+            "planned_npv": float(result["planned_npv"][0]),
+            "optimal": int(result["optimal"][0]),
+            "optimal_npv": float(result["optimal_npv"][0]),
+        }, ""
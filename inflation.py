@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Module quy đổi thực - danh nghĩa: dòng tiền theo mặt bằng giá năm 0 và các chỉ số thực
+
+Khi dự án có lạm phát hoặc trượt giá, doanh thu, chi phí, đầu tư bổ sung và giá trị thanh lý nhập vào
+được hiểu là theo giá năm 0 và ProjectBatch nhân chúng với chỉ số giá (xem discounting.price_index) để
+có dòng tiền danh nghĩa; khấu hao vẫn tính trên nguyên giá danh nghĩa nên lạm phát làm giảm giá trị thực
+của tấm chắn thuế khấu hao. NPV được chiết khấu theo đường cong danh nghĩa nên không đổi khi quy đổi.
+"""
+
+from typing import Dict, Any, List
+
+import numpy as np
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+
+
+class InflationEngine:
+    """Dòng tiền thực và các chỉ số thực trên cả lô"""
+
+    @staticmethod
+    def compute(batch: ProjectBatch, results: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Quy đổi dòng tiền danh nghĩa về giá năm 0 theo chỉ số giá chung
+
+        Với lạm phát cố định, IRR thực = (1 + IRR) / (1 + i) - 1; chỉ các dự án có lạm phát thay đổi
+        theo năm mới phải tìm lại IRR trên dòng tiền thực.
+
+        Args:
+            batch: Lô dự án
+            results: Kết quả CashFlowEngine.calculate_metrics của lô
+
+        Returns:
+            Dictionary "price_index" (chỉ số giá chung), "real_net_cash_flow" (shape (số dự án, H + 1)) và các
+            mảng theo dự án "real_irr", "real_wacc" (lãi suất chiết khấu thực năm 1), "average_inflation"
+            (lạm phát bình quân năm trong dòng đời)
+        """
+        index = batch.general_index
+        real_flows = results["net_cash_flow"] / index
+        first = min(1, batch.horizon)
+        first_year = index[:, first]
+
+        constant = np.all(np.isclose(index, first_year[:, None] ** batch.years[None, :]), axis=1)
+        real_irr = (1.0 + results["irr"]) / first_year - 1.0
+        varying = np.nonzero(~constant)[0]
+        if varying.size:
+            real_irr[varying] = CashFlowEngine.irr_analysis(real_flows[varying], batch.years)["irr"]
+
+        factors = results["discount_factors"]
+        rows = np.arange(batch.size)
+        return {
+            "price_index": index,
+            "real_net_cash_flow": real_flows,
+            "real_irr": real_irr,
+            "real_wacc": factors[:, 0] / factors[:, first] / first_year - 1.0,
+            "average_inflation": index[rows, batch.lifespan] ** (1.0 / batch.lifespan) - 1.0,
+        }
+
+
+def to_inflation_dicts(inflation: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Chỉ số thực theo định dạng metrics của ứng dụng (theo %, "Không thể tính" nếu không có)
+    """
+    def value(x: float) -> Any:
+        return float(x * 100) if np.isfinite(x) else "Không thể tính"
+
+    return [
+        {
+            "IRR_THUC": value(inflation["real_irr"][i]),
+            "WACC_THUC": value(inflation["real_wacc"][i]),
+            "LAM_PHAT_BINH_QUAN": value(inflation["average_inflation"][i]),
+        }
+        for i in range(len(inflation["real_irr"]))
+    ]
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Module dòng tiền theo kỳ (tháng, quý) từ bảng dòng tiền năm
+
+Doanh thu, chi phí và thuế của năm t được chia cho các kỳ trong năm (doanh thu theo hệ số mùa vụ),
+còn đầu tư, vốn lưu động và thanh lý giữ thời điểm cuối năm như mô hình năm (năm 0 là kỳ 0).
+Hệ số chiết khấu kỳ được nội suy tuyến tính trên log hệ số chiết khấu năm, tức lãi suất kỳ hạn trong
+mỗi năm không đổi: với WACC cố định đúng bằng (1 + r)^(-k/m). Thời gian hoàn vốn tìm bằng một lần
+searchsorted trên cả lô nên 1.200 kỳ (100 năm theo tháng) vẫn chỉ là vài phép toán mảng.
+"""
+
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+
+# Kỳ tính -> số kỳ mỗi năm
+PERIODS_PER_YEAR = {
+    "nam": 1,
+    "quy": 4,
+    "thang": 12,
+}
+MONTHS_PER_YEAR = 12
+
+# Dòng phát sinh một lần ở cuối năm (các dòng còn lại được chia cho các kỳ trong năm)
+POINT_ROWS = ("capex", "working_capital", "salvage")
+
+
+def season_weights(projects: Sequence[Dict[str, Any]], periods_per_year: int) -> np.ndarray:
+    """
+    Tỷ trọng doanh thu của từng kỳ trong năm, shape (số dự án, số kỳ mỗi năm), tổng mỗi hàng bằng 1
+
+    Args:
+        projects: Danh sách project_data; "he_so_mua_vu" là 12 hệ số theo tháng (thiếu thì doanh thu đều),
+            được cộng theo nhóm tháng khi tính theo quý hoặc năm
+        periods_per_year: 1, 4 hoặc 12
+    """
+    months = np.ones((len(projects), MONTHS_PER_YEAR))
+    for i, project in enumerate(projects):
+        if project.get('he_so_mua_vu'):
+            months[i] = np.asarray(project['he_so_mua_vu'], dtype=float)
+    grouped = months.reshape(len(projects), periods_per_year, -1).sum(axis=2)
+    return grouped / grouped.sum(axis=1, keepdims=True)
+
+
+class PeriodicCashFlow:
+    """Dòng tiền, hệ số chiết khấu và chỉ số theo kỳ cho cả lô"""
+
+    @staticmethod
+    def discount_factors(annual_factors: np.ndarray, periods_per_year: int) -> np.ndarray:
+        """
+        Hệ số chiết khấu các kỳ 0..H·m từ hệ số năm 0..H (nội suy tuyến tính log hệ số chiết khấu)
+        """
+        n, width = annual_factors.shape
+        periods = np.arange((width - 1) * periods_per_year + 1)
+        year, step = np.divmod(periods, periods_per_year)
+        upper = np.minimum(year + 1, width - 1)
+        fraction = step / periods_per_year
+        log_factors = np.log(annual_factors)
+        return np.exp((1.0 - fraction) * log_factors[:, year] + fraction * log_factors[:, upper])
+
+    @staticmethod
+    def split(annual: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Chia dòng năm 1..H cho các kỳ trong năm theo tỷ trọng (kỳ 0 giữ giá trị năm 0)"""
+        n, width = annual.shape
+        spread = annual[:, 1:, None] * weights[:, None, :]
+        return np.concatenate([annual[:, :1], spread.reshape(n, -1)], axis=1)
+
+    @staticmethod
+    def at_year_end(annual: np.ndarray, periods_per_year: int) -> np.ndarray:
+        """Đặt dòng năm t vào kỳ cuối năm t (kỳ t·m)"""
+        n, width = annual.shape
+        result = np.zeros((n, (width - 1) * periods_per_year + 1))
+        result[:, ::periods_per_year] = annual
+        return result
+
+    @staticmethod
+    def payback(flows: np.ndarray, cumulative: np.ndarray) -> np.ndarray:
+        """
+        Thời gian hoàn vốn (số kỳ, nội suy tuyến tính trong kỳ hoàn vốn) theo cùng quy tắc CashFlowEngine.payback
+
+        Kỳ cuối cùng lũy kế còn âm là kỳ cuối có min lũy kế từ đó về sau < 0. Dãy min hậu tố này không giảm,
+        nên khóa 2·hàng + (min hậu tố >= 0) tăng dần trên cả mảng phẳng và một lần searchsorted cho ra
+        kỳ đầu tiên không còn âm của mọi hàng.
+
+        Returns:
+            Mảng số kỳ, NaN nếu không hoàn vốn
+        """
+        n, width = flows.shape
+        suffix_min = np.minimum.accumulate(cumulative[:, ::-1], axis=1)[:, ::-1]
+        keys = (2 * np.arange(n)[:, None] + (suffix_min >= 0)).ravel()
+        first_recovered = np.searchsorted(keys, 2 * np.arange(n) + 1) - np.arange(n) * width
+
+        rows = np.arange(n)
+        last_negative = first_recovered - 1
+        next_period = np.minimum(first_recovered, width - 1)
+        recovery_flow = flows[rows, next_period]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pp = last_negative - cumulative[rows, np.maximum(last_negative, 0)] / recovery_flow
+
+        recovered = (first_recovered < width) & (recovery_flow > 0)
+        return np.where(first_recovered == 0, 0.0, np.where(recovered, pp, np.nan))
+
+    @staticmethod
+    def compute(batch: ProjectBatch, results: Dict[str, np.ndarray], periods_per_year: int,
+                weights: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Bảng dòng tiền theo kỳ và NPV, IRR, PP, DPP của cả lô
+
+        Args:
+            batch: Lô dự án
+            results: Kết quả CashFlowEngine.build (hoặc calculate_metrics) của lô
+            periods_per_year: Số kỳ mỗi năm (1, 4, 12)
+            weights: Tỷ trọng doanh thu các kỳ trong năm (xem season_weights); mặc định chia đều
+
+        Returns:
+            Dictionary các dòng theo kỳ "revenue", "costs", "tax", "capex", "working_capital", "salvage",
+            "net_cash_flow", "discount_factors", "discounted", "cumulative", "cumulative_discounted"
+            (shape (số dự án, H·m + 1)), "period_years" (năm chứa mỗi kỳ) và các mảng theo dự án "npv",
+            "irr" (quy đổi theo năm), "pp", "dpp" (năm)
+        """
+        m = periods_per_year
+        even = np.full((batch.size, m), 1.0 / m)
+        rows = {
+            "revenue": PeriodicCashFlow.split(results["revenue"], even if weights is None else weights),
+            "costs": PeriodicCashFlow.split(results["costs"], even),
+            "tax": PeriodicCashFlow.split(results["tax"], even),
+        }
+        for key in POINT_ROWS:
+            rows[key] = PeriodicCashFlow.at_year_end(results[key], m)
+
+        ncf = rows["revenue"] - rows["costs"] - rows["tax"] - rows["capex"] - rows["working_capital"] + rows["salvage"]
+        factors = PeriodicCashFlow.discount_factors(results["discount_factors"], m)
+        discounted = ncf * factors
+        cumulative = np.cumsum(ncf, axis=1)
+        cumulative_discounted = np.cumsum(discounted, axis=1)
+        periods = np.arange(ncf.shape[1])
+
+        irr = CashFlowEngine.irr_analysis(ncf, periods)["irr"]
+        rows.update({
+            "net_cash_flow": ncf,
+            "discount_factors": factors,
+            "discounted": discounted,
+            "cumulative": cumulative,
+            "cumulative_discounted": cumulative_discounted,
+            "period_years": -(-periods // m),
+            "npv": CashFlowEngine.npv(ncf, factors),
+            "irr": (1.0 + irr) ** m - 1.0,
+            "pp": PeriodicCashFlow.payback(ncf, cumulative) / m,
+            "dpp": PeriodicCashFlow.payback(discounted, cumulative_discounted) / m,
+        })
+        return rows
+
+
+def aggregate_to_years(period_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Gộp bảng dòng tiền theo kỳ về theo năm: cộng các dòng tiền, lũy kế lấy giá trị cuối năm
+
+    Args:
+        period_df: Bảng từ FinancialCalculator.build_period_table (cột "Kỳ", "Năm" và các dòng tiền)
+    """
+    cumulative = [column for column in period_df.columns if "lũy kế" in column]
+    flows = [column for column in period_df.columns if column not in ("Kỳ", "Năm", *cumulative)]
+    grouped = period_df.groupby("Năm", sort=True)
+    return pd.concat([grouped[flows].sum(), grouped[cumulative].last()], axis=1).reset_index()
+
+
+def to_periodic_dicts(periodic: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Chỉ số theo kỳ theo định dạng metrics của ứng dụng (IRR theo %/năm, PP/DPP theo năm)"""
+    def value(x: float, scale: float = 1.0, missing: str = "Không thể tính") -> Any:
+        return float(x * scale) if np.isfinite(x) else missing
+
+    return [
+        {
+            "NPV": float(periodic["npv"][i]),
+            "IRR": value(periodic["irr"][i], 100),
+            "PP": value(periodic["pp"][i], missing="Không hoàn vốn"),
+            "DPP": value(periodic["dpp"][i], missing="Không hoàn vốn"),
+        }
+        for i in range(len(periodic["npv"]))
+    ]
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Module chọn danh mục dự án (0/1) tối đa tổng NPV trong giới hạn ngân sách nhiều kỳ
+
+Ràng buộc: vốn đầu tư của các dự án được chọn ở mỗi kỳ không vượt ngân sách kỳ đó, và mỗi
+nhóm loại trừ lẫn nhau chọn tối đa một dự án. Đối ngẫu Lagrange của các ràng buộc ngân sách
+(bằng giá trị quy hoạch tuyến tính nới lỏng, vì bài toán còn lại theo nhóm có nghiệm nguyên)
+cho giá bóng của từng kỳ, một cận trên dùng để cố định trước các dự án chắc chắn chọn/loại,
+và cận của thuật toán nhánh cận trên phần còn lại.
+"""
+
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from config import PORTFOLIO_MAX_NODES, PORTFOLIO_NEWTON_ITERATIONS, PORTFOLIO_TOLERANCE
+
+# Hệ số nhân giá bóng λ* dùng cho cận tại mỗi nút nhánh cận: dày quanh 1 vì ngân sách còn lại
+# ở hầu hết các nút chỉ lệch ít so với gốc
+PORTFOLIO_PRICE_MULTIPLIERS = np.concatenate([[0.0], np.geomspace(0.5, 2.0, 9), np.geomspace(0.97, 1.03, 41)])
+
+
+def group_indices(groups: Optional[Sequence[Optional[str]]], size: int) -> Tuple[np.ndarray, int]:
+    """
+    Chỉ số nhóm loại trừ của từng dự án; dự án không thuộc nhóm nào là một nhóm riêng
+
+    Returns:
+        (chỉ số nhóm shape (size,), số nhóm)
+    """
+    labels = {}
+    index = np.empty(size, dtype=int)
+    for i in range(size):
+        label = groups[i] if groups is not None else None
+        key = ("group", str(label).strip()) if label is not None and str(label).strip() else ("single", i)
+        index[i] = labels.setdefault(key, len(labels))
+    return index, len(labels)
+
+
+class PortfolioOptimizer:
+    """Bài toán chọn danh mục với chi phí đã quy về tỷ lệ ngân sách (ngân sách mỗi kỳ bằng 1)"""
+
+    @staticmethod
+    def lagrangian(values: np.ndarray, costs: np.ndarray, group_index: np.ndarray, n_groups: int,
+                   prices: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+        """
+        Hàm đối ngẫu L(λ) = Σ λ_t + Σ_nhóm max(0, max_i (v_i - λ·a_i))
+
+        Returns:
+            (L(λ), các dự án được chọn khi nới lỏng, subgradient 1 - Σ a_i của các dự án đó)
+        """
+        reduced = values - costs @ prices
+        best = np.zeros(n_groups)
+        np.maximum.at(best, group_index, reduced)
+        candidates = np.flatnonzero((reduced > 0) & (reduced >= best[group_index]))
+        _, first = np.unique(group_index[candidates], return_index=True)
+        chosen = candidates[first]
+        return float(prices.sum() + best.sum()), chosen, 1.0 - costs[chosen].sum(axis=0)
+
+    @staticmethod
+    def dual_prices(values: np.ndarray, costs: np.ndarray, group_index: np.ndarray, n_groups: int,
+                    lower_bound: float) -> Tuple[np.ndarray, float]:
+        """
+        Giá bóng λ ≥ 0 cực tiểu hóa L(λ)
+
+        Một kỳ ngân sách: chia đôi theo dấu subgradient (L lồi, tuyến tính từng khúc).
+        Nhiều kỳ: Newton trên hàm đối ngẫu đã làm trơn, giảm dần độ trơn về L(λ).
+
+        Returns:
+            (λ, L(λ))
+        """
+        periods = costs.shape[1]
+        prices = np.zeros(periods)
+        bound, _, gradient = PortfolioOptimizer.lagrangian(values, costs, group_index, n_groups, prices)
+        if periods == 0 or (gradient >= 0).all():
+            return prices, bound
+
+        if periods == 1:
+            cost = costs[:, 0]
+            low, high = 0.0, float(np.max(values[cost > 0] / cost[cost > 0]))
+            for _ in range(100):
+                middle = 0.5 * (low + high)
+                _, _, gradient = PortfolioOptimizer.lagrangian(
+                    values, costs, group_index, n_groups, np.array([middle]))
+                if gradient[0] < 0:
+                    low = middle
+                else:
+                    high = middle
+            candidates = [(PortfolioOptimizer.lagrangian(values, costs, group_index, n_groups,
+                                                         np.array([p]))[0], p) for p in (low, high)]
+            bound, price = min(candidates)
+            return np.array([price]), bound
+
+        # Làm trơn max bằng log-sum-exp với nhiệt độ τ giảm dần; mỗi mức giải bằng Newton có chiếu λ ≥ 0
+        best_prices = prices
+        scale = float(np.mean(values[values > 0])) if (values > 0).any() else 1.0
+        for tau in scale * np.logspace(0, -8, 9):
+            for _ in range(PORTFOLIO_NEWTON_ITERATIONS):
+                smooth, gradient, hessian = PortfolioOptimizer.smoothed_lagrangian(
+                    values, costs, group_index, n_groups, prices, tau)
+                free = (prices > 0) | (gradient < 0)
+                if not free.any():
+                    break
+                direction = np.zeros(periods)
+                block = hessian[np.ix_(free, free)] + 1e-12 * np.trace(hessian) * np.eye(free.sum())
+                direction[free] = -np.linalg.lstsq(block, gradient[free], rcond=None)[0]
+                decrement = -float(gradient @ direction)
+                if decrement <= PORTFOLIO_TOLERANCE * abs(smooth):
+                    break
+                step = 1.0
+                while step > 1e-10:
+                    trial = np.maximum(prices + step * direction, 0.0)
+                    if PortfolioOptimizer.smoothed_lagrangian(values, costs, group_index, n_groups, trial, tau)[0] \
+                            <= smooth - 1e-4 * step * decrement:
+                        break
+                    step *= 0.5
+                else:
+                    break
+                prices = trial
+                value = PortfolioOptimizer.lagrangian(values, costs, group_index, n_groups, prices)[0]
+                if value < bound:
+                    bound, best_prices = value, prices
+        return best_prices, bound
+
+    @staticmethod
+    def smoothed_lagrangian(values: np.ndarray, costs: np.ndarray, group_index: np.ndarray, n_groups: int,
+                            prices: np.ndarray, tau: float) -> Tuple[float, np.ndarray, np.ndarray]:
+        """
+        L_τ(λ) = Σ λ_t + Σ_nhóm τ·log(1 + Σ_i exp((v_i - λ·a_i) / τ)) ≥ L(λ), cùng gradient và Hessian theo λ
+        """
+        reduced = values - costs @ prices
+        peak = np.zeros(n_groups)
+        np.maximum.at(peak, group_index, reduced)
+        weights = np.exp((reduced - peak[group_index]) / tau)
+        partition = np.exp(-peak / tau) + np.bincount(group_index, weights, minlength=n_groups)
+        probability = weights / partition[group_index]
+
+        weighted = costs * probability[:, None]
+        group_costs = np.zeros((n_groups, costs.shape[1]))
+        np.add.at(group_costs, group_index, weighted)
+        gradient = 1.0 - weighted.sum(axis=0)
+        hessian = (costs.T @ weighted - group_costs.T @ group_costs) / tau
+        return float(prices.sum() + np.sum(peak + tau * np.log(partition))), gradient, hessian
+
+    @staticmethod
+    def greedy(values: np.ndarray, costs: np.ndarray, group_index: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Lời giải khả thi: duyệt dự án theo điểm giảm dần, chọn nếu còn đủ ngân sách và nhóm chưa có dự án"""
+        remaining = np.ones(costs.shape[1])
+        used = set()
+        selected = np.zeros(len(values), dtype=bool)
+        for i in np.argsort(-scores, kind="stable"):
+            if values[i] <= 0 or group_index[i] in used or (costs[i] > remaining).any():
+                continue
+            selected[i] = True
+            used.add(group_index[i])
+            remaining -= costs[i]
+        return selected
+
+    @staticmethod
+    def solve(values: np.ndarray, costs: np.ndarray, budgets: np.ndarray,
+              groups: Optional[Sequence[Optional[str]]] = None,
+              max_nodes: int = PORTFOLIO_MAX_NODES) -> Dict[str, Any]:
+        """
+        Chọn danh mục tối đa tổng giá trị
+
+        Args:
+            values: NPV của từng dự án, shape (n,)
+            costs: Vốn cần ở từng kỳ (>= 0), shape (n, số kỳ)
+            budgets: Ngân sách từng kỳ (> 0; np.inf nếu không giới hạn)
+            groups: Nhãn nhóm loại trừ của từng dự án (None/"" nếu độc lập)
+            max_nodes: Giới hạn số nút nhánh cận
+
+        Returns:
+            Dictionary "selected" (mảng bool), "value" (tổng NPV), "bound" (cận trên từ đối ngẫu),
+            "shadow_prices" (NPV tăng thêm trên 1 VNĐ ngân sách mỗi kỳ), "spent" (vốn dùng mỗi kỳ),
+            "optimal" (đã chứng minh tối ưu), "nodes" (số nút đã duyệt)
+        """
+        values = np.asarray(values, dtype=float)
+        costs = np.asarray(costs, dtype=float).reshape(len(values), -1)
+        budgets = np.asarray(budgets, dtype=float)
+        if (budgets <= 0).any():
+            raise ValueError("Ngân sách mỗi kỳ phải lớn hơn 0")
+        if (costs < 0).any():
+            raise ValueError("Vốn đầu tư của dự án không được âm")
+
+        group_index, n_groups = group_indices(groups, len(values))
+        limited = np.isfinite(budgets)
+        scaled = costs[:, limited] / budgets[limited]
+        tolerance = PORTFOLIO_TOLERANCE * max(1.0, float(np.abs(values[np.isfinite(values)]).sum()))
+
+        # Dự án NPV không dương hoặc một mình đã vượt ngân sách thì không bao giờ được chọn
+        eligible = (values > 0) & (scaled <= 1.0).all(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            efficiency = values / scaled.sum(axis=1)
+        selected = PortfolioOptimizer.greedy(values, scaled, group_index, np.where(eligible, efficiency, -np.inf))
+        lower_bound = float(values[selected].sum())
+
+        prices, bound = PortfolioOptimizer.dual_prices(
+            np.where(eligible, values, 0.0), scaled, group_index, n_groups, lower_bound)
+        reduced = np.where(eligible, values - scaled @ prices, -np.inf)
+        candidate = PortfolioOptimizer.greedy(values, scaled, group_index, reduced)
+        if values[candidate].sum() > lower_bound:
+            selected, lower_bound = candidate, float(values[candidate].sum())
+
+        # Cố định theo cận: ép chọn i cho cận L - max nhóm + r_i, ép loại i cho L - r_i + r của dự án tốt nhì
+        group_best = np.zeros(n_groups)
+        np.maximum.at(group_best, group_index, np.where(eligible, reduced, 0.0))
+        keep = eligible & (bound - group_best[group_index] + reduced >= lower_bound - tolerance)
+        candidates = np.flatnonzero(keep & (reduced > 0) & (reduced >= group_best[group_index]))
+        _, first = np.unique(group_index[candidates], return_index=True)
+        leader = np.zeros(len(values), dtype=bool)
+        leader[candidates[first]] = True
+        runner_up = np.zeros(n_groups)
+        np.maximum.at(runner_up, group_index, np.where(keep & ~leader, reduced, 0.0))
+        forced_items = np.flatnonzero(leader & (bound - reduced + runner_up[group_index] < lower_bound - tolerance))
+        forced_groups = set(group_index[forced_items].tolist())
+
+        base_value = float(values[forced_items].sum())
+        remaining = 1.0 - scaled[forced_items].sum(axis=0)
+        free = keep & ~np.isin(group_index, list(forced_groups))
+
+        # Nhánh cận theo nhóm: mỗi nhóm chọn một dự án hoặc không; cận = giá trị + λ·ngân sách còn lại
+        # + tổng max(0, r) của các nhóm chưa xét (hợp lệ với mọi λ ≥ 0)
+        options: Dict[int, List[int]] = {}
+        for i in np.flatnonzero(free)[np.argsort(-reduced[free], kind="stable")]:
+            options.setdefault(int(group_index[i]), []).append(int(i))
+        order = sorted(options, key=lambda g: -reduced[options[g][0]])
+
+        # Cận tại nút = min theo một lưới giá λ* x hệ số: ngân sách còn lại ít (nhiều) thì giá cao (thấp) cho cận chặt hơn
+        grid = prices[None, :] * PORTFOLIO_PRICE_MULTIPLIERS[:, None]
+        suffix = np.zeros((len(grid), len(order) + 1))
+        for depth, g in enumerate(order):
+            items = options[g]
+            suffix[:, depth] = np.maximum((values[items][:, None] - scaled[items] @ grid.T).max(axis=0), 0.0)
+        suffix = np.cumsum(suffix[:, ::-1], axis=1)[:, ::-1]
+
+        best_value, best_chain, improved = lower_bound, None, False
+        nodes, optimal = 0, True
+        stack = [(0, base_value, remaining, None)]
+        while stack:
+            depth, value, room, chain = stack.pop()
+            nodes += 1
+            if nodes > max_nodes:
+                optimal = False
+                break
+            # Mọi nút đều là một danh mục khả thi (các nhóm chưa xét không chọn gì)
+            if value > best_value + tolerance:
+                best_value, best_chain, improved = value, chain, True
+            if depth == len(order) or value + float(np.min(grid @ room + suffix[:, depth])) <= best_value + tolerance:
+                continue
+            stack.append((depth + 1, value, room, chain))
+            for i in reversed(options[order[depth]]):
+                if (scaled[i] <= room + 1e-12).all():
+                    stack.append((depth + 1, value + values[i], room - scaled[i], (i, chain)))
+
+        if improved:
+            selected = np.zeros(len(values), dtype=bool)
+            selected[forced_items] = True
+            while best_chain is not None:
+                selected[best_chain[0]] = True
+                best_chain = best_chain[1]
+
+        shadow_prices = np.zeros(len(budgets))
+        shadow_prices[limited] = prices / budgets[limited]
+        return {
+            "selected": selected,
+            "value": float(values[selected].sum()),
+            "bound": bound,
+            "shadow_prices": shadow_prices,
+            "spent": costs[selected].sum(axis=0),
+            "optimal": optimal,
+            "nodes": nodes,
+        }
+
+    @staticmethod
+    def optimize_projects(projects: Sequence[Dict[str, Any]], budgets: Sequence[float],
+                          groups: Optional[Sequence[Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        Chọn danh mục từ project_data: NPV theo CashFlowEngine, vốn cần mỗi kỳ là dòng "Đầu tư"
+        của bảng dòng tiền (năm 0 = vốn đầu tư ban đầu, các năm sau = đầu tư bổ sung)
+
+        Args:
+            projects: Danh sách project_data
+            budgets: Ngân sách năm 0, 1, ... (np.inf nếu không giới hạn); vốn các năm sau không bị giới hạn
+
+        Returns:
+            Kết quả PortfolioOptimizer.solve kèm "npv" và "costs" (vốn cần ở các kỳ có ngân sách)
+        """
+        batch = ProjectBatch(projects)
+        npv = CashFlowEngine.calculate_metrics(batch)["npv"]
+        periods = len(budgets)
+        costs = np.zeros((batch.size, periods))
+        span = min(periods, batch.capex.shape[1])
+        costs[:, :span] = batch.capex[:, :span]
+        result = PortfolioOptimizer.solve(np.nan_to_num(npv, nan=-np.inf), costs, np.asarray(budgets, dtype=float), groups)
+        return {**result, "npv": npv, "costs": costs}
+
+    @staticmethod
+    def select(items: Sequence[Dict[str, Any]], budgets: Sequence[float],
+               groups: Optional[Sequence[Optional[str]]] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Chọn danh mục cho các dự án {"name", "project_data"} (dùng chung cho giao diện và batch CLI)
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message), result gồm "names", "groups"
+            và các khóa của PortfolioOptimizer.optimize_projects
+        """
+        if not items:
+            return False, None, "Chưa có dự án nào để chọn"
+        if not budgets or any(b <= 0 for b in budgets):
+            return False, None, "Ngân sách mỗi năm phải lớn hơn 0"
+        try:
+            result = PortfolioOptimizer.optimize_projects([item["project_data"] for item in items], budgets, groups)
+        except (KeyError, TypeError, ValueError) as e:
+            return False, None, f"Không thể chọn danh mục: {str(e)}"
+        return True, {"names": [item["name"] for item in items], "groups": list(groups or [None] * len(items)),
+                      **result}, ""
+
+
+def to_portfolio_dataframe(result: Dict[str, Any]) -> pd.DataFrame:
+    """Bảng dự án: nhóm loại trừ, NPV, vốn cần từng năm có ngân sách và trạng thái được chọn"""
+    df = pd.DataFrame({
+        "Dự án": result["names"],
+        "Nhóm loại trừ": [g or "" for g in result["groups"]],
+        "NPV": result["npv"],
+    })
+    for year in range(result["costs"].shape[1]):
+        df[f"Vốn năm {year}"] = result["costs"][:, year]
+    df["Được chọn"] = result["selected"]
+    return df.sort_values(["Được chọn", "NPV"], ascending=False).reset_index(drop=True)
@@ -177,6 +177,7 @@ if uploaded_file is not None and api_key:
 
                     if st.form_submit_button("💾 Lưu thay đổi", type="primary", use_container_width=True):
                         st.session_state.project_data = {
+                            **p_data,  # Giữ các giả định theo năm (nếu có)
                             'von_dau_tu': von_dau_tu,
                             'dong_doi_du_an': dong_doi,
                             'doanh_thu_nam': doanh_thu,
@@ -211,9 +212,14 @@ if uploaded_file is not None and api_key:
                 st.session_state.cash_flow_df.style.format({
                     'Doanh thu': '{:,.0f}',
                     'Chi phí': '{:,.0f}',
+                    'Khấu hao': '{:,.0f}',
                     'Lợi nhuận trước thuế': '{:,.0f}',
+                    'Thu nhập chịu thuế': '{:,.0f}',
                     'Thuế TNDN': '{:,.0f}',
                     'Lợi nhuận sau thuế': '{:,.0f}',
+                    'Đầu tư': '{:,.0f}',
+                    'Vốn lưu động tăng thêm': '{:,.0f}',
+                    'Thanh lý': '{:,.0f}',
                     'Dòng tiền thuần (NCF)': '{:,.0f}',
                     'Dòng tiền chiết khấu': '{:,.0f}',
                     'Dòng tiền chiết khấu lũy kế': '{:,.0f}'
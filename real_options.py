@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Module định giá quyền chọn thực (từ bỏ, mở rộng, trì hoãn) bằng cây nhị phân tái hợp
+
+Tài sản cơ sở là giá trị hiện tại V0 của dòng tiền các năm 1..n (NPV + khoản chi năm 0).
+Mỗi năm dự án "trả cổ tức" bằng dòng tiền của năm đó, với tỷ lệ chi trả lấy từ dòng tiền
+kỳ vọng (cách tiếp cận Copeland - Antikarov), nên cây không có quyền chọn cho lại đúng V0.
+
+Quy nạp lùi chỉ giữ một vector giá trị cho mỗi cây (bộ nhớ O(số bước)), và mọi cây
+(dự án x giả định độ biến động) được tính cùng lúc trên ma trận numpy.
+"""
+
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from config import (
+    REAL_OPTION_ABANDON_RATIO,
+    REAL_OPTION_DEFER_YEARS,
+    REAL_OPTION_EXPAND_COST_RATIO,
+    REAL_OPTION_EXPAND_RATIO,
+    REAL_OPTION_RISK_FREE_RATE,
+    REAL_OPTION_STEPS_PER_YEAR,
+    REAL_OPTION_VOLATILITY,
+)
+
+# Loại quyền chọn -> tên hiển thị
+REAL_OPTION_TYPES = {
+    "abandon": "Từ bỏ",
+    "expand": "Mở rộng",
+    "defer": "Trì hoãn",
+}
+
+
+class RealOptionLattice:
+    """Cây nhị phân cho cả lô (mỗi hàng một cây) với cùng số bước mỗi năm"""
+
+    @staticmethod
+    def underlying(batch: ProjectBatch, results: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Tài sản cơ sở của từng dự án từ bảng dòng tiền đã tính
+
+        Tỷ lệ chi trả năm t = NCF_t / giá trị còn lại trước khi chi trả, kẹp trong [0, 1]
+        (dòng tiền âm giữa dòng đời không được coi là khoản chi trả âm).
+
+        Returns:
+            Dictionary "value" (V0), "investment" (khoản chi năm 0), "payout" (tỷ lệ chi trả
+            theo năm, shape (số dự án, H + 1), năm 0 bằng 0)
+        """
+        ncf = results["net_cash_flow"]
+        factors = results["discount_factors"]
+        discounted = np.where(batch.years[None, :] >= 1, ncf * factors, 0.0)
+        remaining = np.cumsum(discounted[:, ::-1], axis=1)[:, ::-1] / factors
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            payout = np.where(remaining > 0, np.clip(ncf / remaining, 0.0, 1.0), 1.0)
+        payout[:, 0] = 0.0
+        return {"value": remaining[:, 1] * factors[:, 1] if ncf.shape[1] > 1 else np.zeros(len(ncf)),
+                "investment": -ncf[:, 0], "payout": payout}
+
+    @staticmethod
+    def _parameters(volatility: np.ndarray, risk_free: float, steps_per_year: int) -> Tuple[np.ndarray, ...]:
+        """Hệ số tăng u, xác suất trung hòa rủi ro p và hệ số chiết khấu mỗi bước"""
+        dt = 1.0 / steps_per_year
+        u = np.exp(volatility * np.sqrt(dt))
+        d = 1.0 / u
+        growth = np.exp(risk_free * dt)
+        p = np.clip((growth - d) / (u - d), 0.0, 1.0)
+        return u, p, 1.0 / growth
+
+    @staticmethod
+    def _step_schedule(payout: np.ndarray, steps_per_year: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tỷ lệ chi trả và phần còn giữ lại trước chi trả tại từng bước (chi trả ở các mốc năm)
+
+        Returns:
+            (delta, retention): shape (số cây, số năm x steps_per_year + 1)
+        """
+        years = payout.shape[1] - 1
+        steps = np.arange(years * steps_per_year + 1)
+        boundary = steps % steps_per_year == 0
+        year_of_step = -(-steps // steps_per_year)  # ceil: năm của mốc chi trả kế tiếp
+        kept = np.concatenate([np.ones((len(payout), 1)), np.cumprod(1.0 - payout, axis=1)], axis=1)
+        retention = kept[:, year_of_step]
+        delta = np.where(boundary[None, :], payout[:, year_of_step], 0.0)
+        return delta, retention
+
+    @staticmethod
+    def _node_powers(u: np.ndarray, n_steps: int) -> np.ndarray:
+        """
+        u^(2j) cho j = 0..n_steps, shape (n_steps + 1, số cây): giá trị nút (k, j) = V0 x d^k x u^(2j)
+        nên vòng lặp không phải tính lũy thừa
+        """
+        return np.exp(2.0 * np.arange(n_steps + 1)[:, None] * np.log(u)[None, :])
+
+    @staticmethod
+    def _rollback(claim: np.ndarray, k: int, up: np.ndarray, down: np.ndarray) -> np.ndarray:
+        """Giá trị tiếp tục tại các nút của bước k: kỳ vọng trung hòa rủi ro đã chiết khấu của bước k + 1"""
+        continuation = claim[1:k + 2] * up
+        continuation += claim[:k + 1] * down
+        return continuation
+
+    @staticmethod
+    def value_operating(value: np.ndarray, payout: np.ndarray, lifespan: np.ndarray, volatility: np.ndarray,
+                        option: str, strike: np.ndarray, scale: Optional[np.ndarray] = None,
+                        end_strike: Optional[np.ndarray] = None,
+                        risk_free: float = REAL_OPTION_RISK_FREE_RATE / 100.0,
+                        steps_per_year: int = REAL_OPTION_STEPS_PER_YEAR) -> np.ndarray:
+        """
+        Giá trị dự án đang hoạt động kèm quyền từ bỏ hoặc mở rộng (kiểu Mỹ, trong suốt dòng đời)
+
+        - abandon: tại mỗi nút được đổi phần còn lại lấy giá trị thu hồi, giảm tuyến tính từ
+          `strike` (năm 0) về `end_strike` (cuối dòng đời, mặc định bằng `strike`)
+        - expand: tại mỗi nút được trả `strike` để nhân phần còn lại với (1 + scale)
+
+        Giá trị nút được lưu theo hàng (nút x cây) để mỗi bước lùi đọc các hàng liên tục.
+
+        Args:
+            value: V0 của từng cây
+            payout: Tỷ lệ chi trả theo năm, shape (số cây, số năm + 1)
+            lifespan: Dòng đời (năm) của từng cây, quyền chỉ thực hiện trước năm cuối
+            volatility: Độ biến động năm của V (tỷ lệ)
+
+        Returns:
+            Giá trị tại gốc (đã gồm mọi khoản chi trả), cùng đơn vị với V0
+        """
+        u, p, discount = RealOptionLattice._parameters(volatility, risk_free, steps_per_year)
+        delta, retention = RealOptionLattice._step_schedule(payout, steps_per_year)
+        n_steps = delta.shape[1] - 1
+        end_step = lifespan * steps_per_year
+        powers = RealOptionLattice._node_powers(u, n_steps)
+        up, down = discount * p, discount * (1.0 - p)
+        if end_strike is None:
+            end_strike = strike
+
+        claim = np.zeros((n_steps + 1, len(value)))
+        for k in range(n_steps, -1, -1):
+            if k == n_steps:
+                continuation = np.zeros((k + 1, len(value)))
+            else:
+                continuation = RealOptionLattice._rollback(claim, k, up, down)
+
+            # Giá trị nút chỉ cần ở mốc chi trả, hoặc khi quyền mở rộng phụ thuộc phần còn lại
+            paid = 0.0
+            if k % steps_per_year == 0 or option == "expand":
+                pre_payout = powers[:k + 1] * (value * u ** -k * retention[:, k])
+                paid = pre_payout * delta[:, k]
+                remaining = pre_payout - paid
+
+            if option == "abandon":
+                allowed = (k >= 1) & (k < end_step)
+                elapsed = np.minimum(k / np.maximum(end_step, 1), 1.0)
+                exercise = end_strike + (strike - end_strike) * (1.0 - elapsed)
+            else:
+                allowed = k < end_step
+                exercise = remaining * (1.0 + scale) - strike
+            if allowed.all():
+                decision = np.maximum(continuation, exercise, out=continuation)
+            else:
+                decision = np.where(allowed, np.maximum(continuation, exercise), continuation)
+            claim[:k + 1] = decision + paid
+        return claim[0]
+
+    @staticmethod
+    def value_defer(value: np.ndarray, investment: np.ndarray, first_payout: np.ndarray, years: np.ndarray,
+                    volatility: np.ndarray, risk_free: float = REAL_OPTION_RISK_FREE_RATE / 100.0,
+                    steps_per_year: int = REAL_OPTION_STEPS_PER_YEAR) -> np.ndarray:
+        """
+        Giá trị quyền được trì hoãn đầu tư tối đa `years` năm (quyền mua kiểu Mỹ trên V, giá thực hiện
+        là khoản chi năm 0); mỗi năm chờ mất đi dòng tiền năm đầu theo tỷ lệ `first_payout`
+
+        Returns:
+            Giá trị quyền tại gốc (>= max(V0 - I, 0))
+        """
+        u, p, discount = RealOptionLattice._parameters(volatility, risk_free, steps_per_year)
+        n_steps = int(np.max(years, initial=0)) * steps_per_year
+        last_step = years * steps_per_year
+        powers = RealOptionLattice._node_powers(u, n_steps)
+        up, down = discount * p, discount * (1.0 - p)
+
+        claim = np.zeros((n_steps + 1, len(value)))
+        for k in range(n_steps, -1, -1):
+            exercise = powers[:k + 1] * (value * u ** -k * (1.0 - first_payout) ** (k // steps_per_year)) - investment
+            if k == n_steps:
+                continuation = np.zeros_like(exercise)
+            else:
+                continuation = RealOptionLattice._rollback(claim, k, up, down)
+            # Sau hạn trì hoãn của cây thì không còn quyền chờ: giá trị là 0
+            claim[:k + 1] = np.where(k <= last_step, np.maximum(continuation, exercise), 0.0)
+        return claim[0]
+
+
+class RealOptionValuator:
+    """Định giá quyền chọn thực cho nhiều dự án và nhiều giả định độ biến động"""
+
+    @staticmethod
+    def default_parameters(project_data: Dict[str, Any]) -> Dict[str, float]:
+        """Tham số mặc định của các quyền chọn theo quy mô vốn đầu tư"""
+        investment = float(project_data['von_dau_tu'])
+        return {
+            "abandon_value": investment * REAL_OPTION_ABANDON_RATIO,
+            "expand_ratio": REAL_OPTION_EXPAND_RATIO,
+            "expand_cost": investment * REAL_OPTION_EXPAND_COST_RATIO,
+            "defer_years": REAL_OPTION_DEFER_YEARS,
+        }
+
+    @staticmethod
+    def analyze(projects: Sequence[Dict[str, Any]], volatilities: Sequence[float],
+                parameters: Optional[Sequence[Dict[str, float]]] = None,
+                risk_free: float = REAL_OPTION_RISK_FREE_RATE,
+                steps_per_year: int = REAL_OPTION_STEPS_PER_YEAR) -> Dict[str, np.ndarray]:
+        """
+        NPV tĩnh, NPV mở rộng (ENPV) và giá trị từng quyền chọn cho mọi cặp dự án x độ biến động
+
+        Args:
+            projects: Danh sách project_data
+            volatilities: Các giả định độ biến động năm của giá trị dự án (%)
+            parameters: Tham số quyền chọn cho từng dự án (mặc định RealOptionValuator.default_parameters):
+                "abandon_value" (VNĐ thu hồi khi từ bỏ ngay sau đầu tư, giảm tuyến tính về giá trị thanh lý
+                cuối dòng đời), "expand_ratio" (% tăng quy mô),
+                "expand_cost" (VNĐ chi phí mở rộng), "defer_years" (số năm tối đa được trì hoãn)
+            risk_free: Lãi suất phi rủi ro (%/năm)
+            steps_per_year: Số bước của cây trong một năm
+
+        Returns:
+            Dictionary "npv" (shape (số dự án,)) và với mỗi loại trong REAL_OPTION_TYPES:
+            "<loại>_enpv", "<loại>_value" shape (số dự án, số độ biến động); NaN nếu V0 <= 0
+        """
+        batch = ProjectBatch(projects)
+        results = CashFlowEngine.calculate_metrics(batch)
+        base = RealOptionLattice.underlying(batch, results)
+        parameters = parameters or [RealOptionValuator.default_parameters(p) for p in projects]
+
+        n, s = len(projects), len(volatilities)
+        # Mỗi cây là một cặp (dự án, độ biến động): lặp dự án theo từng độ biến động
+        rows = np.repeat(np.arange(n), s)
+        sigma = np.tile(np.asarray(volatilities, dtype=float) / 100.0, n)
+        value = base["value"][rows]
+        investment = base["investment"][rows]
+        payout = base["payout"][rows]
+        lifespan = batch.lifespan[rows]
+
+        def param(key: str) -> np.ndarray:
+            return np.array([float(parameters[i][key]) for i in rows])
+
+        rate = risk_free / 100.0
+        # Cây không có quyền chọn cho lại V0 x (1 - phần còn lại sau năm cuối) = V0 khi dòng tiền không âm
+        static = value * (1.0 - np.prod(1.0 - payout, axis=1))
+        abandon = RealOptionLattice.value_operating(
+            value, payout, lifespan, sigma, "abandon", param("abandon_value"), end_strike=batch.salvage[rows],
+            risk_free=rate, steps_per_year=steps_per_year
+        )
+        expand = RealOptionLattice.value_operating(
+            value, payout, lifespan, sigma, "expand", param("expand_cost"), param("expand_ratio") / 100.0,
+            risk_free=rate, steps_per_year=steps_per_year
+        )
+        defer = RealOptionLattice.value_defer(
+            value, investment, payout[:, 1], param("defer_years").astype(int), sigma,
+            risk_free=rate, steps_per_year=steps_per_year
+        )
+
+        npv = results["npv"]
+        valid = value > 0
+        output = {"npv": npv}
+        premiums = {
+            "abandon": abandon - static,
+            "expand": expand - static,
+            # Quyền trì hoãn thay thế việc đầu tư ngay: giá trị tăng thêm so với NPV hiện tại
+            "defer": defer - (static - investment),
+        }
+        for option, premium in premiums.items():
+            premium = np.where(valid, np.maximum(premium, 0.0), np.nan).reshape(n, s)
+            output[f"{option}_value"] = premium
+            output[f"{option}_enpv"] = npv[:, None] + premium
+        return output
+
+    @staticmethod
+    def analyze_project(project_data: Dict[str, Any], volatilities: Sequence[float] = (REAL_OPTION_VOLATILITY,),
+                        parameters: Optional[Dict[str, float]] = None,
+                        risk_free: float = REAL_OPTION_RISK_FREE_RATE) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Định giá quyền chọn thực cho một dự án
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message) với result gồm "npv" và
+            "<loại>_enpv", "<loại>_value" là mảng theo `volatilities`
+        """
+        if any(v <= 0 for v in volatilities):
+            return False, None, "Độ biến động phải lớn hơn 0"
+        try:
+            params = {**RealOptionValuator.default_parameters(project_data), **(parameters or {})}
+            result = RealOptionValuator.analyze([project_data], volatilities, [params], risk_free)
+        except (KeyError, TypeError, ValueError) as e:
+            return False, None, f"Không thể định giá quyền chọn thực: {str(e)}"
+
+        if not np.isfinite(result["abandon_value"]).all():
+            return False, None, "Giá trị hiện tại dòng tiền của dự án không dương, không thể định giá quyền chọn"
+        return True, {key: value[0] for key, value in result.items()}, ""
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Module tạo báo cáo phân tích dự án dạng HTML độc lập (và PDF nếu có trình duyệt headless)
+"""
+
+import html
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+from config import (
+    APP_TITLE,
+    REPORT_MAX_WORKERS,
+    REPORT_PLOTLY_BUNDLE,
+    REPORT_PDF_TIMEOUT,
+    REPORT_PDF_BROWSERS,
+)
+from financial_calculator import calculate_project_financials
+from utils import DataFormatter
+from visualizations import ProjectVisualizer
+
+# Thứ tự và tiêu đề các biểu đồ trong báo cáo (khóa của ProjectVisualizer.build_all_figures)
+REPORT_CHARTS = [
+    ("cash_flow", "Dòng tiền thuần theo năm"),
+    ("cumulative", "Dòng tiền lũy kế & thời điểm hoàn vốn"),
+    ("revenue_cost", "Doanh thu, chi phí & lợi nhuận"),
+    ("npv_gauge", "NPV"),
+    ("irr_wacc", "IRR so với WACC"),
+    ("structure", "Cấu trúc tài chính"),
+]
+
+PROJECT_FIELDS = [
+    ("von_dau_tu", "Vốn đầu tư", DataFormatter.format_currency),
+    ("dong_doi_du_an", "Dòng đời dự án", lambda v: f"{int(v)} năm"),
+    ("doanh_thu_nam", "Doanh thu/năm", DataFormatter.format_currency),
+    ("chi_phi_nam", "Chi phí/năm", DataFormatter.format_currency),
+    ("wacc", "WACC", lambda v: f"{float(v)}%"),
+    ("thue_suat", "Thuế suất", lambda v: f"{float(v)}%"),
+]
+
+_REPORT_CSS = """
+body { font-family: -apple-system, "Segoe UI", Roboto, Arial, sans-serif; margin: 2rem auto; max-width: 1100px; color: #222; }
+h1 { border-bottom: 3px solid #0066cc; padding-bottom: .5rem; }
+h2 { color: #0066cc; margin-top: 2rem; }
+table { border-collapse: collapse; width: 100%; font-size: .9rem; }
+th, td { border: 1px solid #ddd; padding: .4rem .6rem; text-align: right; }
+th { background: #f0f4fa; }
+td:first-child, th:first-child { text-align: left; }
+.metrics { display: flex; gap: 1rem; flex-wrap: wrap; }
+.metric { flex: 1; min-width: 180px; border: 1px solid #ddd; border-radius: 6px; padding: .8rem; }
+.metric .label { color: #666; font-size: .85rem; }
+.metric .value { font-size: 1.3rem; font-weight: 600; }
+.chart { page-break-inside: avoid; margin-bottom: 1.5rem; }
+.analysis { white-space: pre-wrap; background: #f7f9fc; border-left: 4px solid #0066cc; padding: 1rem; }
+.footer { color: #888; font-size: .8rem; margin-top: 3rem; text-align: center; }
+"""
+
+
+@lru_cache(maxsize=1)
+def get_plotly_bundle() -> str:
+    """Mã nguồn plotly.js đi kèm thư viện plotly (đọc một lần cho mỗi tiến trình)"""
+    return get_plotlyjs()
+
+
+def safe_filename(name: str) -> str:
+    """Tên file an toàn từ tên dự án (giữ chữ có dấu, thay ký tự đặc biệt bằng '_')"""
+    return re.sub(r"[^\w\-]+", "_", name, flags=re.UNICODE).strip("_") or "du_an"
+
+
+class ReportBuilder:
+    """Dựng nội dung HTML của một báo cáo từ kết quả tính toán và biểu đồ đã cache"""
+
+    @staticmethod
+    def _script_json(figure_json: str) -> str:
+        """Chèn JSON vào thẻ <script> an toàn (không để chuỗi '</' đóng thẻ sớm)"""
+        return figure_json.replace("</", "<\\/")
+
+    @staticmethod
+    def _project_table(project_data: Dict[str, Any]) -> str:
+        rows = []
+        for key, label, fmt in PROJECT_FIELDS:
+            value = project_data.get(key)
+            text = fmt(value) if value is not None else "-"
+            rows.append(f"<tr><td>{html.escape(label)}</td><td>{html.escape(text)}</td></tr>")
+        return "<table>" + "".join(rows) + "</table>"
+
+    @staticmethod
+    def _metrics_cards(metrics: Dict[str, Any]) -> str:
+        labels = {
+            "NPV": "💎 NPV", "IRR": "📈 IRR", "PP": "⏱️ PP", "DPP": "⌛ DPP",
+            "MIRR": "🔁 MIRR", "PI": "📐 PI", "EAA": "📅 EAA",
+        }
+        values = dict(metrics)
+        if metrics.get("FINANCING"):
+            labels.update({"APV": "🏦 APV", "NPV_VCSH": "👤 NPV vốn CSH", "IRR_VCSH": "👤 IRR vốn CSH"})
+            values.update(metrics["FINANCING"])
+        if metrics.get("INFLATION"):
+            labels.update({"IRR_THUC": "🏷️ IRR thực", "WACC_THUC": "🏷️ WACC thực"})
+            values.update(metrics["INFLATION"])
+        cards = []
+        for key, label in labels.items():
+            value = DataFormatter.format_metric_value(values.get(key, "-"), key)
+            cards.append(
+                f'<div class="metric"><div class="label">{label}</div>'
+                f'<div class="value">{html.escape(value)}</div></div>'
+            )
+        warning = ""
+        if metrics.get("IRR_AMBIGUOUS"):
+            roots = ", ".join(DataFormatter.format_percentage(r) for r in metrics["IRR_ROOTS"])
+            warning = (
+                f"<p>⚠️ Dòng tiền đổi dấu nhiều lần nên có nhiều IRR ({html.escape(roots)}); "
+                "nên đánh giá theo NPV hoặc MIRR.</p>"
+            )
+        return '<div class="metrics">' + "".join(cards) + "</div>" + warning
+
+    @staticmethod
+    def _cash_flow_table(cash_flow_df: pd.DataFrame) -> str:
+        formatters = {col: "{:,.0f}".format for col in cash_flow_df.columns if col != "Năm"}
+        return cash_flow_df.to_html(index=False, formatters=formatters, border=0)
+
+    @staticmethod
+    def build_html(name: str, project_data: Dict[str, Any], cash_flow_df: pd.DataFrame,
+                   metrics: Dict[str, Any], figures: Dict[str, Tuple[Any, str]],
+                   analysis: Optional[str] = None, plotly_src: Optional[str] = None) -> str:
+        """
+        Dựng báo cáo HTML
+
+        Args:
+            name: Tên dự án
+            project_data: Dictionary chứa thông tin dự án
+            cash_flow_df: DataFrame bảng dòng tiền
+            metrics: Dictionary chứa các chỉ số tài chính
+            figures: Dictionary tên biểu đồ -> (Figure, JSON) từ ProjectVisualizer.get_figures
+            analysis: Nhận định của AI (nếu có)
+            plotly_src: Đường dẫn tương đối tới plotly.js dùng chung; None thì nhúng trực tiếp
+
+        Returns:
+            Chuỗi HTML hoàn chỉnh
+        """
+        if plotly_src is None:
+            plotly_tag = f"<script>{get_plotly_bundle()}</script>"
+        else:
+            plotly_tag = f'<script src="{html.escape(plotly_src)}"></script>'
+
+        chart_blocks = []
+        for i, (key, title) in enumerate(REPORT_CHARTS):
+            if key not in figures:
+                continue
+            div_id = f"chart-{i}"
+            chart_blocks.append(
+                f'<div class="chart"><h3>{html.escape(title)}</h3><div id="{div_id}"></div>'
+                f"<script>(function(){{var f={ReportBuilder._script_json(figures[key][1])};"
+                f'Plotly.newPlot("{div_id}",f.data,f.layout,{{responsive:true,displaylogo:false}});}})();</script></div>'
+            )
+
+        analysis_block = ""
+        if analysis:
+            analysis_block = f'<h2>🤖 Nhận định từ AI</h2><div class="analysis">{html.escape(analysis)}</div>'
+
+        generated_at = datetime.now().strftime("%d/%m/%Y %H:%M")
+        return f"""<!DOCTYPE html>
+<html lang="vi">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(name)} - Báo cáo phân tích</title>
+<style>{_REPORT_CSS}</style>
+{plotly_tag}
+</head>
+<body>
+<h1>📑 {html.escape(name)}</h1>
+<h2>📊 Thông tin dự án</h2>
+{ReportBuilder._project_table(project_data)}
+<h2>📊 Các chỉ số đánh giá</h2>
+{ReportBuilder._metrics_cards(metrics)}
+<h2>💰 Bảng dòng tiền</h2>
+{ReportBuilder._cash_flow_table(cash_flow_df)}
+<h2>📈 Phân tích trực quan</h2>
+{"".join(chart_blocks)}
+{analysis_block}
+<p class="footer">{html.escape(APP_TITLE)} · Tạo lúc {generated_at}</p>
+</body>
+</html>
+"""
+
+
+class PdfRenderer:
+    """In HTML ra PDF bằng trình duyệt Chromium/Chrome headless cài sẵn trên máy"""
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def find_browser() -> Optional[str]:
+        """Đường dẫn trình duyệt headless hoặc None nếu máy không có"""
+        for name in REPORT_PDF_BROWSERS:
+            path = shutil.which(name)
+            if path:
+                return path
+        return None
+
+    @staticmethod
+    def available() -> bool:
+        return PdfRenderer.find_browser() is not None
+
+    @staticmethod
+    def render(html_path: str, pdf_path: str) -> Tuple[bool, str]:
+        """
+        In một file HTML ra PDF
+
+        Args:
+            html_path: File HTML (plotly.js phải nằm cạnh nếu dùng bản dùng chung)
+            pdf_path: File PDF đầu ra
+
+        Returns:
+            Tuple[bool, str]: (success, error_message)
+        """
+        browser = PdfRenderer.find_browser()
+        if browser is None:
+            return False, "Không tìm thấy trình duyệt headless để xuất PDF"
+
+        command = [
+            browser,
+            "--headless",
+            "--disable-gpu",
+            "--no-sandbox",
+            "--allow-file-access-from-files",
+            "--run-all-compositor-stages-before-draw",
+            "--virtual-time-budget=10000",
+            "--no-pdf-header-footer",
+            f"--print-to-pdf={pdf_path}",
+            "file://" + os.path.abspath(html_path),
+        ]
+        try:
+            subprocess.run(command, capture_output=True, timeout=REPORT_PDF_TIMEOUT, check=True)
+        except subprocess.TimeoutExpired:
+            return False, f"Xuất PDF vượt quá {REPORT_PDF_TIMEOUT} giây"
+        except (OSError, subprocess.CalledProcessError) as e:
+            return False, f"Lỗi khi xuất PDF: {e}"
+        if not os.path.exists(pdf_path):
+            return False, "Trình duyệt không tạo được file PDF"
+        return True, ""
+
+
+class ReportGenerator:
+    """Tạo báo cáo cho một hoặc nhiều dự án"""
+
+    @staticmethod
+    def prepare(project: Dict[str, Any], ai_service=None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Tính toán, lấy biểu đồ (cache) và nhận định AI cho một dự án
+
+        Args:
+            project: {"name": ..., "project_data": {...}, "analysis": (tùy chọn)}
+            ai_service: GeminiAIService để lấy nhận định nếu dự án chưa có
+                (kết quả đã phân tích trước đó được trả về từ cache)
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, nội dung báo cáo, error_message)
+        """
+        project_data = project["project_data"]
+        cash_flow_df, metrics, error_msg = calculate_project_financials(project_data)
+        if cash_flow_df is None:
+            return False, None, error_msg
+
+        analysis = project.get("analysis")
+        if not analysis and ai_service is not None:
+            success, analysis, _ = ai_service.analyze_metrics(metrics, project_data)
+            if not success:
+                analysis = None
+
+        return True, {
+            "name": project["name"],
+            "project_data": project_data,
+            "cash_flow_df": cash_flow_df,
+            "metrics": metrics,
+            "figures": ProjectVisualizer.get_figures(cash_flow_df, metrics, project_data),
+            "analysis": analysis,
+        }, ""
+
+    @staticmethod
+    def build_html(content: Dict[str, Any], plotly_src: Optional[str] = None) -> str:
+        return ReportBuilder.build_html(
+            content["name"],
+            content["project_data"],
+            content["cash_flow_df"],
+            content["metrics"],
+            content["figures"],
+            content["analysis"],
+            plotly_src
+        )
+
+    @staticmethod
+    def generate_html(project: Dict[str, Any], ai_service=None) -> Tuple[bool, Optional[str], str]:
+        """Báo cáo HTML độc lập (nhúng plotly.js) cho một dự án"""
+        success, content, error_msg = ReportGenerator.prepare(project, ai_service)
+        if not success:
+            return False, None, error_msg
+        return True, ReportGenerator.build_html(content), ""
+
+    @staticmethod
+    def generate_pdf(project: Dict[str, Any], ai_service=None) -> Tuple[bool, Optional[bytes], str]:
+        """Báo cáo PDF cho một dự án"""
+        success, content, error_msg = ReportGenerator.prepare(project, ai_service)
+        if not success:
+            return False, None, error_msg
+
+        with tempfile.TemporaryDirectory() as workdir:
+            html_path = os.path.join(workdir, "report.html")
+            pdf_path = os.path.join(workdir, "report.pdf")
+            with open(html_path, "w", encoding="utf-8") as f:
+                f.write(ReportGenerator.build_html(content))
+            success, error_msg = PdfRenderer.render(html_path, pdf_path)
+            if not success:
+                return False, None, error_msg
+            with open(pdf_path, "rb") as f:
+                return True, f.read(), ""
+
+    @staticmethod
+    def _index_html(entries: List[Tuple[str, str, Dict[str, Any]]]) -> str:
+        rows = []
+        for name, filename, metrics in entries:
+            cells = "".join(
+                f"<td>{html.escape(DataFormatter.format_metric_value(metrics.get(k), k))}</td>"
+                for k in ("NPV", "IRR", "PP", "DPP")
+            )
+            rows.append(f'<tr><td><a href="{html.escape(filename)}">{html.escape(name)}</a></td>{cells}</tr>')
+        return f"""<!DOCTYPE html>
+<html lang="vi">
+<head><meta charset="utf-8"><title>Danh sách báo cáo</title><style>{_REPORT_CSS}</style></head>
+<body>
+<h1>📑 Danh sách báo cáo ({len(entries)} dự án)</h1>
+<table><tr><th>Dự án</th><th>NPV</th><th>IRR</th><th>PP</th><th>DPP</th></tr>{"".join(rows)}</table>
+</body>
+</html>
+"""
+
+    @staticmethod
+    def generate_batch(projects: List[Dict[str, Any]], ai_service=None, include_pdf: bool = False,
+                       max_workers: int = REPORT_MAX_WORKERS) -> Tuple[bytes, Dict[str, str]]:
+        """
+        Tạo báo cáo song song cho cả lô và đóng gói thành file zip
+
+        plotly.js chỉ được đưa vào file zip một lần (REPORT_PLOTLY_BUNDLE), các báo cáo
+        HTML tham chiếu tới file dùng chung này thay vì mỗi báo cáo nhúng một bản.
+
+        Args:
+            projects: Danh sách {"name": ..., "project_data": {...}, "analysis": (tùy chọn)}
+            ai_service: GeminiAIService để lấy nhận định cho dự án chưa có (tùy chọn)
+            include_pdf: Xuất thêm PDF nếu có trình duyệt headless
+            max_workers: Số báo cáo xử lý đồng thời
+
+        Returns:
+            Tuple[bytes, Dict]: (nội dung file zip, tên dự án -> lỗi của các dự án thất bại)
+        """
+        filenames = [f"{i + 1:02d}_{safe_filename(p['name'])}" for i, p in enumerate(projects)]
+        render_pdf = include_pdf and PdfRenderer.available()
+
+        with tempfile.TemporaryDirectory() as workdir:
+            bundle_path = os.path.join(workdir, REPORT_PLOTLY_BUNDLE)
+            with open(bundle_path, "w", encoding="utf-8") as f:
+                f.write(get_plotly_bundle())
+
+            def build_one(index: int) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+                project = projects[index]
+                success, content, error_msg = ReportGenerator.prepare(project, ai_service)
+                if not success:
+                    return False, None, error_msg
+
+                html_path = os.path.join(workdir, filenames[index] + ".html")
+                with open(html_path, "w", encoding="utf-8") as f:
+                    f.write(ReportGenerator.build_html(content, plotly_src=REPORT_PLOTLY_BUNDLE))
+
+                if render_pdf:
+                    success, error_msg = PdfRenderer.render(html_path, html_path[:-5] + ".pdf")
+                    if not success:
+                        return False, content, error_msg
+                return True, content, ""
+
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report") as executor:
+                results = list(executor.map(build_one, range(len(projects))))
+
+            failures: Dict[str, str] = {}
+            index_entries = []
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.write(bundle_path, REPORT_PLOTLY_BUNDLE)
+                for filename, project, (success, content, error_msg) in zip(filenames, projects, results):
+                    if not success:
+                        failures[project["name"]] = error_msg
+                    if content is None:
+                        continue
+                    archive.write(os.path.join(workdir, filename + ".html"), filename + ".html")
+                    pdf_path = os.path.join(workdir, filename + ".pdf")
+                    if os.path.exists(pdf_path):
+                        archive.write(pdf_path, filename + ".pdf")
+                    index_entries.append((project["name"], filename + ".html", content["metrics"]))
+
+                archive.writestr("index.html", ReportGenerator._index_html(index_entries))
+                notes = [f"{name}: {error}" for name, error in failures.items()]
+                if include_pdf and not render_pdf:
+                    notes.append("PDF: Không tìm thấy trình duyệt headless, chỉ xuất HTML")
+                if notes:
+                    archive.writestr("errors.txt", "\n".join(notes))
+
+        return buffer.getvalue(), failures
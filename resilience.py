@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Module kiểm soát thời hạn, hủy, gửi kép (hedged request) và gộp request trùng cho các lời gọi API
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import streamlit as st
+
+from config import (
+    GEMINI_HEDGE_BUDGET_RATIO,
+    GEMINI_HEDGE_MIN_SAMPLES,
+    GEMINI_HEDGE_PERCENTILE,
+    LATENCY_WINDOW_SIZE,
+    REQUEST_MAX_WORKERS,
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Lời gọi vượt quá thời hạn cho phép"""
+
+
+class RequestCancelled(Exception):
+    """Lời gọi bị hủy chủ động"""
+
+
+class Deadline:
+    """Thời hạn cho một lời gọi logic (bao gồm cả các lần retry) kèm cờ hủy"""
+
+    def __init__(self, timeout: float):
+        """
+        Args:
+            timeout: Thời gian tối đa (giây) tính từ lúc khởi tạo
+        """
+        self.timeout = timeout
+        self._expires_at = time.monotonic() + timeout
+        self._cancel_event = threading.Event()
+
+    def remaining(self) -> float:
+        """Số giây còn lại trước khi hết hạn"""
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """Yêu cầu dừng lời gọi ở điểm kiểm tra kế tiếp"""
+        self._cancel_event.set()
+
+    def check(self):
+        """Raise nếu lời gọi đã bị hủy hoặc hết hạn"""
+        if self.cancelled:
+            raise RequestCancelled()
+        if self.expired():
+            raise DeadlineExceeded()
+
+    def sleep(self, seconds: float):
+        """Ngủ có thể bị ngắt bởi hủy; raise nếu thời hạn không đủ để chờ"""
+        if seconds >= self.remaining():
+            raise DeadlineExceeded()
+        self._cancel_event.wait(seconds)
+        self.check()
+
+
+class LatencyTracker:
+    """Theo dõi độ trễ theo từng loại lời gọi và ngân sách gửi kép"""
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE):
+        self._window_size = window_size
+        self._samples: Dict[str, deque] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _counter(self, call_type: str) -> Dict[str, int]:
+        return self._counters.setdefault(
+            call_type, {"requests": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0}
+        )
+
+    def record(self, call_type: str, seconds: float, hedge_won: bool = False):
+        """Ghi nhận một lời gọi thành công"""
+        with self._lock:
+            self._samples.setdefault(call_type, deque(maxlen=self._window_size)).append(seconds)
+            if hedge_won:
+                self._counter(call_type)["hedge_wins"] += 1
+
+    def record_request(self, call_type: str):
+        with self._lock:
+            self._counter(call_type)["requests"] += 1
+
+    def record_timeout(self, call_type: str):
+        with self._lock:
+            self._counter(call_type)["timeouts"] += 1
+
+    def percentile(self, call_type: str, q: float) -> Optional[float]:
+        """Phân vị độ trễ (giây) hoặc None nếu chưa có dữ liệu"""
+        with self._lock:
+            samples = list(self._samples.get(call_type, ()))
+        if not samples:
+            return None
+        return float(np.percentile(samples, q))
+
+    def hedge_delay(self, call_type: str) -> Optional[float]:
+        """Thời điểm gửi request thứ hai (p95), None nếu chưa đủ mẫu"""
+        with self._lock:
+            n_samples = len(self._samples.get(call_type, ()))
+        if n_samples < GEMINI_HEDGE_MIN_SAMPLES:
+            return None
+        return self.percentile(call_type, GEMINI_HEDGE_PERCENTILE)
+
+    def can_hedge(self, call_type: str) -> bool:
+        """Kiểm tra tỷ lệ request gửi kép vẫn nằm trong ngân sách"""
+        with self._lock:
+            counter = self._counter(call_type)
+            return counter["hedges"] + 1 <= GEMINI_HEDGE_BUDGET_RATIO * counter["requests"]
+
+    def record_hedge(self, call_type: str):
+        with self._lock:
+            self._counter(call_type)["hedges"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Thống kê p50/p95/p99 và bộ đếm cho từng loại lời gọi"""
+        with self._lock:
+            call_types = set(self._samples) | set(self._counters)
+        stats = {}
+        for call_type in sorted(call_types):
+            stats[call_type] = {
+                "p50": self.percentile(call_type, 50),
+                "p95": self.percentile(call_type, 95),
+                "p99": self.percentile(call_type, 99),
+                **self._counter(call_type),
+            }
+        return stats
+
+
+@st.cache_resource
+def get_latency_tracker() -> LatencyTracker:
+    """Latency tracker dùng chung cho mọi session"""
+    return LatencyTracker()
+
+
+@st.cache_resource
+def get_request_executor() -> ThreadPoolExecutor:
+    """Thread pool riêng cho các lời gọi API có thời hạn"""
+    return ThreadPoolExecutor(max_workers=REQUEST_MAX_WORKERS, thread_name_prefix="api-call")
+
+
+class _InFlightCall:
+    """Một lời gọi đang chạy mà các request giống hệt có thể chờ chung"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Gộp các request giống hệt đang chạy đồng thời thành một lời gọi duy nhất"""
+
+    def __init__(self):
+        self._in_flight: Dict[str, _InFlightCall] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any], deadline: Deadline) -> Any:
+        """
+        Thực thi `fn` hoặc chờ lời gọi đang chạy có cùng key
+
+        Args:
+            key: Khóa định danh request (ví dụ hash của prompt)
+            fn: Hàm không tham số thực hiện lời gọi
+            deadline: Thời hạn và cờ hủy của người gọi hiện tại
+
+        Returns:
+            Kết quả chung của lời gọi; lỗi của lời gọi được raise cho mọi người chờ, trừ hủy hoặc hết hạn
+            của riêng người khởi tạo (người chờ còn thời hạn sẽ gửi lại)
+        """
+        while True:
+            with self._lock:
+                call = self._in_flight.get(key)
+                is_leader = call is None
+                if is_leader:
+                    call = _InFlightCall()
+                    self._in_flight[key] = call
+                    self.stats["calls"] += 1
+                else:
+                    self.stats["coalesced"] += 1
+
+            if is_leader:
+                try:
+                    call.result = fn()
+                except BaseException as e:
+                    call.error = e
+                finally:
+                    with self._lock:
+                        del self._in_flight[key]
+                    call.done.set()
+            else:
+                while not call.done.wait(min(deadline.remaining(), 0.5)):
+                    deadline.check()
+
+            if isinstance(call.error, RequestCancelled) and not is_leader and not deadline.cancelled:
+                # Người khởi tạo đã hủy nhưng người gọi này vẫn cần kết quả: gửi lại
+                continue
+            if isinstance(call.error, DeadlineExceeded) and not is_leader and not deadline.expired():
+                # Người khởi tạo hết thời hạn nhưng người gọi này vẫn còn thời gian: gửi lại
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    """Bộ gộp request dùng chung cho mọi session"""
+    return SingleFlight()
+
+
+def _timed(fn: Callable[[], Any]):
+    start = time.monotonic()
+    result = fn()
+    return result, time.monotonic() - start
+
+
+def call_with_deadline(fn: Callable[[], Any], call_type: str, deadline: Deadline,
+                       hedge: bool = True, try_acquire_hedge: Optional[Callable[[], bool]] = None) -> Any:
+    """
+    Thực thi `fn` với thời hạn, hỗ trợ hủy và gửi kép khi vượt p95
+
+    Args:
+        fn: Hàm không tham số thực hiện lời gọi
+        call_type: Loại lời gọi để theo dõi độ trễ ("extract", "analyze", ...)
+        deadline: Thời hạn và cờ hủy của lời gọi
+        hedge: Cho phép gửi request thứ hai khi request đầu chậm
+        try_acquire_hedge: Hàm lấy lượt từ rate limiter cho request thứ hai (không chờ)
+
+    Returns:
+        Kết quả của lần thực thi hoàn thành sớm nhất
+    """
+    tracker = get_latency_tracker()
+    executor = get_request_executor()
+    tracker.record_request(call_type)
+
+    start = time.monotonic()
+    primary = executor.submit(_timed, fn)
+    pending = {primary}
+    hedge_delay = tracker.hedge_delay(call_type) if hedge else None
+    last_error: Optional[BaseException] = None
+
+    try:
+        while pending:
+            if deadline.cancelled:
+                raise RequestCancelled()
+            if deadline.expired():
+                tracker.record_timeout(call_type)
+                raise DeadlineExceeded()
+
+            # Thức dậy định kỳ để kiểm tra cờ hủy và thời điểm hedge
+            wait_for = min(deadline.remaining(), 0.5)
+            if hedge_delay is not None:
+                wait_for = min(wait_for, max(0.0, start + hedge_delay - time.monotonic()))
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                tracker.record(call_type, elapsed, hedge_won=future is not primary)
+                return result
+
+            if not pending:
+                break
+
+            if hedge_delay is not None and time.monotonic() - start >= hedge_delay:
+                # Chỉ cân nhắc gửi kép một lần cho mỗi lời gọi
+                hedge_delay = None
+                if tracker.can_hedge(call_type) and (try_acquire_hedge is None or try_acquire_hedge()):
+                    tracker.record_hedge(call_type)
+                    pending.add(executor.submit(_timed, fn))
+    finally:
+        # Request còn lại không dừng được giữa chừng, chỉ bỏ qua kết quả
+        for future in pending:
+            future.cancel()
+
+    raise last_error
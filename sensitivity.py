@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Module độ nhạy giải tích: đạo hàm NPV/IRR theo từng đầu vào, duration và convexity
+
+Đạo hàm được lan truyền thuận (forward-mode) qua các dòng của bảng dòng tiền đã tính sẵn,
+nên không cần tính lại mô hình cho từng đầu vào như phương pháp sai phân.
+"""
+
+from typing import Dict, Any, List
+
+import numpy as np
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from discounting import discount_derivative_matrices, discount_factor_matrix
+
+# Đầu vào liên tục -> tên hiển thị (wacc và thue_suat tính theo mỗi điểm %)
+SENSITIVITY_FIELDS = {
+    "von_dau_tu": "Vốn đầu tư",
+    "doanh_thu_nam": "Doanh thu/năm",
+    "chi_phi_nam": "Chi phí/năm",
+    "wacc": "WACC",
+    "thue_suat": "Thuế suất",
+}
+LIFESPAN_FIELD = "dong_doi_du_an"
+
+
+class SensitivityKernel:
+    """Tính độ nhạy cho cả lô dự án từ kết quả của CashFlowEngine.calculate_metrics"""
+
+    @staticmethod
+    def _clip(value: np.ndarray, slope: np.ndarray, low: np.ndarray, d_low: np.ndarray,
+              high: np.ndarray, d_high: np.ndarray):
+        """Hàm kẹp clip(value, low, high) trên cặp (giá trị, đạo hàm); chạm cận dưới được ưu tiên"""
+        below = value <= low
+        above = ~below & (value >= high)
+        clipped = np.where(below, low, np.where(above, high, value))
+        d_clipped = np.where(below, d_low, np.where(above, d_high, slope))
+        return clipped, d_clipped
+
+    @staticmethod
+    def _taxable_tangent(batch: ProjectBatch, income: np.ndarray, d_income: np.ndarray) -> np.ndarray:
+        """
+        Đạo hàm thu nhập chịu thuế theo các hướng của lợi nhuận trước thuế
+
+        Không chuyển lỗ: 1[lợi nhuận > 0]. Có chuyển lỗ: cùng phép quét tiền tố trên các hàm kẹp
+        R_t = clip(R_{t-1} - x_t, 0, W_t) như CashFlowEngine.loss_pool, nhưng mỗi tham số của hàm kẹp
+        mang theo cặp (giá trị, đạo hàm) nên đạo hàm lỗ sẵn có ra cùng lượt quét.
+
+        Args:
+            income: Lợi nhuận trước thuế, shape (số dự án, số năm)
+            d_income: Đạo hàm theo từng hướng, shape (số hướng, số dự án, số năm)
+        """
+        d_taxable = np.where(income > 0, d_income, 0.0)
+        rows = np.nonzero(batch.loss_carryforward_years > 0)[0]
+        if rows.size == 0:
+            return d_taxable
+
+        x = income[rows]
+        dx = d_income[:, rows]
+        expiry = batch.loss_carryforward_years[rows]
+        width = x.shape[1]
+
+        # W_t và đạo hàm: tổng lỗ trong cửa sổ còn hạn
+        losses = np.maximum(-x, 0.0)
+        d_losses = np.where(x < 0, -dx, 0.0)
+        cumulative = np.cumsum(losses, axis=1)
+        d_cumulative = np.cumsum(d_losses, axis=2)
+        start = np.arange(width)[None, :] - expiry[:, None]
+        clipped = np.clip(start, 0, width - 1)
+        valid = start >= 0
+        window = cumulative - np.where(valid, np.take_along_axis(cumulative, clipped, axis=1), 0.0)
+        d_window = d_cumulative - np.where(
+            valid, np.take_along_axis(d_cumulative, np.broadcast_to(clipped, d_cumulative.shape), axis=2), 0.0
+        )
+
+        clip = SensitivityKernel._clip
+        shift_c, d_shift_c = -x, -dx
+        low, d_low = np.zeros_like(x), np.zeros_like(dx)
+        high, d_high = window, d_window
+        shift = 1
+        while shift < width:
+            c1, lo1, hi1 = shift_c[..., :-shift], low[..., :-shift], high[..., :-shift]
+            c2, lo2, hi2 = shift_c[..., shift:], low[..., shift:], high[..., shift:]
+            dc1, dlo1, dhi1 = d_shift_c[..., :-shift], d_low[..., :-shift], d_high[..., :-shift]
+            dc2, dlo2, dhi2 = d_shift_c[..., shift:], d_low[..., shift:], d_high[..., shift:]
+            combined_lo, d_combined_lo = clip(lo1 + c2, dlo1 + dc2, lo2, dlo2, hi2, dhi2)
+            combined_hi, d_combined_hi = clip(hi1 + c2, dhi1 + dc2, lo2, dlo2, hi2, dhi2)
+            shift_c = np.concatenate([shift_c[..., :shift], c1 + c2], axis=-1)
+            d_shift_c = np.concatenate([d_shift_c[..., :shift], dc1 + dc2], axis=-1)
+            low = np.concatenate([low[..., :shift], combined_lo], axis=-1)
+            d_low = np.concatenate([d_low[..., :shift], d_combined_lo], axis=-1)
+            high = np.concatenate([high[..., :shift], combined_hi], axis=-1)
+            d_high = np.concatenate([d_high[..., :shift], d_combined_hi], axis=-1)
+            shift *= 2
+
+        # Lỗ còn chuyển sau mỗi năm (bắt đầu từ 0) rồi lùi một năm thành lỗ sẵn có trước mỗi năm
+        pool, d_pool = clip(shift_c, d_shift_c, low, d_low, high, d_high)
+        pool = np.concatenate([np.zeros((len(rows), 1)), pool[:, :-1]], axis=1)
+        d_pool = np.concatenate([np.zeros(dx.shape[:2] + (1,)), d_pool[..., :-1]], axis=-1)
+
+        d_taxable[:, rows] = np.where(x - pool > 0, dx - d_pool, 0.0)
+        return d_taxable
+
+    @staticmethod
+    def cash_flow_tangents(batch: ProjectBatch, flows: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Đạo hàm dòng tiền thuần theo von_dau_tu, doanh_thu_nam, chi_phi_nam, wacc, thue_suat
+
+        Returns:
+            Mảng shape (5, số dự án, số năm) theo thứ tự SENSITIVITY_FIELDS (wacc luôn bằng 0
+            vì chỉ ảnh hưởng hệ số chiết khấu)
+        """
+        n, width = flows["net_cash_flow"].shape
+        mask = batch.operating_mask
+        zeros = np.zeros((n, width))
+
+        # Hướng vốn đầu tư: đầu tư năm 0, khấu hao của lớp tài sản năm 0 và lãi/lỗ thanh lý
+        d_capex = zeros.copy()
+        d_capex[:, 0] = 1.0
+        d_depreciation = np.where(mask, CashFlowEngine.depreciation_rates(batch), 0.0)
+        end_of_life = (batch.years[None, :] == batch.lifespan[:, None]) & (batch.depreciation_method[:, None] > 0)
+        d_gain = np.where(end_of_life, -np.cumsum(d_capex - d_depreciation, axis=1), 0.0)
+
+        d_revenue = np.stack([zeros, batch.revenue_scale, zeros, zeros, zeros])
+        d_costs = np.stack([zeros, zeros, batch.cost_scale, zeros, zeros])
+        d_capex_all = np.stack([d_capex, zeros, zeros, zeros, zeros])
+        d_income = d_revenue - d_costs - np.stack([d_depreciation - d_gain, zeros, zeros, zeros, zeros])
+
+        d_taxable = SensitivityKernel._taxable_tangent(batch, flows["profit_before_tax"], d_income)
+        d_tax = d_taxable * batch.tax_rate[None, :, None]
+        d_tax[4] += flows["taxable_income"] / 100.0
+
+        next_revenue = np.concatenate([d_revenue[:, :, 1:], np.zeros((5, n, 1))], axis=2)
+        d_working_capital = np.diff(batch.working_capital_rate[None, :, None] * next_revenue, axis=2, prepend=0.0)
+
+        return d_revenue - d_costs - d_tax - d_capex_all - d_working_capital
+
+    @staticmethod
+    def lifespan_marginal(batch: ProjectBatch, flows: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Xấp xỉ NPV tăng thêm khi kéo dài dự án một năm: thêm một năm hoạt động như năm cuối
+        và lùi các khoản cuối dự án (thanh lý, thu hồi vốn lưu động) thêm một năm
+        """
+        rows = np.arange(batch.size)
+        last = batch.lifespan
+        margin = flows["revenue"][rows, last] - flows["costs"][rows, last]
+        taxable = np.maximum(margin - flows["depreciation"][rows, last], 0.0)
+        operating = margin - batch.tax_rate * taxable
+        terminal = flows["salvage"][rows, last] - flows["working_capital"][rows, last]
+
+        factor_last = flows["discount_factors"][rows, last]
+        factor_next = discount_factor_matrix(batch.curve_keys, batch.horizon + 1)[rows, last + 1]
+        return operating * factor_next + terminal * (factor_next - factor_last)
+
+    @staticmethod
+    def compute(batch: ProjectBatch, results: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Độ nhạy của cả lô trong một lượt vector hóa
+
+        Args:
+            batch: Lô dự án
+            results: Kết quả của CashFlowEngine.calculate_metrics(batch)
+
+        Returns:
+            Dictionary:
+            - "d_npv": shape (5, số dự án), dNPV theo từng đầu vào (mỗi VNĐ / mỗi điểm %)
+            - "d_irr": shape (5, số dự án), dIRR (điểm %) theo từng đầu vào, NaN nếu không có IRR
+            - "d_npv_lifespan": NPV tăng thêm (xấp xỉ) khi thêm một năm dòng đời
+            - "macaulay_duration", "modified_duration", "convexity": của dòng tiền năm 1..n
+              theo dịch chuyển song song đường cong chiết khấu (NaN nếu giá trị hiện tại <= 0)
+        """
+        ncf = results["net_cash_flow"]
+        factors = results["discount_factors"]
+        d_factors, dd_factors = discount_derivative_matrices(batch.curve_keys, batch.horizon)
+        tangents = SensitivityKernel.cash_flow_tangents(batch, results)
+
+        d_npv = np.einsum("kij,ij->ki", tangents, factors)
+        d_npv[3] = np.einsum("ij,ij->i", ncf, d_factors) / 100.0
+
+        # IRR: định lý hàm ẩn trên NPV(IRR; x) = 0
+        irr = results["irr"]
+        t = batch.years[None, :].astype(float)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            irr_factors = (1.0 + irr[:, None]) ** -t
+            slope = np.sum(-t * ncf * irr_factors / (1.0 + irr[:, None]), axis=1)
+            d_irr = -100.0 * np.einsum("kij,ij->ki", tangents, irr_factors) / slope
+        d_irr[3] = 0.0
+        d_irr = np.where(np.isfinite(irr) & (slope != 0), d_irr, np.nan)
+
+        # Duration và convexity của dòng tiền sau đầu tư ban đầu
+        inflows = np.where(t >= 1, ncf, 0.0)
+        present_value = np.einsum("ij,ij->i", inflows, factors)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            macaulay = np.einsum("ij,ij->i", inflows * t, factors) / present_value
+            modified = -np.einsum("ij,ij->i", inflows, d_factors) / present_value
+            convexity = np.einsum("ij,ij->i", inflows, dd_factors) / present_value
+        positive = present_value > 0
+
+        return {
+            "d_npv": d_npv,
+            "d_irr": d_irr,
+            "d_npv_lifespan": SensitivityKernel.lifespan_marginal(batch, results),
+            "macaulay_duration": np.where(positive, macaulay, np.nan),
+            "modified_duration": np.where(positive, modified, np.nan),
+            "convexity": np.where(positive, convexity, np.nan),
+        }
+
+
+def to_sensitivity_dicts(sensitivities: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Chuyển kết quả mảng sang dictionary theo từng dự án (None nếu không tính được)
+
+    Returns:
+        Danh sách {"NPV": {trường: dNPV}, "IRR": {trường: dIRR}, "DURATION", "MODIFIED_DURATION", "CONVEXITY"}
+    """
+    def value(x: float) -> Any:
+        return float(x) if np.isfinite(x) else None
+
+    items = []
+    for i in range(sensitivities["d_npv"].shape[1]):
+        d_npv = {field: value(sensitivities["d_npv"][k, i]) for k, field in enumerate(SENSITIVITY_FIELDS)}
+        d_npv[LIFESPAN_FIELD] = value(sensitivities["d_npv_lifespan"][i])
+        items.append({
+            "NPV": d_npv,
+            "IRR": {field: value(sensitivities["d_irr"][k, i]) for k, field in enumerate(SENSITIVITY_FIELDS)},
+            "DURATION": value(sensitivities["macaulay_duration"][i]),
+            "MODIFIED_DURATION": value(sensitivities["modified_duration"][i]),
+            "CONVEXITY": value(sensitivities["convexity"][i]),
+        })
+    return items
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Module phát hiện văn bản gần trùng lặp (MinHash + LSH) để tái sử dụng kết quả trích xuất
+"""
+
+import difflib
+import hashlib
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import streamlit as st
+
+from config import (
+    SIMILARITY_SHINGLE_SIZE,
+    SIMILARITY_NUM_PERM,
+    SIMILARITY_LSH_BANDS,
+    SIMILARITY_THRESHOLD,
+    SIMILARITY_MAX_DOCUMENTS,
+    FINANCIAL_KEYWORDS,
+)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;:])\s+|\n+")
+_NON_WORD_RE = re.compile(r"[^\w%.,]+")
+_DIGIT_RE = re.compile(r"\d")
+
+
+class TextNormalizer:
+    """Chuẩn hóa văn bản trước khi so sánh"""
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Chữ thường, chuẩn Unicode NFC, bỏ ký tự đặc biệt và khoảng trắng thừa"""
+        text = unicodedata.normalize("NFC", text).lower()
+        text = _NON_WORD_RE.sub(" ", text)
+        return " ".join(text.split())
+
+    @staticmethod
+    def split_sentences(text: str) -> List[str]:
+        """Tách văn bản thành các câu đã chuẩn hóa (bỏ câu rỗng)"""
+        sentences = (TextNormalizer.normalize(s) for s in _SENTENCE_SPLIT_RE.split(text))
+        return [s for s in sentences if s]
+
+
+class MinHasher:
+    """Tạo chữ ký MinHash từ tập shingle theo từ"""
+
+    def __init__(self, num_perm: int = SIMILARITY_NUM_PERM, shingle_size: int = SIMILARITY_SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a < 2^31, x < 2^32, b < 2^31 => a*x + b < 2^64, không tràn uint64
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, normalized_text: str) -> np.ndarray:
+        """Hash 32-bit của các shingle k từ liên tiếp"""
+        words = normalized_text.split()
+        k = self.shingle_size
+        if len(words) < k:
+            grams = [" ".join(words)] if words else []
+        else:
+            grams = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        return np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grams),
+            dtype=np.uint64
+        )
+
+    def signature(self, normalized_text: str) -> np.ndarray:
+        """Chữ ký MinHash (num_perm giá trị nhỏ nhất của các hàm hash hoán vị)"""
+        hashes = self.shingles(normalized_text)
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.uint64)
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    @staticmethod
+    def jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """Ước lượng độ tương đồng Jaccard từ hai chữ ký"""
+        return float(np.mean(sig_a == sig_b))
+
+
+class DocumentSimilarityIndex:
+    """Chỉ mục LSH các văn bản đã trích xuất, dùng chung giữa các session"""
+
+    def __init__(self, max_documents: int = SIMILARITY_MAX_DOCUMENTS):
+        self._hasher = MinHasher()
+        self._bands = SIMILARITY_LSH_BANDS
+        self._rows = self._hasher.num_perm // self._bands
+        self._max_documents = max_documents
+        self._documents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, bytes], set] = {}
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "reused": 0, "reextracted": 0}
+
+    @staticmethod
+    def _doc_id(normalized_text: str) -> str:
+        return hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self._bands):
+            chunk = signature[band * self._rows:(band + 1) * self._rows]
+            yield band, chunk.tobytes()
+
+    def _remove(self, doc_id: str):
+        entry = self._documents.pop(doc_id)
+        for key in self._band_keys(entry["signature"]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def add(self, text: str, data: Dict[str, Any]):
+        """Thêm văn bản đã trích xuất thành công vào chỉ mục"""
+        normalized = TextNormalizer.normalize(text)
+        doc_id = self._doc_id(normalized)
+        signature = self._hasher.signature(normalized)
+
+        with self._lock:
+            if doc_id in self._documents:
+                self._documents.move_to_end(doc_id)
+                self._documents[doc_id]["data"] = dict(data)
+                return
+
+            self._documents[doc_id] = {
+                "signature": signature,
+                "sentences": TextNormalizer.split_sentences(text),
+                "data": dict(data),
+            }
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(doc_id)
+
+            while len(self._documents) > self._max_documents:
+                self._remove(next(iter(self._documents)))
+
+    def find_near_duplicate(self, text: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        Tìm văn bản đã trích xuất gần giống nhất (Jaccard ước lượng >= ngưỡng)
+
+        Returns:
+            Tuple (similarity, entry) hoặc None
+        """
+        normalized = TextNormalizer.normalize(text)
+        signature = self._hasher.signature(normalized)
+
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self._buckets.get(key, set())
+
+            best = None
+            for doc_id in candidates:
+                entry = self._documents[doc_id]
+                similarity = MinHasher.jaccard(signature, entry["signature"])
+                if similarity >= SIMILARITY_THRESHOLD and (best is None or similarity > best[0]):
+                    best = (similarity, entry)
+                    self._documents.move_to_end(doc_id)
+        return best
+
+    @staticmethod
+    def changed_sentences(old_sentences: List[str], new_sentences: List[str]) -> List[str]:
+        """Các câu bị thêm, xóa hoặc sửa giữa hai phiên bản"""
+        changed = []
+        matcher = difflib.SequenceMatcher(a=old_sentences, b=new_sentences, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                changed.extend(old_sentences[i1:i2])
+                changed.extend(new_sentences[j1:j2])
+        return changed
+
+    @staticmethod
+    def touches_financial_figures(sentences: List[str]) -> bool:
+        """Kiểm tra các câu thay đổi có chứa số liệu hoặc từ khóa tài chính không"""
+        for sentence in sentences:
+            if _DIGIT_RE.search(sentence):
+                return True
+            if any(keyword in sentence for keyword in FINANCIAL_KEYWORDS):
+                return True
+        return False
+
+    def find_reusable(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Trả về dữ liệu đã trích xuất của bản nháp gần giống nếu phần thay đổi
+        không chạm tới số liệu tài chính
+
+        Args:
+            text: Văn bản mới cần trích xuất
+
+        Returns:
+            Bản sao dữ liệu dự án có thể tái sử dụng hoặc None nếu cần trích xuất lại
+        """
+        match = self.find_near_duplicate(text)
+        if match is None:
+            self._count("lookups")
+            return None
+
+        _, entry = match
+        changed = self.changed_sentences(entry["sentences"], TextNormalizer.split_sentences(text))
+        if self.touches_financial_figures(changed):
+            self._count("lookups", "reextracted")
+            return None
+
+        self._count("lookups", "reused")
+        return dict(entry["data"])
+
+    def _count(self, *names: str):
+        with self._lock:
+            for name in names:
+                self.stats[name] += 1
+
+
+@st.cache_resource
+def get_document_index() -> DocumentSimilarityIndex:
+    """Chỉ mục văn bản dùng chung cho mọi session"""
+    return DocumentSimilarityIndex()
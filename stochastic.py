@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Module mô phỏng ngẫu nhiên doanh thu, chi phí theo từng năm
+
+Mỗi đường là một ma trận hệ số nhân (số đường x số năm) áp lên doanh thu/chi phí dự kiến của dự án
+(ProjectBatch.variants với `paths`), nên biến động qua từng năm - không chỉ sai số của mức trung bình -
+được đưa vào NPV, IRR và thời gian hoàn vốn. Các quá trình đều giữ kỳ vọng hệ số bằng 1 (trung bình các
+đường trùng với kịch bản dự kiến):
+- gbm: chuyển động Brown hình học, độ lệch tích lũy không hồi phục
+- ou: Ornstein-Uhlenbeck trên log hệ số, độ lệch hồi quy dần về kịch bản dự kiến
+- jump: như gbm kèm các cú sốc Poisson dịch chuyển vĩnh viễn mức doanh thu/chi phí (đổi chế độ)
+Các đường được sinh và tính theo từng khối để giới hạn bộ nhớ.
+"""
+
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cash_flow_engine import CashFlowEngine, ProjectBatch
+from config import (
+    STOCHASTIC_CHART_PATHS,
+    STOCHASTIC_CHUNK_SIZE,
+    STOCHASTIC_CORRELATION,
+    STOCHASTIC_DEFAULT_PATHS,
+    STOCHASTIC_JUMP_INTENSITY,
+    STOCHASTIC_JUMP_MEAN,
+    STOCHASTIC_JUMP_STD,
+    STOCHASTIC_MAX_PATHS,
+    STOCHASTIC_REVERSION,
+    STOCHASTIC_VOLATILITY,
+)
+
+# Quá trình ngẫu nhiên -> tên hiển thị
+STOCHASTIC_PROCESSES = {
+    "gbm": "Chuyển động Brown hình học (GBM)",
+    "ou": "Hồi quy về kịch bản dự kiến (Ornstein-Uhlenbeck)",
+    "jump": "Nhảy chế độ (GBM + cú sốc Poisson)",
+}
+# Chỉ số được mô phỏng -> tên hiển thị
+STOCHASTIC_METRICS = {
+    "npv": "NPV (VNĐ)",
+    "irr": "IRR (%)",
+    "pp": "PP (năm)",
+    "dpp": "DPP (năm)",
+}
+STOCHASTIC_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class StochasticProcess:
+    """Sinh ma trận hệ số nhân theo năm (số đường x số năm) cho từng quá trình"""
+
+    @staticmethod
+    def default_parameters(process: str = "gbm") -> Dict[str, Any]:
+        """Tham số mặc định (đơn vị %, trừ tốc độ hồi quy và cường độ nhảy tính theo 1/năm)"""
+        return {
+            "process": process,
+            "volatility": STOCHASTIC_VOLATILITY,
+            "reversion": STOCHASTIC_REVERSION,
+            "jump_intensity": STOCHASTIC_JUMP_INTENSITY,
+            "jump_mean": STOCHASTIC_JUMP_MEAN,
+            "jump_std": STOCHASTIC_JUMP_STD,
+        }
+
+    @staticmethod
+    def gbm(shocks: np.ndarray, volatility: float) -> np.ndarray:
+        """
+        exp(sigma W_t - sigma^2 t / 2) với W_t là tổng các cú sốc chuẩn tới năm t
+
+        Args:
+            shocks: Cú sốc chuẩn N(0, 1), shape (số đường, số năm)
+            volatility: Độ biến động năm (tỷ lệ)
+        """
+        years = np.arange(1, shocks.shape[1] + 1)
+        return np.exp(volatility * np.cumsum(shocks, axis=1) - 0.5 * volatility ** 2 * years)
+
+    @staticmethod
+    def ornstein_uhlenbeck(shocks: np.ndarray, volatility: float, reversion: float) -> np.ndarray:
+        """
+        exp(x_t - Var(x_t) / 2) với x_t = a x_(t-1) + c e_t, x_0 = 0 (nghiệm đúng của OU theo năm)
+
+        a = exp(-k), c = sigma sqrt((1 - a^2) / (2k)); x_t = sum c a^(t-s) e_s nên cả ma trận được tính
+        bằng một phép nhân với ma trận trọng số tam giác (số năm x số năm) thay vì lặp theo năm.
+
+        Args:
+            shocks: Cú sốc chuẩn N(0, 1), shape (số đường, số năm)
+            volatility: Độ biến động năm (tỷ lệ)
+            reversion: Tốc độ hồi quy k (1/năm); 0 thì trùng với GBM
+        """
+        if reversion <= 0:
+            return StochasticProcess.gbm(shocks, volatility)
+        years = np.arange(1, shocks.shape[1] + 1)
+        a = np.exp(-reversion)
+        c = volatility * np.sqrt((1.0 - a ** 2) / (2.0 * reversion))
+        lag = years[None, :] - years[:, None]
+        weights = np.where(lag >= 0, c * a ** np.maximum(lag, 0), 0.0)
+        variance = c ** 2 * (1.0 - a ** (2 * years)) / (1.0 - a ** 2)
+        return np.exp(shocks @ weights - 0.5 * variance)
+
+    @staticmethod
+    def regime_jumps(shocks: np.ndarray, volatility: float, intensity: float, jump_mean: float,
+                     jump_std: float, rng: np.random.Generator) -> np.ndarray:
+        """
+        GBM kèm N_t ~ Poisson(intensity) cú nhảy mỗi năm, mỗi cú nhân mức hiện tại với exp(J),
+        J ~ N(ln(1 + jump_mean), jump_std^2), và giữ nguyên sau đó
+
+        Tổng các cú nhảy trong năm là N_t ln(1 + m) + sqrt(N_t) s z_t; trừ bù intensity x (E[e^J] - 1)
+        mỗi năm để kỳ vọng hệ số vẫn bằng 1.
+
+        Args:
+            shocks: Cú sốc chuẩn N(0, 1) của phần khuếch tán, shape (số đường, số năm)
+            volatility: Độ biến động năm (tỷ lệ)
+            intensity: Số cú nhảy kỳ vọng mỗi năm
+            jump_mean: Mức thay đổi trung bình mỗi cú nhảy (tỷ lệ, ví dụ -0.2)
+            jump_std: Độ lệch chuẩn log cú nhảy (tỷ lệ)
+            rng: Bộ sinh số ngẫu nhiên cho số cú nhảy và độ lớn
+        """
+        counts = rng.poisson(intensity, size=shocks.shape)
+        log_mean = np.log1p(jump_mean)
+        jumps = counts * log_mean + np.sqrt(counts) * jump_std * rng.standard_normal(shocks.shape)
+        compensator = intensity * (np.exp(log_mean + 0.5 * jump_std ** 2) - 1.0)
+        years = np.arange(1, shocks.shape[1] + 1)
+        return StochasticProcess.gbm(shocks, volatility) * np.exp(np.cumsum(jumps, axis=1) - compensator * years)
+
+    @staticmethod
+    def generate(spec: Dict[str, Any], shocks: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Ma trận hệ số theo tham số `spec` (xem StochasticProcess.default_parameters)
+
+        Args:
+            spec: {"process", "volatility", "reversion", "jump_intensity", "jump_mean", "jump_std"}
+            shocks: Cú sốc chuẩn của phần khuếch tán, shape (số đường, số năm)
+            rng: Bộ sinh số ngẫu nhiên (cho cú nhảy)
+        """
+        params = {**StochasticProcess.default_parameters(), **spec}
+        volatility = float(params["volatility"]) / 100.0
+        process = params["process"]
+        if process == "gbm":
+            return StochasticProcess.gbm(shocks, volatility)
+        if process == "ou":
+            return StochasticProcess.ornstein_uhlenbeck(shocks, volatility, float(params["reversion"]))
+        if process == "jump":
+            return StochasticProcess.regime_jumps(
+                shocks, volatility, float(params["jump_intensity"]), float(params["jump_mean"]) / 100.0,
+                float(params["jump_std"]) / 100.0, rng
+            )
+        raise ValueError(f"Không hỗ trợ quá trình ngẫu nhiên: {process}")
+
+
+class StochasticSimulator:
+    """Phân phối NPV, IRR, PP, DPP của một dự án trên các đường doanh thu/chi phí ngẫu nhiên"""
+
+    @staticmethod
+    def evaluate_chunk(project_data: Dict[str, Any], revenue_factors: Optional[np.ndarray],
+                       cost_factors: Optional[np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Bảng dòng tiền và chỉ số của một khối đường (mỗi đường là một phương án của ProjectBatch)
+
+        Returns:
+            Dictionary "npv", "irr" (%), "pp", "dpp" theo đường (NaN nếu không tính được) cùng "years",
+            "revenue" và "cumulative" (dòng tiền thuần lũy kế), shape (số đường, H + 1)
+        """
+        paths = {}
+        if revenue_factors is not None:
+            paths["doanh_thu_nam"] = revenue_factors
+        if cost_factors is not None:
+            paths["chi_phi_nam"] = cost_factors
+        batch = ProjectBatch.variants(project_data, {}, paths)
+        flows = CashFlowEngine.build(batch)
+        ncf = flows["net_cash_flow"]
+        factors = flows["discount_factors"]
+        discounted = flows["discounted"]
+        return {
+            "npv": CashFlowEngine.npv(ncf, factors),
+            "irr": CashFlowEngine.irr_analysis(ncf, batch.years)["irr"] * 100,
+            "pp": CashFlowEngine.payback(ncf, flows["cumulative"]),
+            "dpp": CashFlowEngine.payback(discounted, flows["cumulative_discounted"]),
+            "years": batch.years,
+            "revenue": flows["revenue"],
+            "cumulative": flows["cumulative"],
+        }
+
+    @staticmethod
+    def _collect(project_data: Dict[str, Any], chunks: Iterator[Tuple[Optional[np.ndarray], Optional[np.ndarray]]],
+                 n_paths: int, chart_paths: int) -> Dict[str, Any]:
+        """Ghép kết quả của các khối; chỉ giữ `chart_paths` đường đầu tiên của doanh thu và NCF lũy kế để vẽ"""
+        result: Dict[str, Any] = {key: np.empty(n_paths) for key in STOCHASTIC_METRICS}
+        kept = {"revenue": [], "cumulative": []}
+        start = 0
+        for revenue_factors, cost_factors in chunks:
+            values = StochasticSimulator.evaluate_chunk(project_data, revenue_factors, cost_factors)
+            size = len(values["npv"])
+            for key in STOCHASTIC_METRICS:
+                result[key][start:start + size] = values[key]
+            room = chart_paths - start
+            if room > 0:
+                for key in kept:
+                    kept[key].append(values[key][:room])
+            result["years"] = values["years"]
+            start += size
+
+        result["paths"] = n_paths
+        result["revenue_paths"] = np.concatenate(kept["revenue"])
+        result["cumulative_paths"] = np.concatenate(kept["cumulative"])
+        return result
+
+    @staticmethod
+    def evaluate(project_data: Dict[str, Any], revenue_factors: Optional[np.ndarray] = None,
+                 cost_factors: Optional[np.ndarray] = None, chunk_size: int = STOCHASTIC_CHUNK_SIZE,
+                 chart_paths: int = STOCHASTIC_CHART_PATHS) -> Dict[str, Any]:
+        """
+        Chỉ số của dự án trên các ma trận hệ số doanh thu/chi phí cho sẵn
+
+        Args:
+            project_data: Dự án gốc
+            revenue_factors, cost_factors: Ma trận hệ số nhân (số đường x số năm) cho năm 1, 2, ...
+                (ít nhất một ma trận; cùng số đường)
+            chunk_size: Số đường tối đa trong một lô tính toán
+            chart_paths: Số đường giữ lại để vẽ
+
+        Returns:
+            Dictionary "npv", "irr" (%), "pp", "dpp" (mảng theo đường), "paths", "years",
+            "revenue_paths", "cumulative_paths"
+        """
+        matrices = [m for m in (revenue_factors, cost_factors) if m is not None]
+        if not matrices:
+            raise ValueError("Cần ít nhất một ma trận hệ số doanh thu hoặc chi phí")
+        n_paths = len(matrices[0])
+
+        def chunks():
+            for start in range(0, n_paths, chunk_size):
+                yield tuple(None if m is None else np.asarray(m[start:start + chunk_size], dtype=float)
+                            for m in (revenue_factors, cost_factors))
+
+        return StochasticSimulator._collect(project_data, chunks(), n_paths, chart_paths)
+
+    @staticmethod
+    def simulate(project_data: Dict[str, Any], revenue: Optional[Dict[str, Any]] = None,
+                 costs: Optional[Dict[str, Any]] = None, n_paths: int = STOCHASTIC_DEFAULT_PATHS,
+                 correlation: float = STOCHASTIC_CORRELATION, seed: Optional[int] = None,
+                 chunk_size: int = STOCHASTIC_CHUNK_SIZE,
+                 chart_paths: int = STOCHASTIC_CHART_PATHS) -> Dict[str, Any]:
+        """
+        Sinh đường doanh thu/chi phí theo từng khối rồi tính chỉ số ngay, không giữ toàn bộ ma trận
+
+        Args:
+            project_data: Dự án gốc
+            revenue, costs: Tham số quá trình của doanh thu/chi phí (xem StochasticProcess.generate);
+                None thì giữ theo kịch bản dự kiến
+            n_paths: Số đường mô phỏng
+            correlation: Hệ số tương quan giữa cú sốc doanh thu và chi phí
+            seed: Hạt giống ngẫu nhiên
+            chunk_size: Số đường tối đa trong một lô tính toán
+            chart_paths: Số đường giữ lại để vẽ
+
+        Returns:
+            Như StochasticSimulator.evaluate
+        """
+        rng = np.random.default_rng(seed)
+        years = int(project_data['dong_doi_du_an'])
+
+        def chunks():
+            for start in range(0, n_paths, chunk_size):
+                size = min(chunk_size, n_paths - start)
+                shocks = rng.standard_normal((2, size, years))
+                cost_shocks = correlation * shocks[0] + np.sqrt(1.0 - correlation ** 2) * shocks[1]
+                yield (
+                    None if revenue is None else StochasticProcess.generate(revenue, shocks[0], rng),
+                    None if costs is None else StochasticProcess.generate(costs, cost_shocks, rng),
+                )
+
+        return StochasticSimulator._collect(project_data, chunks(), n_paths, chart_paths)
+
+    @staticmethod
+    def simulate_project(project_data: Dict[str, Any], revenue: Optional[Dict[str, Any]] = None,
+                         costs: Optional[Dict[str, Any]] = None, n_paths: int = STOCHASTIC_DEFAULT_PATHS,
+                         correlation: float = STOCHASTIC_CORRELATION,
+                         seed: Optional[int] = None) -> Tuple[bool, Optional[Dict[str, Any]], str]:
+        """
+        Mô phỏng đường doanh thu/chi phí cho một dự án
+
+        Returns:
+            Tuple[bool, Dict, str]: (success, result, error_message)
+        """
+        if revenue is None and costs is None:
+            return False, None, "Cần chọn quá trình ngẫu nhiên cho doanh thu hoặc chi phí"
+        if not 1 <= n_paths <= STOCHASTIC_MAX_PATHS:
+            return False, None, f"Số đường mô phỏng phải trong khoảng 1 - {STOCHASTIC_MAX_PATHS:,}"
+        if not -1 <= correlation <= 1:
+            return False, None, "Hệ số tương quan phải trong khoảng -1 đến 1"
+        for spec in (revenue, costs):
+            if spec is None:
+                continue
+            if spec.get("process") not in STOCHASTIC_PROCESSES:
+                return False, None, f"Không hỗ trợ quá trình ngẫu nhiên: {spec.get('process')}"
+            if float(spec.get("volatility", 0)) < 0 or float(spec.get("reversion", 0)) < 0:
+                return False, None, "Độ biến động và tốc độ hồi quy không được âm"
+            if float(spec.get("jump_intensity", 0)) < 0 or float(spec.get("jump_mean", 0)) <= -100:
+                return False, None, "Cường độ nhảy không được âm, mức nhảy phải lớn hơn -100%"
+        try:
+            return True, StochasticSimulator.simulate(project_data, revenue, costs, n_paths, correlation, seed), ""
+        except (KeyError, TypeError, ValueError) as e:
+            return False, None, f"Không thể mô phỏng đường ngẫu nhiên: {str(e)}"
+
+
+def summarize(result: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Các số đo rủi ro chính: NPV kỳ vọng, độ lệch chuẩn, xác suất NPV âm, xác suất không hoàn vốn,
+    NPV ở phân vị 5% (VaR 95%) và trung bình 5% đường xấu nhất (CVaR 95%)
+    """
+    npv = result["npv"]
+    tail = npv[npv <= np.percentile(npv, 5)]
+    return {
+        "npv_mean": float(npv.mean()),
+        "npv_std": float(npv.std()),
+        "loss_probability": float(np.mean(npv < 0)),
+        "no_payback_probability": float(np.mean(np.isnan(result["pp"]))),
+        "npv_p5": float(np.percentile(npv, 5)),
+        "npv_cvar5": float(tail.mean()),
+    }
+
+
+def to_distribution_dataframe(result: Dict[str, Any]) -> pd.DataFrame:
+    """Bảng phân phối của từng chỉ số: trung bình, độ lệch chuẩn, các phân vị và tỷ lệ đường tính được"""
+    rows = []
+    for key, label in STOCHASTIC_METRICS.items():
+        values = result[key][np.isfinite(result[key])]
+        row = {"Chỉ số": label, "Tỷ lệ tính được": len(values) / max(len(result[key]), 1)}
+        if len(values):
+            row.update({"Trung bình": values.mean(), "Độ lệch chuẩn": values.std()})
+            row.update({f"P{p}": v for p, v in zip(STOCHASTIC_PERCENTILES, np.percentile(values, STOCHASTIC_PERCENTILES))})
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -4,10 +4,15 @@ Module chứa các hàm tiện ích
 """
 
 import io
+import statistics
+import time
 import streamlit as st
+from collections import deque
+from contextlib import contextmanager
 from docx import Document
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from config import ERROR_MESSAGES
+from background import AnalysisPrefetcher, SessionJobs
 
 
 class DocumentReader:
@@ -27,32 +32,49 @@ class DocumentReader:
         try:
             # Đọc file vào BytesIO để không cần lưu xuống đĩa
             file_bytes = uploaded_file.read()
-            document = Document(io.BytesIO(file_bytes))
-
-            # Trích xuất text từ các paragraphs
-            full_text = [para.text for para in document.paragraphs if para.text.strip()]
-
-            # Trích xuất text từ tables (nếu có)
-            for table in document.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            full_text.append(cell.text)
 
             # Reset file pointer để có thể đọc lại nếu cần
             uploaded_file.seek(0)
 
-            text_content = '\n'.join(full_text)
-
-            if not text_content.strip():
-                return None
-
-            return text_content
+            return DocumentReader.extract_text_from_bytes(file_bytes)
 
         except Exception as e:
             st.error(ERROR_MESSAGES["file_read_error"].format(str(e)))
             return None
 
+    @staticmethod
+    def extract_text_from_bytes(file_bytes: bytes) -> Optional[str]:
+        """
+        Trích xuất văn bản từ nội dung file .docx (không gọi Streamlit, dùng được ở luồng nền)
+
+        Args:
+            file_bytes: Nội dung file .docx
+
+        Returns:
+            String chứa nội dung văn bản hoặc None nếu file không có chữ
+
+        Raises:
+            Exception: Khi file không phải .docx hợp lệ
+        """
+        document = Document(io.BytesIO(file_bytes))
+
+        # Trích xuất text từ các paragraphs
+        full_text = [para.text for para in document.paragraphs if para.text.strip()]
+
+        # Trích xuất text từ tables (nếu có)
+        for table in document.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    if cell.text.strip():
+                        full_text.append(cell.text)
+
+        text_content = '\n'.join(full_text)
+
+        if not text_content.strip():
+            return None
+
+        return text_content
+
 
 class SessionStateManager:
     """Class quản lý session state của Streamlit"""
@@ -81,17 +103,26 @@ class SessionStateManager:
         if 'uploaded_file_name' not in st.session_state:
             st.session_state.uploaded_file_name = None
 
+        if 'report_files' not in st.session_state:
+            st.session_state.report_files = None
+
+        if SessionJobs.STATE_KEY not in st.session_state:
+            st.session_state[SessionJobs.STATE_KEY] = {}
+
     @staticmethod
     def reset_calculation_state():
         """Reset các kết quả tính toán khi có dữ liệu mới"""
+        AnalysisPrefetcher.cancel()
         st.session_state.cash_flow_df = None
         st.session_state.metrics = None
         st.session_state.analysis_requested = False
         st.session_state.ai_analysis_result = None
+        st.session_state.report_files = None
 
     @staticmethod
     def reset_all_state():
         """Reset toàn bộ session state"""
+        SessionJobs.cancel_all()
         st.session_state.project_data = None
         st.session_state.cash_flow_df = None
         st.session_state.metrics = None
@@ -99,6 +130,42 @@ class SessionStateManager:
         st.session_state.ai_analysis_result = None
         st.session_state.uploaded_file_content = None
         st.session_state.uploaded_file_name = None
+        st.session_state.report_files = None
+
+
+class RerunTimer:
+    """Đo thời gian thực thi của mỗi lần chạy toàn trang và của từng fragment"""
+
+    STATE_KEY = "rerun_timings"
+    HISTORY_SIZE = 20
+
+    @staticmethod
+    def record(scope: str, elapsed_ms: float):
+        """Ghi nhận thời gian (ms) của một lần chạy `scope`"""
+        timings = st.session_state.setdefault(RerunTimer.STATE_KEY, {})
+        timings.setdefault(scope, deque(maxlen=RerunTimer.HISTORY_SIZE)).append(elapsed_ms)
+
+    @staticmethod
+    @contextmanager
+    def measure(scope: str):
+        """Context manager đo thời gian của khối lệnh bên trong"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            RerunTimer.record(scope, (time.perf_counter() - start) * 1000)
+
+    @staticmethod
+    def summary() -> Dict[str, Tuple[float, float, int]]:
+        """
+        Returns:
+            Dictionary scope -> (lần gần nhất ms, trung vị ms, số lần chạy đã ghi)
+        """
+        timings = st.session_state.get(RerunTimer.STATE_KEY, {})
+        return {
+            scope: (values[-1], statistics.median(values), len(values))
+            for scope, values in timings.items() if values
+        }
 
 
 class DataFormatter:
@@ -126,7 +193,9 @@ class DataFormatter:
 
         Args:
             value: Giá trị cần format
-            metric_type: Loại metric ('NPV', 'IRR', 'PP', 'DPP')
+            metric_type: Loại metric ('NPV', 'IRR', 'MIRR', 'PI', 'EAA', 'PP', 'DPP' hoặc chỉ số tài trợ
+                'APV', 'PV_TAX_SHIELD', 'NPV_VCSH', 'IRR_VCSH' hoặc chỉ số thực 'IRR_THUC', 'WACC_THUC',
+                'LAM_PHAT_BINH_QUAN')
 
         Returns:
             String đã được format
@@ -134,10 +203,12 @@ class DataFormatter:
         if isinstance(value, str):
             return value
 
-        if metric_type == 'NPV':
+        if metric_type in ['NPV', 'EAA', 'APV', 'PV_TAX_SHIELD', 'NPV_VCSH']:
             return DataFormatter.format_currency(value)
-        elif metric_type == 'IRR':
+        elif metric_type in ['IRR', 'MIRR', 'IRR_VCSH', 'IRR_THUC', 'WACC_THUC', 'LAM_PHAT_BINH_QUAN']:
             return DataFormatter.format_percentage(value)
+        elif metric_type == 'PI':
+            return f"{value:.2f} lần"
         elif metric_type in ['PP', 'DPP']:
             return DataFormatter.format_year(value)
         else:
@@ -5,7 +5,14 @@ Module xác thực và kiểm tra dữ liệu đầu vào
 
 import json
 from typing import Dict, Any, Tuple, Optional
-from config import DEFAULT_VALUES
+from config import (
+    DEFAULT_VALUES,
+    DEPRECIATION_METHOD_LABELS,
+    LOAN_METHOD_LABELS,
+    OPTIONAL_PROJECT_FIELDS,
+    PERIOD_LABELS,
+    WACC_BASIS_LABELS,
+)
 
 
 class DataValidator:
@@ -94,11 +101,121 @@ class DataValidator:
             if von_dau_tu == 0 and doanh_thu == 0:
                 return False, "Dữ liệu dự án không đầy đủ (vốn và doanh thu đều bằng 0)"
 
-            return True, ""
+            return DataValidator.validate_time_varying_data(data, dong_doi)
 
-        except (ValueError, TypeError) as e:
+        except (ValueError, TypeError, KeyError) as e:
             return False, f"Lỗi chuyển đổi dữ liệu: {str(e)}"
 
+    @staticmethod
+    def validate_time_varying_data(data: Dict[str, Any], dong_doi: int) -> Tuple[bool, str]:
+        """
+        Validate các trường tùy chọn (số liệu từng năm, tăng trưởng, đầu tư bổ sung, thanh lý,
+        khấu hao, vốn lưu động, chuyển lỗ, đường cong chiết khấu, khoản vay, lạm phát)
+
+        Returns:
+            Tuple[bool, str]: (is_valid, error_message)
+        """
+        for key, label in (('doanh_thu_theo_nam', "Doanh thu theo năm"), ('chi_phi_theo_nam', "Chi phí theo năm")):
+            series = data.get(key)
+            if not series:
+                continue
+            if not isinstance(series, list):
+                return False, f"{label} phải là danh sách giá trị"
+            if len(series) > dong_doi:
+                return False, f"{label} có {len(series)} giá trị, nhiều hơn dòng đời dự án ({dong_doi} năm)"
+            if any(v is not None and float(v) < 0 for v in series):
+                return False, f"{label} không thể âm"
+
+        for key, label in (('tang_truong_doanh_thu', "Tăng trưởng doanh thu"), ('tang_truong_chi_phi', "Tăng trưởng chi phí")):
+            if data.get(key) is not None and float(data[key]) <= -100:
+                return False, f"{label} phải lớn hơn -100%"
+
+        ramp = data.get('nam_dat_cong_suat')
+        if ramp is not None and not 0 <= int(ramp) <= dong_doi:
+            return False, "Số năm đạt công suất phải nằm trong dòng đời dự án"
+
+        for item in data.get('dau_tu_bo_sung') or []:
+            nam = int(item['nam'])
+            if not 1 <= nam <= dong_doi:
+                return False, f"Đầu tư bổ sung năm {nam} nằm ngoài dòng đời dự án"
+            if float(item['so_tien']) < 0:
+                return False, "Đầu tư bổ sung không thể âm"
+
+        if data.get('gia_tri_thanh_ly') is not None and float(data['gia_tri_thanh_ly']) < 0:
+            return False, "Giá trị thanh lý không thể âm"
+
+        method = data.get('phuong_phap_khau_hao')
+        if method and method not in DEPRECIATION_METHOD_LABELS:
+            return False, f"Phương pháp khấu hao không hợp lệ: {method}"
+        if data.get('thoi_gian_khau_hao') is not None and int(data['thoi_gian_khau_hao']) < 1:
+            return False, "Thời gian khấu hao phải lớn hơn 0"
+        if data.get('he_so_khau_hao') is not None and float(data['he_so_khau_hao']) <= 0:
+            return False, "Hệ số khấu hao phải lớn hơn 0"
+
+        wc_rate = data.get('ty_le_von_luu_dong')
+        if wc_rate is not None and not 0 <= float(wc_rate) <= 100:
+            return False, "Tỷ lệ vốn lưu động phải nằm trong khoảng 0-100%"
+        if data.get('so_nam_chuyen_lo') is not None and int(data['so_nam_chuyen_lo']) < 0:
+            return False, "Số năm chuyển lỗ không thể âm"
+
+        curve = data.get('duong_cong_lai_suat')
+        if curve:
+            if not isinstance(curve, list):
+                return False, "Đường cong lãi suất phải là danh sách giá trị"
+            premium = float(data.get('phan_bu_rui_ro') or 0)
+            if any(float(r) + premium <= -100 for r in curve):
+                return False, "Lãi suất chiết khấu (kèm phần bù rủi ro) phải lớn hơn -100%"
+        for step in data.get('wacc_theo_giai_doan') or []:
+            nam = int(step['tu_nam'])
+            if not 1 <= nam <= dong_doi:
+                return False, f"WACC theo giai đoạn: năm {nam} nằm ngoài dòng đời dự án"
+            if not 0 <= float(step['wacc']) <= 100:
+                return False, "WACC theo giai đoạn phải nằm trong khoảng 0-100%"
+
+        loan = float(data.get('khoan_vay') or 0)
+        if loan < 0:
+            return False, "Khoản vay không thể âm"
+        if loan > 0:
+            if not 0 <= float(data.get('lai_suat_vay') or 0) <= 100:
+                return False, "Lãi suất vay phải nằm trong khoảng 0-100%"
+            term = int(data.get('thoi_han_vay') or dong_doi)
+            grace = int(data.get('an_han_vay') or 0)
+            if term < 1:
+                return False, "Thời hạn vay phải lớn hơn 0"
+            if not 0 <= grace < term:
+                return False, "Thời gian ân hạn phải nhỏ hơn thời hạn vay"
+            method = data.get('phuong_thuc_tra_no')
+            if method and method not in LOAN_METHOD_LABELS:
+                return False, f"Phương thức trả nợ không hợp lệ: {method}"
+        equity_cost = data.get('chi_phi_von_chu_so_huu')
+        if equity_cost is not None and not 0 <= float(equity_cost) <= 100:
+            return False, "Chi phí vốn chủ sở hữu phải nằm trong khoảng 0-100%"
+
+        for key, label in (('lam_phat', "Lạm phát"), ('truot_gia_doanh_thu', "Trượt giá bán"),
+                           ('truot_gia_chi_phi', "Trượt giá chi phí")):
+            rates = data.get(key)
+            if rates is None:
+                continue
+            if not isinstance(rates, list):
+                rates = [rates]
+            if any(not -100 < float(r) <= 1000 for r in rates):
+                return False, f"{label} phải lớn hơn -100% và không quá 1000%/năm"
+        basis = data.get('loai_wacc')
+        if basis and basis not in WACC_BASIS_LABELS:
+            return False, f"Loại WACC không hợp lệ: {basis}"
+
+        period = data.get('ky_tinh')
+        if period and period not in PERIOD_LABELS:
+            return False, f"Kỳ tính không hợp lệ: {period}"
+        seasonality = data.get('he_so_mua_vu')
+        if seasonality:
+            if not isinstance(seasonality, list) or len(seasonality) != 12:
+                return False, "Hệ số mùa vụ phải gồm 12 giá trị theo tháng"
+            if any(float(w) < 0 for w in seasonality) or sum(float(w) for w in seasonality) <= 0:
+                return False, "Hệ số mùa vụ không được âm và phải có ít nhất một tháng lớn hơn 0"
+
+        return True, ""
+
     @staticmethod
     def sanitize_project_data(data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -118,6 +235,15 @@ class DataValidator:
             # Nếu có lỗi, trả về giá trị mặc định
             return DEFAULT_VALUES.copy()
 
+        # Giữ các trường tùy chọn theo năm nếu hợp lệ
+        optional = {key: data[key] for key in OPTIONAL_PROJECT_FIELDS if data.get(key) not in (None, [], 0)}
+        try:
+            is_valid, _ = DataValidator.validate_time_varying_data(optional, sanitized['dong_doi_du_an'])
+        except (ValueError, TypeError, KeyError):
+            is_valid = False
+        if is_valid:
+            sanitized.update(optional)
+
         return sanitized
 
     @staticmethod
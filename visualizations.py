@@ -3,29 +3,185 @@
 Module chứa tất cả các hàm tạo biểu đồ và visualization
 """
 
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Sequence, Tuple
+from config import (
+    FIGURE_CACHE_MAX_ENTRIES,
+    WEBGL_POINT_THRESHOLD,
+    LTTB_TARGET_POINTS,
+    BAR_TEXT_MAX_POINTS,
+    FAN_CHART_MIN_PATHS,
+    FAN_CHART_PERCENTILES,
+)
+from goal_seek import GoalSeeker
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Chọn chỉ số các điểm giữ lại theo thuật toán Largest-Triangle-Three-Buckets
+
+    Args:
+        x: Trục hoành (tăng dần)
+        y: Giá trị
+        n_out: Số điểm mong muốn
+
+    Returns:
+        Mảng chỉ số (tăng dần) của các điểm được giữ lại
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Biên các bucket (trừ điểm đầu và cuối luôn được giữ)
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(int)
+    edges[-1] = n - 1
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Diện tích tam giác (nhân đôi) giữa điểm đã chọn, ứng viên và trung bình bucket kế
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def sign_crossing_indices(y: np.ndarray) -> np.ndarray:
+    """Chỉ số hai điểm kề nhau tại mỗi lần chuỗi đổi dấu (ví dụ điểm hoàn vốn)"""
+    y = np.asarray(y, dtype=float)
+    crossings = np.nonzero(np.diff(np.sign(y)) != 0)[0]
+    return np.union1d(crossings, crossings + 1)
+
+
+def downsample_indices(x: np.ndarray, series: Sequence[np.ndarray], n_out: int = LTTB_TARGET_POINTS,
+                       preserve_crossings: bool = False) -> np.ndarray:
+    """
+    Hợp các chỉ số LTTB của nhiều chuỗi dùng chung trục hoành
+
+    Args:
+        x: Trục hoành
+        series: Các chuỗi giá trị cần giữ hình dạng
+        n_out: Số điểm mục tiêu cho mỗi chuỗi
+        preserve_crossings: Giữ nguyên các điểm đổi dấu (điểm hoàn vốn)
+
+    Returns:
+        Mảng chỉ số tăng dần
+    """
+    indices = np.arange(0)
+    for y in series:
+        indices = np.union1d(indices, lttb_indices(x, y, n_out))
+        if preserve_crossings:
+            indices = np.union1d(indices, sign_crossing_indices(y))
+    return indices
+
+
+class FigureCache:
+    """LRU cache các bộ biểu đồ đã dựng (kèm JSON đã serialize), dùng chung giữa các session"""
+
+    def __init__(self, max_entries: int = FIGURE_CACHE_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Tuple[go.Figure, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(cash_flow_df: pd.DataFrame, metrics: Dict[str, Any], project_data: Dict[str, Any]) -> str:
+        """Hash nội dung bảng dòng tiền, chỉ số và dữ liệu dự án"""
+        digest = hashlib.sha256()
+        digest.update(",".join(map(str, cash_flow_df.columns)).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(cash_flow_df, index=True).values.tobytes())
+        digest.update(json.dumps([metrics, project_data], sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_or_build(self, key: str, builder: Callable[[], Dict[str, go.Figure]]) -> Dict[str, Tuple[go.Figure, str]]:
+        """
+        Lấy bộ biểu đồ theo key, dựng mới nếu chưa có
+
+        Args:
+            key: Key của kết quả tính toán
+            builder: Hàm dựng dictionary tên biểu đồ -> Figure
+
+        Returns:
+            Dictionary tên biểu đồ -> (Figure, JSON của figure)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+
+        # Dựng ngoài lock để các session khác không phải chờ
+        entry = {name: (fig, fig.to_json()) for name, fig in builder().items()}
+
+        with self._lock:
+            self.stats["misses"] += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+@st.cache_resource
+def get_figure_cache() -> FigureCache:
+    """Figure cache dùng chung cho mọi session"""
+    return FigureCache()
 
 
 class ProjectVisualizer:
     """Class quản lý các biểu đồ trực quan hóa dự án"""
 
+    @staticmethod
+    def _use_webgl(n_points: int) -> bool:
+        """Chuyển sang WebGL khi số điểm vượt ngưỡng SVG còn mượt"""
+        return n_points > WEBGL_POINT_THRESHOLD
+
     @staticmethod
     def create_cash_flow_chart(cash_flow_df: pd.DataFrame) -> go.Figure:
         """Tạo biểu đồ dòng tiền thuần (Cash Flow Waterfall)"""
+        x = cash_flow_df['Năm'].to_numpy()
+        ncf = cash_flow_df['Dòng tiền thuần (NCF)'].to_numpy(dtype=float)
+        colors = np.where(ncf < 0, 'red', 'green')
+
         fig = go.Figure()
 
-        fig.add_trace(go.Bar(
-            x=cash_flow_df['Năm'],
-            y=cash_flow_df['Dòng tiền thuần (NCF)'],
-            name='Dòng tiền thuần',
-            marker_color=['red' if x < 0 else 'green' for x in cash_flow_df['Dòng tiền thuần (NCF)']],
-            text=[f"{x:,.0f}" for x in cash_flow_df['Dòng tiền thuần (NCF)']],
-            textposition='outside'
-        ))
+        if ProjectVisualizer._use_webgl(len(ncf)):
+            # Chuỗi dài: vẽ WebGL trên tập điểm đã giảm mẫu, bỏ nhãn từng cột
+            idx = downsample_indices(x, [ncf], preserve_crossings=True)
+            fig.add_trace(go.Scattergl(
+                x=x[idx],
+                y=ncf[idx],
+                name='Dòng tiền thuần',
+                mode='markers',
+                marker=dict(color=colors[idx], size=4)
+            ))
+        else:
+            show_text = len(ncf) <= BAR_TEXT_MAX_POINTS
+            fig.add_trace(go.Bar(
+                x=x,
+                y=ncf,
+                name='Dòng tiền thuần',
+                marker_color=colors,
+                text=[f"{v:,.0f}" for v in ncf] if show_text else None,
+                textposition='outside' if show_text else None
+            ))
 
         fig.update_layout(
             title="Dòng tiền thuần qua các năm",
@@ -40,27 +196,36 @@ class ProjectVisualizer:
     @staticmethod
     def create_cumulative_cash_flow_chart(cash_flow_df: pd.DataFrame) -> go.Figure:
         """Tạo biểu đồ dòng tiền lũy kế & thời điểm hoàn vốn"""
-        cumulative_cf = cash_flow_df['Dòng tiền thuần (NCF)'].cumsum()
-        cumulative_discounted = cash_flow_df['Dòng tiền chiết khấu lũy kế']
+        x = cash_flow_df['Năm'].to_numpy()
+        cumulative_cf = cash_flow_df['Dòng tiền thuần (NCF)'].cumsum().to_numpy(dtype=float)
+        cumulative_discounted = cash_flow_df['Dòng tiền chiết khấu lũy kế'].to_numpy(dtype=float)
 
         fig = go.Figure()
 
-        fig.add_trace(go.Scatter(
-            x=cash_flow_df['Năm'],
-            y=cumulative_cf,
-            mode='lines+markers',
+        if ProjectVisualizer._use_webgl(len(x)):
+            # Giảm mẫu nhưng giữ nguyên các điểm đổi dấu để thời điểm hoàn vốn không bị lệch
+            idx = downsample_indices(x, [cumulative_cf, cumulative_discounted], preserve_crossings=True)
+            scatter, mode, marker = go.Scattergl, 'lines', None
+        else:
+            idx = slice(None)
+            scatter, mode, marker = go.Scatter, 'lines+markers', dict(size=8)
+
+        fig.add_trace(scatter(
+            x=x[idx],
+            y=cumulative_cf[idx],
+            mode=mode,
             name='Dòng tiền lũy kế',
             line=dict(color='blue', width=3),
-            marker=dict(size=8)
+            marker=marker
         ))
 
-        fig.add_trace(go.Scatter(
-            x=cash_flow_df['Năm'],
-            y=cumulative_discounted,
-            mode='lines+markers',
+        fig.add_trace(scatter(
+            x=x[idx],
+            y=cumulative_discounted[idx],
+            mode=mode,
             name='Dòng tiền chiết khấu lũy kế',
             line=dict(color='orange', width=3, dash='dash'),
-            marker=dict(size=8)
+            marker=marker
         ))
 
         # Đường breakeven (hoàn vốn)
@@ -84,8 +249,256 @@ class ProjectVisualizer:
         return fig
 
     @staticmethod
-    def create_revenue_cost_chart(cash_flow_df: pd.DataFrame) -> go.Figure:
-        """Tạo biểu đồ so sánh doanh thu, chi phí & lợi nhuận"""
+    def create_fan_chart(x: np.ndarray, paths: np.ndarray, title: str,
+                         percentiles: Sequence[float] = FAN_CHART_PERCENTILES,
+                         yaxis_title: str = "VNĐ") -> go.Figure:
+        """
+        Tạo biểu đồ quạt (dải phân vị) cho nhiều đường mô phỏng
+
+        Args:
+            x: Trục hoành (các năm/kỳ)
+            paths: Ma trận (số đường x số điểm)
+            title: Tiêu đề biểu đồ
+            percentiles: Các phân vị đối xứng, tăng dần, phần tử giữa là trung vị
+
+        Returns:
+            Figure với các dải phân vị lồng nhau và đường trung vị
+        """
+        x = np.asarray(x)
+        bands = np.percentile(paths, percentiles, axis=0)
+        mid = len(percentiles) // 2
+
+        idx = slice(None)
+        if ProjectVisualizer._use_webgl(len(x)):
+            idx = downsample_indices(x, [bands[mid]], preserve_crossings=True)
+
+        fig = go.Figure()
+        for i in range(mid):
+            lower, upper = bands[i][idx], bands[-1 - i][idx]
+            label = f"P{percentiles[i]:g}–P{percentiles[-1 - i]:g}"
+            opacity = 0.15 + 0.2 * i
+            fig.add_trace(go.Scatter(
+                x=x[idx], y=upper, mode='lines', line=dict(width=0),
+                showlegend=False, hoverinfo='skip'
+            ))
+            fig.add_trace(go.Scatter(
+                x=x[idx], y=lower, mode='lines', line=dict(width=0),
+                fill='tonexty', fillcolor=f"rgba(0, 102, 204, {opacity:.2f})",
+                name=label
+            ))
+
+        fig.add_trace(go.Scatter(
+            x=x[idx],
+            y=bands[mid][idx],
+            mode='lines',
+            name=f"Trung vị (P{percentiles[mid]:g})",
+            line=dict(color='#0066cc', width=3)
+        ))
+
+        fig.add_hline(y=0, line_dash="dot", line_color="red")
+        fig.update_layout(
+            title=title,
+            xaxis_title="Năm",
+            yaxis_title=yaxis_title,
+            hovermode='x unified',
+            height=400
+        )
+        return fig
+
+    @staticmethod
+    def create_paths_chart(x: np.ndarray, paths: np.ndarray, title: str,
+                           yaxis_title: str = "VNĐ") -> go.Figure:
+        """
+        Vẽ nhiều đường mô phỏng: ít đường thì vẽ chồng (WebGL), nhiều đường thì chuyển sang biểu đồ quạt
+
+        Args:
+            x: Trục hoành
+            paths: Ma trận (số đường x số điểm)
+            title: Tiêu đề biểu đồ
+        """
+        paths = np.atleast_2d(paths)
+        if paths.shape[0] >= FAN_CHART_MIN_PATHS:
+            return ProjectVisualizer.create_fan_chart(x, paths, title, yaxis_title=yaxis_title)
+
+        fig = go.Figure()
+        for path in paths:
+            fig.add_trace(go.Scattergl(
+                x=x, y=path, mode='lines',
+                line=dict(width=1, color='rgba(0, 102, 204, 0.35)'),
+                showlegend=False
+            ))
+        fig.add_hline(y=0, line_dash="dot", line_color="red")
+        fig.update_layout(title=title, xaxis_title="Năm", yaxis_title=yaxis_title, height=400)
+        return fig
+
+    @staticmethod
+    def create_comparison_chart(results: Sequence[Dict[str, Any]], discounted: bool = False) -> go.Figure:
+        """
+        Chồng đường dòng tiền lũy kế của nhiều dự án
+
+        Args:
+            results: Danh sách {"name", "years", "cumulative", "cumulative_discounted"}
+            discounted: Dùng dòng tiền chiết khấu lũy kế thay vì dòng tiền lũy kế
+        """
+        series_key = "cumulative_discounted" if discounted else "cumulative"
+        fig = go.Figure()
+
+        for result in results:
+            x = np.asarray(result["years"])
+            y = np.asarray(result[series_key], dtype=float)
+            if ProjectVisualizer._use_webgl(len(x)):
+                idx = downsample_indices(x, [y], preserve_crossings=True)
+                fig.add_trace(go.Scattergl(x=x[idx], y=y[idx], mode='lines', name=result["name"]))
+            else:
+                fig.add_trace(go.Scatter(x=x, y=y, mode='lines+markers', name=result["name"], marker=dict(size=6)))
+
+        fig.add_hline(
+            y=0,
+            line_dash="dot",
+            line_color="red",
+            annotation_text="Điểm hoàn vốn",
+            annotation_position="right"
+        )
+
+        fig.update_layout(
+            title="So sánh dòng tiền chiết khấu lũy kế" if discounted else "So sánh dòng tiền lũy kế",
+            xaxis_title="Năm",
+            yaxis_title="VNĐ",
+            hovermode='x unified',
+            height=450,
+            legend=dict(x=0.01, y=0.99)
+        )
+        return fig
+
+    @staticmethod
+    def create_sobol_chart(sobol_df: pd.DataFrame, metric: str) -> go.Figure:
+        """
+        Biểu đồ cột chỉ số Sobol bậc nhất và toàn phần kèm khoảng tin cậy bootstrap
+
+        Args:
+            sobol_df: Bảng từ to_sobol_dataframe
+            metric: Tên chỉ số (NPV / IRR) cho tiêu đề
+        """
+        fig = go.Figure()
+        for column, name, color in (("S1", "Bậc nhất (S1)", '#0066cc'), ("ST", "Toàn phần (ST)", '#ff9900')):
+            fig.add_trace(go.Bar(
+                x=sobol_df["Chỉ tiêu"],
+                y=sobol_df[column],
+                name=name,
+                marker_color=color,
+                error_y=dict(
+                    type='data',
+                    symmetric=False,
+                    array=sobol_df[f"{column} cao"] - sobol_df[column],
+                    arrayminus=sobol_df[column] - sobol_df[f"{column} thấp"]
+                )
+            ))
+
+        fig.update_layout(
+            title=f"Chỉ số Sobol của {metric}",
+            yaxis_title="Tỷ trọng phương sai",
+            barmode='group',
+            height=400
+        )
+        return fig
+
+    @staticmethod
+    def create_real_options_chart(volatilities: Sequence[float], result: Dict[str, Any],
+                                  labels: Dict[str, str]) -> go.Figure:
+        """
+        Giá trị từng quyền chọn thực theo giả định độ biến động
+
+        Args:
+            volatilities: Các mức độ biến động (%)
+            result: Kết quả RealOptionValuator.analyze_project ("<loại>_value" theo từng mức)
+            labels: Loại quyền chọn -> tên hiển thị
+        """
+        fig = go.Figure()
+        for option, label in labels.items():
+            fig.add_trace(go.Scatter(
+                x=list(volatilities),
+                y=result[f"{option}_value"],
+                mode='lines+markers',
+                name=label
+            ))
+
+        fig.update_layout(
+            title="Giá trị quyền chọn thực theo độ biến động",
+            xaxis_title="Độ biến động giá trị dự án (%/năm)",
+            yaxis_title="VNĐ",
+            hovermode='x unified',
+            height=400
+        )
+        return fig
+
+    @staticmethod
+    def create_distribution_chart(values: np.ndarray, title: str, xaxis_title: str,
+                                  reference: Optional[float] = None) -> go.Figure:
+        """
+        Histogram phân phối một chỉ số mô phỏng, đánh dấu mốc 0 và giá trị theo kịch bản dự kiến
+
+        Args:
+            values: Giá trị theo từng đường (NaN bị bỏ qua)
+            title: Tiêu đề biểu đồ
+            xaxis_title: Tên trục hoành
+            reference: Giá trị theo kịch bản dự kiến (nếu có)
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        fig = go.Figure(go.Histogram(x=values, nbinsx=60, marker_color='steelblue', opacity=0.8, name='Số đường'))
+        fig.add_vline(x=0, line_dash="dot", line_color="red")
+        if reference is not None and np.isfinite(reference):
+            fig.add_vline(x=reference, line_dash="dash", line_color="green", annotation_text="Kịch bản dự kiến")
+        fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title="Số đường", height=400, bargap=0.02)
+        return fig
+
+    @staticmethod
+    def create_horizon_chart(result: Dict[str, Any]) -> go.Figure:
+        """
+        NPV theo năm dừng dự án, đánh dấu dòng đời kế hoạch và năm dừng tối ưu
+
+        Args:
+            result: Kết quả HorizonAnalyzer.analyze_project
+        """
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=list(result["horizons"]),
+            y=list(result["npv"]),
+            mode='lines+markers',
+            name='NPV nếu dừng ở năm',
+            line=dict(color='steelblue', width=2)
+        ))
+        fig.add_trace(go.Scatter(
+            x=[result["optimal"]],
+            y=[result["optimal_npv"]],
+            mode='markers',
+            name='Năm dừng tối ưu',
+            marker=dict(color='green', size=14, symbol='star')
+        ))
+        fig.add_vline(x=result["planned"], line_dash="dash", line_color="gray",
+                      annotation_text="Dòng đời kế hoạch")
+        fig.add_hline(y=0, line_dash="dot", line_color="red")
+
+        fig.update_layout(
+            title="NPV theo năm dừng dự án",
+            xaxis_title="Năm dừng",
+            yaxis_title="NPV (VNĐ)",
+            hovermode='x unified',
+            height=400
+        )
+        return fig
+
+    @staticmethod
+    def create_revenue_cost_chart(cash_flow_df: pd.DataFrame,
+                                  breakeven: Optional[Dict[str, Optional[float]]] = None) -> go.Figure:
+        """
+        Tạo biểu đồ so sánh doanh thu, chi phí & lợi nhuận
+
+        Args:
+            cash_flow_df: DataFrame bảng dòng tiền
+            breakeven: Giá trị hòa vốn (NPV = 0) từ GoalSeeker.breakeven_points; nếu có thì
+                vẽ đường doanh thu hòa vốn và chi phí tối đa
+        """
         fig = go.Figure()
 
         fig.add_trace(go.Bar(
@@ -111,6 +524,20 @@ class ProjectVisualizer:
             marker=dict(size=10)
         ))
 
+        breakeven = breakeven or {}
+        for field, label, color in (
+            ('doanh_thu_nam', "Doanh thu hòa vốn (NPV = 0)", 'steelblue'),
+            ('chi_phi_nam', "Chi phí tối đa (NPV = 0)", 'firebrick'),
+        ):
+            if breakeven.get(field) is not None:
+                fig.add_hline(
+                    y=breakeven[field],
+                    line_dash="dash",
+                    line_color=color,
+                    annotation_text=f"{label}: {breakeven[field]:,.0f}",
+                    annotation_position="top left"
+                )
+
         fig.update_layout(
             title="Phân tích Doanh thu - Chi phí - Lợi nhuận",
             xaxis_title="Năm",
@@ -189,11 +616,18 @@ class ProjectVisualizer:
         return fig
 
     @staticmethod
-    def create_financial_structure_pie(project_data: Dict[str, Any]) -> go.Figure:
+    def create_financial_structure_pie(project_data: Dict[str, Any],
+                                       cash_flow_df: Optional[pd.DataFrame] = None) -> go.Figure:
         """Tạo biểu đồ phân bổ vốn (Pie chart)"""
-        investment = float(project_data.get('von_dau_tu', 0))
-        total_revenue = float(project_data.get('doanh_thu_nam', 0)) * int(project_data.get('dong_doi_du_an', 0))
-        total_costs = float(project_data.get('chi_phi_nam', 0)) * int(project_data.get('dong_doi_du_an', 0))
+        if cash_flow_df is not None and 'Đầu tư' in cash_flow_df:
+            # Tổng theo bảng dòng tiền (đúng cả khi số liệu thay đổi theo năm)
+            investment = float(cash_flow_df['Đầu tư'].sum())
+            total_revenue = float(cash_flow_df['Doanh thu'].sum())
+            total_costs = float(cash_flow_df['Chi phí'].sum())
+        else:
+            investment = float(project_data.get('von_dau_tu', 0))
+            total_revenue = float(project_data.get('doanh_thu_nam', 0)) * int(project_data.get('dong_doi_du_an', 0))
+            total_costs = float(project_data.get('chi_phi_nam', 0)) * int(project_data.get('dong_doi_du_an', 0))
         profit = total_revenue - total_costs - investment
 
         fig = go.Figure(data=[go.Pie(
@@ -216,41 +650,64 @@ class ProjectVisualizer:
 
         return fig
 
+    @staticmethod
+    def build_all_figures(cash_flow_df: pd.DataFrame, metrics: Dict[str, Any], project_data: Dict[str, Any]) -> Dict[str, go.Figure]:
+        """Dựng toàn bộ biểu đồ của một kết quả tính toán"""
+        return {
+            "cash_flow": ProjectVisualizer.create_cash_flow_chart(cash_flow_df),
+            "cumulative": ProjectVisualizer.create_cumulative_cash_flow_chart(cash_flow_df),
+            "revenue_cost": ProjectVisualizer.create_revenue_cost_chart(
+                cash_flow_df, GoalSeeker.breakeven_points(project_data, ("doanh_thu_nam", "chi_phi_nam"))
+            ),
+            "npv_gauge": ProjectVisualizer.create_npv_gauge(metrics),
+            "irr_wacc": ProjectVisualizer.create_irr_wacc_comparison(metrics, project_data),
+            "structure": ProjectVisualizer.create_financial_structure_pie(project_data, cash_flow_df),
+        }
+
+    @staticmethod
+    def get_figures(cash_flow_df: pd.DataFrame, metrics: Dict[str, Any], project_data: Dict[str, Any]) -> Dict[str, Tuple[go.Figure, str]]:
+        """
+        Lấy bộ biểu đồ từ cache (dựng một lần cho mỗi kết quả tính toán khác nhau)
+
+        Returns:
+            Dictionary tên biểu đồ -> (Figure, JSON của figure)
+        """
+        key = FigureCache.make_key(cash_flow_df, metrics, project_data)
+        return get_figure_cache().get_or_build(
+            key,
+            lambda: ProjectVisualizer.build_all_figures(cash_flow_df, metrics, project_data)
+        )
+
     @staticmethod
     def render_all_visualizations(cash_flow_df: pd.DataFrame, metrics: Dict[str, Any], project_data: Dict[str, Any]):
         """Render tất cả các biểu đồ"""
+        figures = ProjectVisualizer.get_figures(cash_flow_df, metrics, project_data)
 
         st.markdown("---")
         st.subheader("📊 Trực Quan Hóa Dữ Liệu Dự Án")
 
         # 1. Biểu đồ dòng tiền thuần
         st.markdown("#### 📊 Biểu đồ Dòng Tiền Thuần theo Năm")
-        fig_cashflow = ProjectVisualizer.create_cash_flow_chart(cash_flow_df)
-        st.plotly_chart(fig_cashflow, use_container_width=True)
+        st.plotly_chart(figures["cash_flow"][0], use_container_width=True)
 
         # 2. Biểu đồ dòng tiền lũy kế
         st.markdown("#### 💰 Biểu đồ Dòng Tiền Lũy Kế & Thời Điểm Hoàn Vốn")
-        fig_cumulative = ProjectVisualizer.create_cumulative_cash_flow_chart(cash_flow_df)
-        st.plotly_chart(fig_cumulative, use_container_width=True)
+        st.plotly_chart(figures["cumulative"][0], use_container_width=True)
 
         # 3. So sánh doanh thu & chi phí
         st.markdown("#### 📈 So Sánh Doanh Thu, Chi Phí & Lợi Nhuận")
-        fig_revenue = ProjectVisualizer.create_revenue_cost_chart(cash_flow_df)
-        st.plotly_chart(fig_revenue, use_container_width=True)
+        st.plotly_chart(figures["revenue_cost"][0], use_container_width=True)
 
         # 4. Dashboard chỉ số tài chính
         st.markdown("#### 🎯 Dashboard Chỉ Số Tài Chính")
         col1, col2 = st.columns(2)
 
         with col1:
-            fig_npv = ProjectVisualizer.create_npv_gauge(metrics)
-            st.plotly_chart(fig_npv, use_container_width=True)
+            st.plotly_chart(figures["npv_gauge"][0], use_container_width=True)
 
         with col2:
-            fig_irr = ProjectVisualizer.create_irr_wacc_comparison(metrics, project_data)
-            st.plotly_chart(fig_irr, use_container_width=True)
+            st.plotly_chart(figures["irr_wacc"][0], use_container_width=True)
 
         # 5. Cấu trúc tài chính
         st.markdown("#### 💼 Cấu Trúc Tài Chính Dự Án")
-        fig_structure = ProjectVisualizer.create_financial_structure_pie(project_data)
-        st.plotly_chart(fig_structure, use_container_width=True)
+        st.plotly_chart(figures["structure"][0], use_container_width=True)